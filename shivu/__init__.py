@@ -4,11 +4,10 @@ from pyrogram import Client
 from telegram.ext import Application
 from motor.motor_asyncio import AsyncIOMotorClient
 
-logging.basicConfig(
-    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
-    handlers=[logging.FileHandler("log.txt"), logging.StreamHandler()],
-    level=logging.INFO,
-)
+from shivu.logs import setup_logging
+
+# JSON lines to a rotated log.txt and text to the console, written by a background thread
+setup_logging(logging.INFO)
 
 logging.getLogger("apscheduler").setLevel(logging.ERROR)
 logging.getLogger('httpx').setLevel(logging.WARNING)
@@ -16,6 +15,7 @@ logging.getLogger("pyrate_limiter").setLevel(logging.ERROR)
 LOGGER = logging.getLogger(__name__)
 
 from shivu.config import Development as Config
+from shivu.metrics import mongo_listener
 
 
 api_id = Config.api_id
@@ -35,7 +35,8 @@ LEAVELOGS = "-1003129952280"
 
 application = Application.builder().token(TOKEN).build()
 shivuu = Client("Shivu", api_id, api_hash, bot_token=TOKEN)
-lol = AsyncIOMotorClient(mongo_url)
+# Credits every Mongo command to the handler that issued it (shivu.metrics)
+lol = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_listener])
 db = lol['Character_catcher']
 set_on_data = db['set_on_data']
 refeer_collection = db['refeer_collection']
@@ -1,5 +1,3 @@
-import shivu.mongodb_patch
-import importlib
 import asyncio
 import random
 import re
@@ -13,24 +11,17 @@ from telegram.error import BadRequest
 
 from shivu import db, shivuu, application, LOGGER
 from shivu.modules import ALL_MODULES
-
-# MongoDB index conflict fix - prevents crashes from duplicate index creation
-from pymongo import collection as pymongo_collection
-from pymongo.errors import OperationFailure
-
-# Monkey-patch to prevent index conflicts from crashing the bot
-_orig_create_index = pymongo_collection.Collection.create_index
-
-def _safe_create_index(self, keys, **kwargs):
-    try:
-        return _orig_create_index(self, keys, **kwargs)
-    except OperationFailure as e:
-        if e.code == 86:  # IndexKeySpecsConflict
-            LOGGER.debug(f"Index already exists on {self.name}, skipping")
-            return None
-        raise
-
-pymongo_collection.Collection.create_index = _safe_create_index
+from shivu.stats_service import bot_stats
+from shivu.startup import startup, setup_startup_handlers
+from shivu.indexes import index_registry, setup_index_handlers
+from shivu.live_render import setup_live_render_handlers
+from shivu.cooldowns import setup_cooldown_handlers
+from shivu.cache import setup_cache_handlers
+from shivu.events import collection_changed
+from shivu.propagation import setup_propagation_handlers
+from shivu.auth import setup_auth_handlers
+from shivu.dispatch import load, setup_dispatch_handlers
+from shivu.perf import setup_perf_handlers
 
 # Small caps conversion function
 def to_small_caps(text):
@@ -85,13 +76,8 @@ group_rarity_collection = None
 get_spawn_settings = None
 get_group_exclusive = None
 
-# Import all modules
-for module_name in ALL_MODULES:
-    try:
-        importlib.import_module("shivu.modules." + module_name)
-        LOGGER.info(f"✅ Module loaded: {module_name}")
-    except Exception as e:
-        LOGGER.error(f"❌ Module failed: {module_name} - {e}")
+# Import all modules (timed; rarely used ones are registered lazily)
+startup.import_all(ALL_MODULES, application)
 
 
 async def is_character_allowed(character, chat_id=None):
@@ -298,7 +284,11 @@ async def message_counter(update: Update, context: CallbackContext) -> None:
             LOGGER.info(f"📊 Chat {chat_id} | Count: {message_counts[chat_id_str]}/{MESSAGE_FREQUENCY} | {sender_type} {user_id} | {msg_content}")
 
             if message_counts[chat_id_str] >= MESSAGE_FREQUENCY:
-                if chat_id_str not in currently_spawning or not currently_spawning[chat_id_str]:
+                if load.shedding:
+                    # Keep the count; the spawn happens on the first message after the lag clears
+                    load.shed += 1
+                    LOGGER.debug(f"⏭️ Overloaded, holding spawn for chat {chat_id}")
+                elif chat_id_str not in currently_spawning or not currently_spawning[chat_id_str]:
                     LOGGER.info(f"🎯 Triggering spawn in chat {chat_id} after {message_counts[chat_id_str]} messages")
                     currently_spawning[chat_id_str] = True
                     message_counts[chat_id_str] = 0
@@ -544,7 +534,9 @@ async def guess(update: Update, context: CallbackContext) -> None:
                     'first_name': update.effective_user.first_name,
                     'characters': [last_characters[chat_id]],
                 })
+                bot_stats.bump("users")
 
+            collection_changed(user_id, [last_characters[chat_id].get('id')])
             await update_grab_task(user_id)
 
             group_user_total = await group_user_totals_collection.find_one({
@@ -601,6 +593,7 @@ async def guess(update: Update, context: CallbackContext) -> None:
                     'group_name': update.effective_chat.title,
                     'count': 1,
                 })
+                bot_stats.bump("groups")
 
             character = last_characters[chat_id]
             keyboard = [[
@@ -665,21 +658,11 @@ async def guess(update: Update, context: CallbackContext) -> None:
         LOGGER.error(traceback.format_exc())
 
 
-async def fix_my_db():
-    """Database indexes cleanup"""
-    try:
-        await collection.drop_index("id_1")
-        await collection.drop_index("characters.id_1")
-        LOGGER.info("✅ Database indexes cleaned up!")
-    except Exception as e:
-        LOGGER.info(f"ℹ️ Index clean-up not required or failed: {e}")
-
-
 async def main():
     """Main async entry point - single event loop for everything"""
     try:
-        # 1. Database cleanup
-        await fix_my_db()
+        # 1. Index reconcile runs with the other deferred startup work
+        startup.defer("index reconcile", index_registry.reconcile)
         
         # 2. Load rarity system
         try:
@@ -710,6 +693,17 @@ async def main():
 
         # 5. Setup PTB handlers
         application.add_handler(CommandHandler(["grab", "g"], guess, block=False))
+        setup_auth_handlers(application)
+        setup_perf_handlers(application)
+        setup_startup_handlers(application)
+        setup_index_handlers(application)
+        setup_live_render_handlers(application)
+        setup_cooldown_handlers(application)
+        setup_cache_handlers(application)
+        setup_propagation_handlers(application)
+        setup_dispatch_handlers(application)
+        # Last in group 0: PTB runs only the first matching handler per group, so
+        # every command has to be registered ahead of this catch-all
         application.add_handler(MessageHandler(filters.ALL, message_counter, block=False))
 
         # 6. Initialize and start PTB application
@@ -719,7 +713,22 @@ async def main():
         
         LOGGER.info("✅ ʏᴏɪᴄʜɪ ʀᴀɴᴅɪ ʙᴏᴛ sᴛᴀʀᴛᴇᴅ")
 
-        # 7. Keep bot running
+        # Warm the in-memory stats so stats commands never count on demand
+        bot_stats.start()
+
+        # Resume a broadcast interrupted by the last restart
+        try:
+            from shivu.modules.broadcast import resume_broadcasts
+            startup.defer("broadcast resume", lambda: resume_broadcasts(application.bot))
+        except Exception as e:
+            LOGGER.warning(f"⚠️ Broadcast resume failed: {e}")
+
+        # 7. Deferred initialisation (indexes, warmups, first loads) runs concurrently;
+        # ready once each has finished its first pass
+        await startup.run_deferred()
+        startup.mark_ready()
+
+        # 8. Keep bot running
         # Loop ko chalta rakhne ke liye
         while True:
             await asyncio.sleep(3600)
@@ -0,0 +1,273 @@
+"""
+One authorization service for roles and bans.
+
+Owner, sudo users (the static `Config.sudo_users` list plus the database
+`sudo_users_collection`) and banned users and groups are loaded into memory
+once at startup, so every check is a set lookup instead of a query.
+
+A row in `sudo_users_collection` carries a role. Only "sudo user" makes
+someone sudo (`is_sudo`); an "uploader" may upload characters (`can_upload`)
+and nothing else. `has_role` is true for either, for the staff lists.
+/addsudo, /sudoremove, /setrole, /ban and /unban go through this service. Each
+one writes the database, updates memory and publishes `auth.changed`, which
+other processes receive over the event relay and use to reload that one
+entry. A full reload every RELOAD_INTERVAL catches edits made to the
+collections by hand.
+
+`blocks()` is what the dispatch guard (shivu.dispatch) checks to drop updates
+from banned users or in banned groups before any handler runs.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from telegram import Update
+from telegram.ext import CallbackContext, CommandHandler
+
+from shivu import (
+    BANNED_USERS,
+    LOGGER,
+    OWNER_ID,
+    banned_groups_collection,
+    global_ban_users_collection,
+    sudo_users,
+    sudo_users_collection,
+)
+from shivu.events import AUTH_CHANGED, auth_changed, bus
+from shivu.metrics import background_task
+from shivu.startup import startup
+
+RELOAD_INTERVAL = 900
+SUDO_ROLE = "sudo user"
+UPLOADER_ROLE = "uploader"
+DEFAULT_ROLE = SUDO_ROLE
+
+
+class AuthService:
+    def __init__(self):
+        self.owner_id = int(OWNER_ID)
+        self.static_sudo: Set[int] = {int(uid) for uid in sudo_users}
+        # user id -> role, from sudo_users_collection
+        self.roles: Dict[int, str] = {}
+        self.banned_users: Set[int] = set()
+        self.banned_chats: Set[int] = set()
+        self.loaded = False
+        self.stats = {"reloads": 0, "refreshes": 0}
+
+    # --- checks (no I/O) ---
+
+    def is_owner(self, user_id) -> bool:
+        return int(user_id) == self.owner_id
+
+    def is_sudo(self, user_id) -> bool:
+        user_id = int(user_id)
+        return user_id == self.owner_id or user_id in self.static_sudo or self.roles.get(user_id) == SUDO_ROLE
+
+    def has_role(self, user_id) -> bool:
+        """Sudo, or any role in the database (uploaders included)."""
+        return self.is_sudo(user_id) or int(user_id) in self.roles
+
+    def can_upload(self, user_id) -> bool:
+        return self.is_sudo(user_id) or self.roles.get(int(user_id)) == UPLOADER_ROLE
+
+    def role(self, user_id) -> Optional[str]:
+        """The database role of a user, None when they have none."""
+        return self.roles.get(int(user_id))
+
+    def is_banned(self, user_id) -> bool:
+        return int(user_id) in self.banned_users
+
+    def is_chat_banned(self, chat_id) -> bool:
+        return int(chat_id) in self.banned_chats
+
+    def blocks(self, user_id: Optional[int], chat_id: Optional[int]) -> bool:
+        """True when an update from this user in this chat must be dropped."""
+        if user_id is not None and user_id in self.banned_users and not self.is_sudo(user_id):
+            return True
+        return chat_id is not None and chat_id in self.banned_chats
+
+    # --- loading ---
+
+    async def reload(self) -> None:
+        roles = {
+            int(doc["id"]): doc.get("role") or DEFAULT_ROLE
+            async for doc in sudo_users_collection.find({}, {"_id": 0, "id": 1, "role": 1})
+            if doc.get("id") is not None
+        }
+        banned = set()
+        for coll in (BANNED_USERS, global_ban_users_collection):
+            async for doc in coll.find({}, {"_id": 0, "user_id": 1}):
+                if doc.get("user_id") is not None:
+                    banned.add(int(doc["user_id"]))
+        chats = {
+            int(doc["chat_id"])
+            async for doc in banned_groups_collection.find({}, {"_id": 0, "chat_id": 1})
+            if doc.get("chat_id") is not None
+        }
+        self.roles, self.banned_users, self.banned_chats = roles, banned, chats
+        self.loaded = True
+        self.stats["reloads"] += 1
+
+    async def refresh_user(self, user_id: int) -> None:
+        doc = await sudo_users_collection.find_one({"id": user_id}, {"_id": 0, "role": 1})
+        if doc is None:
+            self.roles.pop(user_id, None)
+        else:
+            self.roles[user_id] = doc.get("role") or DEFAULT_ROLE
+        banned = (
+            await BANNED_USERS.find_one({"user_id": user_id}, {"_id": 1}) is not None
+            or await global_ban_users_collection.find_one({"user_id": user_id}, {"_id": 1}) is not None
+        )
+        if banned:
+            self.banned_users.add(user_id)
+        else:
+            self.banned_users.discard(user_id)
+        self.stats["refreshes"] += 1
+
+    async def refresh_chat(self, chat_id: int) -> None:
+        if await banned_groups_collection.find_one({"chat_id": chat_id}, {"_id": 1}) is not None:
+            self.banned_chats.add(chat_id)
+        else:
+            self.banned_chats.discard(chat_id)
+        self.stats["refreshes"] += 1
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            try:
+                await self.reload()
+            except Exception as e:
+                LOGGER.error(f"Auth reload failed: {e}")
+
+    async def start(self) -> None:
+        """Load once, so startup is only ready with bans in place, then reload in the background."""
+        await self.reload()
+        LOGGER.info(
+            f"Auth loaded: {len(self.roles)} sudo, {len(self.banned_users)} banned users, "
+            f"{len(self.banned_chats)} banned chats"
+        )
+        background_task(self.run())
+
+    # --- mutations ---
+
+    async def add_sudo(self, user_id: int, username: str, first_name: str, title: str) -> None:
+        await sudo_users_collection.update_one(
+            {"id": user_id},
+            {"$set": {
+                "id": user_id,
+                "username": username,
+                "first_name": first_name,
+                "sudo_title": title,
+                "role": DEFAULT_ROLE,
+                "added_on": datetime.utcnow(),
+            }},
+            upsert=True,
+        )
+        self.roles[user_id] = DEFAULT_ROLE
+        auth_changed(user_id=user_id)
+
+    async def set_role(self, user_id: int, role: str) -> None:
+        result = await sudo_users_collection.update_one({"id": user_id}, {"$set": {"role": role}})
+        if result.matched_count:
+            self.roles[user_id] = role
+        auth_changed(user_id=user_id)
+
+    async def remove_sudo(self, user_id: int) -> None:
+        await sudo_users_collection.delete_one({"id": user_id})
+        self.roles.pop(user_id, None)
+        auth_changed(user_id=user_id)
+
+    async def ban_user(self, user_id: int, by: int, reason: str = "") -> None:
+        await BANNED_USERS.update_one(
+            {"user_id": user_id},
+            {"$set": {"user_id": user_id, "banned_by": by, "reason": reason, "banned_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        self.banned_users.add(user_id)
+        auth_changed(user_id=user_id)
+
+    async def unban_user(self, user_id: int) -> None:
+        await BANNED_USERS.delete_many({"user_id": user_id})
+        await global_ban_users_collection.delete_many({"user_id": user_id})
+        self.banned_users.discard(user_id)
+        auth_changed(user_id=user_id)
+
+    async def ban_chat(self, chat_id: int, by: int, reason: str = "") -> None:
+        await banned_groups_collection.update_one(
+            {"chat_id": chat_id},
+            {"$set": {"chat_id": chat_id, "banned_by": by, "reason": reason, "banned_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        self.banned_chats.add(chat_id)
+        auth_changed(chat_id=chat_id)
+
+    async def unban_chat(self, chat_id: int) -> None:
+        await banned_groups_collection.delete_many({"chat_id": chat_id})
+        self.banned_chats.discard(chat_id)
+        auth_changed(chat_id=chat_id)
+
+
+auth = AuthService()
+startup.defer("auth", auth.start)
+
+
+@bus.subscribe(AUTH_CHANGED)
+async def _on_auth_changed(user_id=None, chat_id=None, **_):
+    if user_id is not None:
+        await auth.refresh_user(int(user_id))
+    if chat_id is not None:
+        await auth.refresh_chat(int(chat_id))
+
+
+def _parse_target(update: Update, context: CallbackContext):
+    """(id, reason) from a reply or from `/cmd <id> [reason]`; negative ids are chats."""
+    msg = update.effective_message
+    if msg.reply_to_message and msg.reply_to_message.from_user:
+        return msg.reply_to_message.from_user.id, " ".join(context.args)
+    if context.args:
+        try:
+            return int(context.args[0]), " ".join(context.args[1:])
+        except ValueError:
+            pass
+    return None, ""
+
+
+async def ban_cmd(update: Update, context: CallbackContext) -> None:
+    user_id = update.effective_user.id
+    if not auth.is_sudo(user_id):
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+    target, reason = _parse_target(update, context)
+    if target is None:
+        await update.message.reply_text("Usage: /ban <user_id|chat_id> [reason], or reply to a user")
+        return
+    if target < 0:
+        await auth.ban_chat(target, user_id, reason)
+        await update.message.reply_text(f"🚫 Chat <code>{target}</code> banned.", parse_mode="HTML")
+        return
+    if auth.is_sudo(target):
+        await update.message.reply_text("❌ Sudo users cannot be banned.")
+        return
+    await auth.ban_user(target, user_id, reason)
+    await update.message.reply_text(f"🚫 User <code>{target}</code> banned.", parse_mode="HTML")
+
+
+async def unban_cmd(update: Update, context: CallbackContext) -> None:
+    if not auth.is_sudo(update.effective_user.id):
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+    target, _ = _parse_target(update, context)
+    if target is None:
+        await update.message.reply_text("Usage: /unban <user_id|chat_id>, or reply to a user")
+        return
+    if target < 0:
+        await auth.unban_chat(target)
+    else:
+        await auth.unban_user(target)
+    await update.message.reply_text(f"✅ <code>{target}</code> unbanned.", parse_mode="HTML")
+
+
+def setup_auth_handlers(application) -> None:
+    application.add_handler(CommandHandler("ban", ban_cmd, block=False))
+    application.add_handler(CommandHandler("unban", unban_cmd, block=False))
@@ -0,0 +1,290 @@
+"""
+Shared in-process caches.
+
+Every cache is size bounded (least recently used entries go first) and may
+give entries a TTL. Entries can carry tags such as "character:<id>" or
+"user:<id>"; `invalidate(tag)` drops every entry with that tag from every
+cache. `get_or_load` runs at most one loader per key at a time, so a burst of
+misses for the same key costs one database query. A load overtaken by an
+invalidation of one of its tags still answers its callers but is not cached.
+`/caches` shows hit, miss and eviction counts per cache.
+
+Tags are dropped automatically when the matching event is published on
+`shivu.events.bus`, so mutation paths never need to know which caches exist.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from telegram import Update
+from telegram.ext import CallbackContext, CommandHandler
+
+from shivu import OWNER_ID, sudo_users
+from shivu.events import (
+    CHARACTER_DELETED, CHARACTER_UPDATED, SETTINGS_CHANGED, USER_COLLECTION_CHANGED, bus
+)
+
+_MISSING = object()
+
+# Search results and other views over the whole catalog
+CATALOG_TAG = "catalog"
+
+
+def character_tag(character_id) -> str:
+    return f"character:{character_id}"
+
+
+def user_tag(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def owners_tag(character_id) -> str:
+    """Owner lists and counts of a character; they change with users' collections."""
+    return f"owners:{character_id}"
+
+
+def settings_tag(key: str, chat_id=None) -> str:
+    return f"settings:{key}" if chat_id is None else f"settings:{key}:{chat_id}"
+
+
+class Cache:
+    def __init__(self, name: str, maxsize: int, ttl: Optional[float] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (value, expires_at or None, tags)
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float], Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # tag -> keys being loaded with it, and the loads an invalidation overtook
+        self._loading: Dict[str, Set[Hashable]] = {}
+        self._overtaken: Set[Hashable] = set()
+        # Card rendering touches its cache from worker threads
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "loads": 0, "coalesced": 0}
+
+    def _drop(self, key: Hashable) -> None:
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires, _ = entry
+        if expires is not None and expires <= time.monotonic():
+            self._drop(key)
+            self.stats["expired"] += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.stats["misses"] += 1
+                return default
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = (), ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, expires, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+                self.stats["evictions"] += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key in self._inflight:
+                self._overtaken.add(key)
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._drop(key)
+            return value
+
+    def invalidate_tag(self, tag: str) -> int:
+        with self._lock:
+            self._overtaken.update(self._loading.get(tag, ()))
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._overtaken.update(self._inflight)
+            self._data.clear()
+            self._tags.clear()
+
+    def _begin_load(self, key: Hashable, tags: Tuple[str, ...]) -> None:
+        with self._lock:
+            self._overtaken.discard(key)
+            for tag in tags:
+                self._loading.setdefault(tag, set()).add(key)
+
+    def _end_load(self, key: Hashable, tags: Tuple[str, ...]) -> bool:
+        """Finish a load; False when the key was invalidated while it ran."""
+        with self._lock:
+            for tag in tags:
+                keys = self._loading.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._loading[tag]
+            if key in self._overtaken:
+                self._overtaken.discard(key)
+                return False
+            return True
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                          tags: Iterable[str] = (), ttl: Optional[float] = None,
+                          cache_none: bool = False) -> Any:
+        """Cached value or the loader's result; concurrent misses share one load."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        tags = tuple(tags)
+        self._inflight[key] = future
+        self._begin_load(key, tags)
+        loading = True
+        try:
+            self.stats["loads"] += 1
+            value = await loader()
+            # A value read before an invalidation of its tags is returned, not kept
+            loading, fresh = False, self._end_load(key, tags)
+            if fresh and (value is not None or cache_none):
+                self.set(key, value, tags, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the exception; nobody else has to retrieve it
+            future.exception()
+            raise
+        finally:
+            if loading:
+                self._end_load(key, tags)
+            self._inflight.pop(key, None)
+
+    # Mapping-style access for code written against cachetools
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._lookup(key) is not _MISSING
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self.set(key, value)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+
+_registry: Dict[str, Cache] = {}
+
+
+def create_cache(name: str, maxsize: int, ttl: Optional[float] = None) -> Cache:
+    """Register a named cache; asking again for the same name returns the same cache."""
+    cache = _registry.get(name)
+    if cache is None:
+        cache = _registry[name] = Cache(name, maxsize, ttl)
+    return cache
+
+
+def invalidate(tag: str) -> int:
+    """Drop every entry carrying `tag` from all caches."""
+    return sum(cache.invalidate_tag(tag) for cache in _registry.values())
+
+
+@bus.subscribe(CHARACTER_UPDATED)
+def _on_character_updated(character_id, **_) -> None:
+    invalidate(character_tag(character_id))
+    invalidate(CATALOG_TAG)
+
+
+@bus.subscribe(CHARACTER_DELETED)
+def _on_character_deleted(character_id, **_) -> None:
+    invalidate(character_tag(character_id))
+    invalidate(owners_tag(character_id))
+    invalidate(CATALOG_TAG)
+
+
+@bus.subscribe(USER_COLLECTION_CHANGED)
+def _on_collection_changed(user_id, character_ids=(), **_) -> None:
+    invalidate(user_tag(user_id))
+    for character_id in character_ids:
+        invalidate(owners_tag(character_id))
+
+
+@bus.subscribe(SETTINGS_CHANGED)
+def _on_settings_changed(key, user_id=None, chat_id=None, **_) -> None:
+    invalidate(settings_tag(key))
+    if chat_id is not None:
+        invalidate(settings_tag(key, chat_id))
+    if user_id is not None:
+        invalidate(user_tag(user_id))
+
+
+def caches() -> Dict[str, Cache]:
+    return dict(_registry)
+
+
+def report() -> str:
+    lines = ["<b>🧠 Caches</b>", "", "<code>name            size   hit%   evict  loads</code>"]
+    for name, cache in sorted(_registry.items()):
+        s = cache.stats
+        lines.append(
+            f"<code>{name[:15]:<15} {len(cache):>5} {cache.hit_rate() * 100:>5.1f}% "
+            f"{s['evictions']:>6} {s['loads']:>6}</code>"
+        )
+    if bus.stats:
+        lines += ["", "<b>📣 Invalidation events</b>"]
+        lines += [f"<code>{n:>7}</code> {event}" for event, n in sorted(bus.stats.items())]
+    return "\n".join(lines)
+
+
+async def cache_report(update: Update, context: CallbackContext) -> None:
+    user_id = str(update.effective_user.id)
+    if user_id != str(OWNER_ID) and user_id not in sudo_users:
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+    await update.message.reply_text(report(), parse_mode="HTML")
+
+
+def setup_cache_handlers(application) -> None:
+    application.add_handler(CommandHandler("caches", cache_report, block=False))
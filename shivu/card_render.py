@@ -0,0 +1,297 @@
+"""
+Claim card renderer.
+
+Everything on a card that only depends on the rarity (gradient, blur,
+brightness, frames, rarity pill, border) is rendered once per rarity and
+kept; a claim copies that background and draws only its own text and streak
+bar. Fonts are loaded once per process. Cards are rendered in a small
+process pool so Pillow work does not compete with the bot for the GIL; if the
+pool cannot be used the same function runs in a thread instead.
+
+Pool workers must not build the bot: this module imports nothing from
+`shivu`, and each worker registers a bare `shivu` package before the first
+task arrives, so importing `shivu.card_render` there skips `shivu/__init__.py`
+(the Telegram, Pyrogram and Mongo clients and the log listener).
+
+`python -m shivu.card_render` prints a cards-per-second benchmark.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+
+LOGGER = logging.getLogger(__name__)
+
+WIDTH, HEIGHT = 900, 650
+BASE_COLOR = "#0a0a1e"
+GRADIENT_TOP = "#0f1629"
+PANEL_COLOR = "#1a1f3a"
+BORDER_WIDTH = 8
+
+STREAK_Y = 290
+STREAK_BAR_WIDTH = 450
+STREAK_BAR_HEIGHT = 50
+STREAK_X = (WIDTH - STREAK_BAR_WIDTH) // 2
+STATS_Y = 380
+STATS_GAP = 45
+
+BOLD_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+REGULAR_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+
+@dataclass(frozen=True)
+class CardSpec:
+    char_id: str
+    name: str
+    anime: str
+    color: str
+    display: str
+    emoji: str
+    streak: int
+    max_streak: int
+    pity: int
+    pity_threshold: int
+    user_name: str
+
+
+def hex_to_rgb(color: str) -> Tuple[int, int, int]:
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def hex_to_rgba(color: str, alpha: int = 255) -> Tuple[int, int, int, int]:
+    return (*hex_to_rgb(color), alpha)
+
+
+@lru_cache(maxsize=1)
+def fonts() -> Tuple[ImageFont.ImageFont, ImageFont.ImageFont, ImageFont.ImageFont]:
+    try:
+        return (
+            ImageFont.truetype(BOLD_FONT, 45),
+            ImageFont.truetype(REGULAR_FONT, 28),
+            ImageFont.truetype(REGULAR_FONT, 22),
+        )
+    except OSError:
+        default = ImageFont.load_default()
+        return default, default, default
+
+
+@lru_cache(maxsize=32)
+def background(color: str, display: str) -> Image.Image:
+    """The rarity-dependent part of a card. Treat the result as read-only."""
+    title_font, text_font, _ = fonts()
+
+    # Vertical gradient from GRADIENT_TOP to the rarity color, 75% over the base
+    top = np.array(hex_to_rgb(GRADIENT_TOP), dtype=np.float32)
+    bottom = np.array(hex_to_rgb(color), dtype=np.float32)
+    steps = (np.arange(HEIGHT, dtype=np.float32) / HEIGHT)[:, None]
+    rows = np.floor(top + (bottom - top) * steps)
+    base = np.array(hex_to_rgb(BASE_COLOR), dtype=np.float32)
+    blended = base * 0.25 + rows * 0.75
+    pixels = np.repeat(blended[:, None, :], WIDTH, axis=1).round().astype(np.uint8)
+
+    img = Image.fromarray(pixels, "RGB")
+    img = img.filter(ImageFilter.GaussianBlur(radius=1.5))
+    img = ImageEnhance.Brightness(img).enhance(1.1)
+    draw = ImageDraw.Draw(img)
+
+    pill_x, pill_y = WIDTH // 2 - 150, 195
+    draw.rounded_rectangle(
+        [(pill_x, pill_y), (pill_x + 300, pill_y + 45)],
+        radius=23, fill=hex_to_rgba(color, 40), outline=color, width=3
+    )
+    draw.text((WIDTH // 2, 217), f"⭐ {display}",
+              fill=color, font=text_font, anchor="mm", stroke_width=1, stroke_fill="white")
+
+    shadow = 4
+    draw.rounded_rectangle(
+        [(STREAK_X + shadow, STREAK_Y + shadow),
+         (STREAK_X + STREAK_BAR_WIDTH + shadow, STREAK_Y + STREAK_BAR_HEIGHT + shadow)],
+        radius=25, fill="#000000"
+    )
+    draw.rounded_rectangle(
+        [(STREAK_X, STREAK_Y), (STREAK_X + STREAK_BAR_WIDTH, STREAK_Y + STREAK_BAR_HEIGHT)],
+        radius=25, fill=PANEL_COLOR, outline=color, width=4
+    )
+
+    for i in range(3):
+        y = STATS_Y + i * STATS_GAP
+        draw.rounded_rectangle(
+            [(WIDTH // 2 - 200, y - 18), (WIDTH // 2 + 200, y + 18)],
+            radius=18, fill=hex_to_rgba(PANEL_COLOR, 150), outline=color, width=2
+        )
+
+    draw.rectangle([(0, 0), (WIDTH, HEIGHT)], outline=color, width=BORDER_WIDTH)
+    for i in range(BORDER_WIDTH):
+        draw.rectangle([(i, i), (WIDTH - i, HEIGHT - i)], outline=hex_to_rgba(color, 100 - i * 12), width=1)
+    return img
+
+
+@lru_cache(maxsize=256)
+def streak_fill(color: str, filled_width: int) -> Tuple[Image.Image, Image.Image]:
+    """Horizontal rarity-to-white gradient for the streak bar and its rounded mask."""
+    height = STREAK_BAR_HEIGHT - 12
+    start = np.array(hex_to_rgb(color), dtype=np.float32)
+    steps = (np.arange(filled_width, dtype=np.float32) / filled_width * 0.3)[:, None]
+    cols = np.floor(start + (255 - start) * steps).astype(np.uint8)
+    fill = Image.fromarray(np.repeat(cols[None, :, :], height, axis=0), "RGB")
+    mask = Image.new("L", (filled_width, height), 0)
+    ImageDraw.Draw(mask).rounded_rectangle([(0, 0), (filled_width, height)], radius=20, fill=255)
+    return fill, mask
+
+
+def render_card(spec: CardSpec) -> bytes:
+    title_font, text_font, small_font = fonts()
+    img = background(spec.color, spec.display).copy()
+    draw = ImageDraw.Draw(img)
+
+    title = f"{spec.emoji} {spec.name}"
+    glow = hex_to_rgba(spec.color)
+    for offset in range(1, 8):
+        draw.text((WIDTH // 2 + offset, 70 + offset), title, fill=glow, font=title_font, anchor="mm")
+    draw.text((WIDTH // 2, 70), title,
+              fill="white", font=title_font, anchor="mm", stroke_width=2, stroke_fill=spec.color)
+    draw.text((WIDTH // 2, 150), f"🎬 {spec.anime}", fill="#e8e8e8", font=text_font, anchor="mm")
+
+    filled = int((min(spec.streak, spec.max_streak) / spec.max_streak) * (STREAK_BAR_WIDTH - 12))
+    if filled > 0:
+        fill, mask = streak_fill(spec.color, filled)
+        img.paste(fill, (STREAK_X + 6, STREAK_Y + 6), mask)
+
+    streak_text = f"🔥 Streak: {spec.streak}"
+    if spec.streak > spec.max_streak:
+        streak_text += " 👑"
+    draw.text((WIDTH // 2, STREAK_Y + 25), streak_text,
+              fill="white", font=text_font, anchor="mm", stroke_width=2, stroke_fill="#000000")
+
+    multiplier = min(spec.streak, 10) * 0.5 + 1
+    stats = (
+        f"⚡ Multiplier: {multiplier:.1f}x",
+        f"🎯 Pity: {spec.pity}/{spec.pity_threshold}",
+        f"🏆 ID: {spec.char_id}",
+    )
+    for i, stat in enumerate(stats):
+        draw.text((WIDTH // 2, STATS_Y + i * STATS_GAP), stat, fill="#ffffff", font=small_font, anchor="mm")
+
+    draw.text((WIDTH // 2, 550), f"👤 Claimed by: {spec.user_name}", fill="#b8b8b8", font=text_font, anchor="mm")
+
+    # Telegram re-encodes photos as JPEG anyway; PNG encoding was most of the render time
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+# Run with exec() as the pool initializer; a shivu function would import the package to unpickle
+_WORKER_BOOTSTRAP = f"""
+import sys, types
+if "shivu" not in sys.modules:
+    package = types.ModuleType("shivu")
+    package.__path__ = [{os.path.dirname(os.path.abspath(__file__))!r}]
+    sys.modules["shivu"] = package
+import shivu.card_render
+shivu.card_render.fonts()
+"""
+
+
+class CardRenderer:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self.stats = {"rendered": 0, "fallback": 0, "seconds": 0.0}
+
+    def _process_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self._pool is None:
+            try:
+                # spawn: the bot process has threads, which fork does not copy safely
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=exec,
+                    initargs=(_WORKER_BOOTSTRAP,),
+                )
+            except (OSError, NotImplementedError) as e:
+                LOGGER.warning(f"Card process pool unavailable, rendering in threads: {e}")
+                self._pool = None
+        return self._pool
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=2, thread_name_prefix="card")
+        return self._threads
+
+    async def render(self, spec: CardSpec) -> io.BytesIO:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        pool = self._process_pool()
+        try:
+            if pool is None:
+                raise BrokenProcessPool("no process pool")
+            data = await loop.run_in_executor(pool, render_card, spec)
+        except BrokenProcessPool:
+            self._pool = None
+            self.stats["fallback"] += 1
+            data = await loop.run_in_executor(self._thread_pool(), render_card, spec)
+        self.stats["rendered"] += 1
+        self.stats["seconds"] += time.perf_counter() - started
+        return io.BytesIO(data)
+
+    def shutdown(self) -> None:
+        for pool in (self._pool, self._threads):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+def benchmark(cards: int = 200, workers: int = 4) -> None:
+    """Print cards per second for the old per-call work, cached backgrounds and the process pool."""
+    colors = ("#FF1493", "#9370DB", "#FFD700", "#00FFFF", "#32CD32")
+    specs = [
+        CardSpec(str(i), f"Character {i}", "Some Anime", colors[i % len(colors)], "🟡 Legendary", "🟡",
+                 i % 9, 7, i % 25, 25, f"user{i}")
+        for i in range(cards)
+    ]
+
+    def run(label, fn):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<32} {cards / elapsed:8.1f} cards/s")
+
+    def uncached():
+        for spec in specs:
+            background.cache_clear()
+            fonts.cache_clear()
+            render_card(spec)
+
+    def cached():
+        for spec in specs:
+            render_card(spec)
+
+    def pooled():
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=exec, initargs=(_WORKER_BOOTSTRAP,)) as pool:
+            list(pool.map(render_card, specs[:workers]))  # start and warm the workers
+            start = time.perf_counter()
+            list(pool.map(render_card, specs, chunksize=4))
+            return time.perf_counter() - start
+
+    run("no caches", uncached)
+    cached()
+    run("cached backgrounds, 1 process", cached)
+    elapsed = pooled()
+    print(f"{f'cached backgrounds, {workers} processes':<32} {cards / elapsed:8.1f} cards/s")
+
+
+if __name__ == "__main__":
+    benchmark()
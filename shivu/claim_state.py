@@ -0,0 +1,121 @@
+"""
+Per-user claim state: pity counter, daily-claim streak and reward streak.
+
+The state lives in `claim_state`, one small document per user keyed by the
+user id, instead of fields scattered over the user document. Entries are
+kept in memory once read, for displays. The pity decision never uses that
+copy: each claim is one `$inc` returning the new count, and the reset past
+the threshold is a `$set` conditional on that count, so with several
+processes exactly one claim gets the pity reward.
+
+Claims go through `compare_and_set`, which applies a change only if the
+last-claim value is still the one that was read. Two processes, or two taps
+on the same button, cannot both claim the same day.
+
+Users without a state document are seeded from the legacy fields on their
+user document the first time they are read.
+"""
+
+from typing import Any, Dict
+
+from pymongo import ReturnDocument
+
+from shivu import db, user_collection
+from shivu.cache import create_cache
+
+state_collection = db["claim_state"]
+
+DEFAULT_STATE = {
+    "pity": 0,
+    "streak": 0,
+    "last_claim": None,
+    "reward_streak": 0,
+    "reward_longest": 0,
+    "reward_last": None,
+}
+
+
+class ClaimStateStore:
+    def __init__(self):
+        self._cache = create_cache("claim_state", maxsize=20000, ttl=3600)
+        self.stats = {"loads": 0, "seeded": 0, "conflicts": 0}
+
+    async def _load(self, user_id: int) -> Dict[str, Any]:
+        self.stats["loads"] += 1
+        doc = await state_collection.find_one({"_id": user_id})
+        if doc is None:
+            doc = await self._seed(user_id)
+        return {**DEFAULT_STATE, **doc}
+
+    async def _seed(self, user_id: int) -> Dict[str, Any]:
+        legacy = await user_collection.find_one(
+            {"id": user_id}, {"_id": 0, "claim_streak": 1, "last_daily_claim": 1, "streak_data": 1}
+        ) or {}
+        rewards = legacy.get("streak_data") or {}
+        seed = {
+            **DEFAULT_STATE,
+            "streak": legacy.get("claim_streak", 0),
+            "last_claim": legacy.get("last_daily_claim"),
+            "reward_streak": rewards.get("current", 0),
+            "reward_longest": rewards.get("longest", 0),
+            "reward_last": rewards.get("last_claim"),
+        }
+        self.stats["seeded"] += 1
+        # Another process may seed the same user at the same moment; keep whichever landed first
+        return await state_collection.find_one_and_update(
+            {"_id": user_id}, {"$setOnInsert": seed}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+
+    async def get(self, user_id: int) -> Dict[str, Any]:
+        state = await self._cache.get_or_load(user_id, lambda: self._load(user_id))
+        return dict(state)
+
+    async def compare_and_set(self, user_id: int, expected: Dict[str, Any], changes: Dict[str, Any]) -> bool:
+        """Apply `changes` only if the stored fields still equal `expected`."""
+        await self.get(user_id)
+        doc = await state_collection.find_one_and_update(
+            {"_id": user_id, **expected}, {"$set": changes}, return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            self.stats["conflicts"] += 1
+            self._cache.pop(user_id)
+            return False
+        state = self._cache.get(user_id)
+        if state is not None:
+            state.update(changes)
+        return True
+
+    async def set(self, user_id: int, changes: Dict[str, Any]) -> None:
+        await state_collection.update_one({"_id": user_id}, {"$set": changes}, upsert=True)
+        self._cache.pop(user_id)
+
+    async def bump_pity(self, user_id: int, threshold: int) -> bool:
+        """Count one claim towards pity; True (and a reset) once the threshold is reached."""
+        await self.get(user_id)
+        doc = await state_collection.find_one_and_update(
+            {"_id": user_id}, {"$inc": {"pity": 1}},
+            projection={"pity": 1}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        pity = doc["pity"]
+        triggered = False
+        if pity > threshold:
+            # Of several claims past the threshold, only the one whose count is still stored resets it
+            reset = await state_collection.update_one({"_id": user_id, "pity": pity}, {"$set": {"pity": 0}})
+            triggered = reset.modified_count == 1
+            if triggered:
+                pity = 0
+        self._show_pity(user_id, pity)
+        return triggered
+
+    async def reset_pity(self, user_id: int) -> None:
+        await state_collection.update_one({"_id": user_id}, {"$set": {"pity": 0}}, upsert=True)
+        self._show_pity(user_id, 0)
+
+    def _show_pity(self, user_id: int, pity: int) -> None:
+        """Keep the cached copy that progress displays read close to the stored counter."""
+        state = self._cache.get(user_id)
+        if state is not None:
+            state["pity"] = pity
+
+
+claim_state = ClaimStateStore()
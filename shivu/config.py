@@ -14,6 +14,10 @@ class Config(object):
     CHARA_CHANNEL_ID = "-1003154253941"
     api_id = "21705508"
     api_hash = "1d590f4c3d2029a7ef7df087707d7441"
+    # Share cache invalidations between bot processes (needs a replica set)
+    EVENT_RELAY = False
+    # Prometheus metrics on http://127.0.0.1:<port>/metrics; 0 disables
+    METRICS_PORT = 9464
 
     
 class Production(Config):
@@ -0,0 +1,220 @@
+"""
+One in-memory cooldown service for every command.
+
+Entries are keyed by (scope, user, chat) and kept in a dict with a min-heap of
+expiry times next to it, so expired entries are dropped as time passes instead
+of piling up forever. Cooldowns at least PERSIST_AFTER seconds long are also
+written behind to Mongo in batches and reloaded at startup, so a restart does
+not hand out free raids or proposals. Short ones stay memory-only.
+"""
+
+import asyncio
+import heapq
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from pymongo import DeleteOne, UpdateOne
+from telegram import Update
+from telegram.ext import CallbackContext, CommandHandler
+
+from shivu import LOGGER, OWNER_ID, db, sudo_users
+from shivu.indexes import index_registry
+from shivu.metrics import background_task
+from shivu.startup import startup
+
+PERSIST_AFTER = 300
+FLUSH_INTERVAL = 5
+
+CooldownKey = Tuple[str, int, Optional[int]]
+
+cooldown_collection = db["cooldowns"]
+index_registry.declare("cooldowns", [("expires_at", 1)], expire_after_seconds=0)
+
+
+class CooldownService:
+    def __init__(self):
+        self._expiry: Dict[CooldownKey, float] = {}
+        self._heap: List[Tuple[float, CooldownKey]] = []
+        self._windows: Dict[CooldownKey, Tuple[float, Deque[float]]] = {}
+        self._dirty: Dict[CooldownKey, float] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self.stats = {"blocked": 0, "allowed": 0, "expired": 0, "persisted": 0}
+
+    @staticmethod
+    def key(scope: str, user_id: int, chat_id: Optional[int] = None) -> CooldownKey:
+        return (scope, int(user_id), int(chat_id) if chat_id is not None else None)
+
+    def _purge(self, now: float) -> None:
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires, key = heapq.heappop(heap)
+            # Stale heap entries (cooldown was extended or reset) are skipped
+            if self._expiry.get(key) == expires:
+                del self._expiry[key]
+                self.stats["expired"] += 1
+            window = self._windows.get(key)
+            if window is not None:
+                length, calls = window
+                if not calls or calls[-1] + length <= now:
+                    del self._windows[key]
+
+    def remaining(self, scope: str, user_id: int, chat_id: Optional[int] = None) -> float:
+        now = time.time()
+        self._purge(now)
+        expires = self._expiry.get(self.key(scope, user_id, chat_id))
+        return max(0.0, expires - now) if expires else 0.0
+
+    def start(self, scope: str, user_id: int, seconds: float, chat_id: Optional[int] = None) -> None:
+        key = self.key(scope, user_id, chat_id)
+        expires = time.time() + seconds
+        self._expiry[key] = expires
+        heapq.heappush(self._heap, (expires, key))
+        if seconds >= PERSIST_AFTER:
+            self._dirty[key] = expires
+            self._ensure_flusher()
+
+    def try_acquire(self, scope: str, user_id: int, seconds: float, chat_id: Optional[int] = None) -> float:
+        """Start the cooldown if it is not running. Returns 0 on success, else the seconds left."""
+        left = self.remaining(scope, user_id, chat_id)
+        if left > 0:
+            self.stats["blocked"] += 1
+            return left
+        self.stats["allowed"] += 1
+        self.start(scope, user_id, seconds, chat_id)
+        return 0.0
+
+    def reset(self, scope: str, user_id: int, chat_id: Optional[int] = None) -> None:
+        key = self.key(scope, user_id, chat_id)
+        self._windows.pop(key, None)
+        if self._expiry.pop(key, None) is not None:
+            self._dirty[key] = 0.0
+            self._ensure_flusher()
+
+    def hit(self, scope: str, user_id: int, limit: int, window: float, chat_id: Optional[int] = None) -> float:
+        """Sliding window: allow `limit` calls per `window` seconds. Returns 0 or the seconds to wait."""
+        now = time.time()
+        self._purge(now)
+        key = self.key(scope, user_id, chat_id)
+        calls = self._windows.setdefault(key, (window, deque(maxlen=limit)))[1]
+        while calls and calls[0] <= now - window:
+            calls.popleft()
+        if len(calls) >= limit:
+            self.stats["blocked"] += 1
+            return calls[0] + window - now
+        self.stats["allowed"] += 1
+        calls.append(now)
+        heapq.heappush(self._heap, (now + window, key))
+        return 0.0
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            try:
+                self._flusher = background_task(self._flush_loop())
+            except RuntimeError:
+                pass  # no loop yet; load() starts it once the bot runs
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        ops = []
+        for (scope, user_id, chat_id), expires in dirty.items():
+            _id = f"{scope}:{user_id}:{chat_id}"
+            if expires:
+                ops.append(UpdateOne(
+                    {"_id": _id},
+                    {"$set": {"scope": scope, "user_id": user_id, "chat_id": chat_id,
+                              "expires": expires, "expires_at": datetime.utcfromtimestamp(expires)}},
+                    upsert=True
+                ))
+            else:
+                ops.append(DeleteOne({"_id": _id}))
+        try:
+            await cooldown_collection.bulk_write(ops, ordered=False)
+            self.stats["persisted"] += len(ops)
+        except Exception as e:
+            LOGGER.error(f"Cooldown flush failed: {e}")
+            for key, expires in dirty.items():
+                self._dirty.setdefault(key, expires)
+
+    async def _flush_loop(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    async def load(self) -> None:
+        # The TTL monitor only runs once a minute, so filter out stale entries here
+        async for doc in cooldown_collection.find({"expires": {"$gt": time.time()}}):
+            key = self.key(doc["scope"], doc["user_id"], doc.get("chat_id"))
+            if doc["expires"] <= self._expiry.get(key, 0):
+                continue
+            self._expiry[key] = doc["expires"]
+            heapq.heappush(self._heap, (doc["expires"], key))
+        self._ensure_flusher()
+
+    def memory_bytes(self) -> int:
+        size = sys.getsizeof(self._expiry) + sys.getsizeof(self._heap) + sys.getsizeof(self._windows)
+        size += sum(sys.getsizeof(key) for key in self._expiry)
+        size += sum(sys.getsizeof(calls) for _, calls in self._windows.values())
+        return size
+
+    def report(self) -> str:
+        s = self.stats
+        scopes: Dict[str, int] = {}
+        for scope, _, _ in self._expiry:
+            scopes[scope] = scopes.get(scope, 0) + 1
+        lines = [
+            "<b>⏳ Cooldowns</b>", "",
+            f"Active: <code>{len(self._expiry)}</code> · windows: <code>{len(self._windows)}</code>",
+            f"Memory: <code>{self.memory_bytes() / 1024:.1f} KiB</code>",
+            f"Blocked: <code>{s['blocked']}</code> · allowed: <code>{s['allowed']}</code>",
+            f"Expired: <code>{s['expired']}</code> · persisted: <code>{s['persisted']}</code>",
+        ]
+        if scopes:
+            lines += ["", *(f"<code>{n:>6}</code> {scope}" for scope, n in sorted(scopes.items()))]
+        return "\n".join(lines)
+
+
+cooldowns = CooldownService()
+startup.defer("cooldown restore", cooldowns.load)
+
+
+def format_wait(seconds: float) -> str:
+    seconds = int(seconds + 0.999)
+    return f"{seconds // 60}m {seconds % 60}s" if seconds >= 60 else f"{seconds}s"
+
+
+def cooldown(scope: str, seconds: float, per_chat: bool = False,
+             message: str = "⏳ Wait {wait} before using this again.") -> Callable:
+    """Handler decorator: reply with `message` while the user's cooldown runs, otherwise start it."""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(update: Update, context: CallbackContext, *args, **kwargs):
+            user = update.effective_user
+            if user is None:
+                return await func(update, context, *args, **kwargs)
+            chat_id = update.effective_chat.id if per_chat and update.effective_chat else None
+            left = cooldowns.try_acquire(scope, user.id, seconds, chat_id)
+            if left:
+                if update.effective_message:
+                    await update.effective_message.reply_text(message.format(wait=format_wait(left)))
+                return
+            return await func(update, context, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def cooldown_report(update: Update, context: CallbackContext) -> None:
+    user_id = str(update.effective_user.id)
+    if user_id != str(OWNER_ID) and user_id not in sudo_users:
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+    await update.message.reply_text(cooldowns.report(), parse_mode="HTML")
+
+
+def setup_cooldown_handlers(application) -> None:
+    application.add_handler(CommandHandler("cooldowns", cooldown_report, block=False))
@@ -0,0 +1,279 @@
+"""
+Pre-dispatch middleware for both update sources.
+
+The PTB `application` and the Pyrogram `shivuu` client each get a guard
+handler in group -20. It runs before the lazy-module placeholders (-10) and
+every real handler, and it drops an update when:
+
+- the sender or the chat is banned (sets held by `shivu.auth`)
+- the sender's token bucket is empty (a flood from one user, across chats)
+- the chat's token bucket is empty (a whole group flooding the bot)
+
+Owner and sudo users are never dropped. Inline queries arrive once per
+keystroke and results page, so they are only checked for bans. A callback
+query dropped for flooding is answered with a short "slow down" so the
+button does not keep spinning. Both clients receive their own copy of every
+update, so each guard keeps its own buckets and a message is charged only
+once per client.
+
+The load monitor measures event loop lag (how late a 0.5 s sleep wakes up)
+and how old updates are when they arrive. While either is over its
+threshold, `load.shedding` is True. Cheap work still runs, but optional work
+steps aside. For example, the group message counter keeps counting but holds
+spawns until the lag recovers.
+
+Every coroutine handler callback on both clients is wrapped by
+`shivu.metrics` so that its run time and Mongo commands are recorded under
+`module.function`. Handlers registered later, such as lazily imported
+modules, are picked up on the next monitor tick. /dispatch shows the
+verdict counts and the current lag.
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from pyrogram import StopPropagation
+from pyrogram import filters as pyro_filters
+from pyrogram.handlers import CallbackQueryHandler as PyroCallbackQueryHandler
+from pyrogram.handlers import MessageHandler as PyroMessageHandler
+from pyrogram.types import CallbackQuery
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, BaseHandler, CallbackContext, CommandHandler
+
+from shivu import LOGGER, shivuu
+from shivu.auth import auth
+from shivu.metrics import add_collector, background_task, handler_metrics
+from shivu.ratelimit import KeyedTokenBucket
+from shivu.startup import startup
+
+GUARD_GROUP = -20
+
+# Per user across all chats: a steady message a second, bursts of 8
+USER_RATE = 1.0
+USER_BURST = 8.0
+# Per chat: 10 updates a second, bursts of 40
+CHAT_RATE = 10.0
+CHAT_BURST = 40.0
+
+LAG_PROBE_INTERVAL = 0.5
+LOOP_LAG_THRESHOLD = 0.5
+UPDATE_AGE_THRESHOLD = 5.0
+# Weight of the newest sample in the moving averages
+LAG_SMOOTHING = 0.2
+
+ALLOW = "allowed"
+BANNED = "banned"
+USER_FLOOD = "user_flood"
+CHAT_FLOOD = "chat_flood"
+
+SLOW_DOWN = "⏳ sʟᴏᴡ ᴅᴏᴡɴ, ᴛʀʏ ᴀɢᴀɪɴ ɪɴ ᴀ ᴍᴏᴍᴇɴᴛ"
+
+
+class LoadMonitor:
+    def __init__(self):
+        self.loop_lag = 0.0
+        self.update_age = 0.0
+        self.shed = 0
+        self._task: Optional[asyncio.Task] = None
+        self._on_tick: list = []
+
+    @property
+    def shedding(self) -> bool:
+        return self.loop_lag > LOOP_LAG_THRESHOLD or self.update_age > UPDATE_AGE_THRESHOLD
+
+    def record_update_age(self, sent: Optional[datetime]) -> None:
+        if sent is None:
+            return
+        if sent.tzinfo is None:
+            sent = sent.replace(tzinfo=timezone.utc)
+        age = max(0.0, datetime.now(timezone.utc).timestamp() - sent.timestamp())
+        self.update_age += (age - self.update_age) * LAG_SMOOTHING
+
+    def on_tick(self, func: Callable[[], None]) -> None:
+        self._on_tick.append(func)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            lag = max(0.0, loop.time() - start - LAG_PROBE_INTERVAL)
+            self.loop_lag += (lag - self.loop_lag) * LAG_SMOOTHING
+            # Arrival times only refresh on new updates; let a quiet period decay them
+            self.update_age *= 1 - LAG_SMOOTHING
+            for func in self._on_tick:
+                try:
+                    func()
+                except Exception as e:
+                    LOGGER.error(f"Load monitor tick failed: {e}")
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = background_task(self.run())
+
+
+class UpdateGuard:
+    """Ban and flood checks for one update source."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.users = KeyedTokenBucket(USER_RATE, USER_BURST, max_keys=50000)
+        self.chats = KeyedTokenBucket(CHAT_RATE, CHAT_BURST, max_keys=20000)
+        self.verdicts: Dict[str, int] = defaultdict(int)
+
+    def check(self, user_id: Optional[int], chat_id: Optional[int], rate_limited: bool = True) -> str:
+        verdict = self._verdict(user_id, chat_id, rate_limited)
+        self.verdicts[verdict] += 1
+        return verdict
+
+    def _verdict(self, user_id: Optional[int], chat_id: Optional[int], rate_limited: bool) -> str:
+        if auth.blocks(user_id, chat_id):
+            return BANNED
+        if not rate_limited or (user_id is not None and auth.is_sudo(user_id)):
+            return ALLOW
+        if user_id is not None and not self.users.try_acquire(user_id):
+            return USER_FLOOD
+        # Private chats are already covered by the user bucket
+        if chat_id is not None and chat_id != user_id and not self.chats.try_acquire(chat_id):
+            return CHAT_FLOOD
+        return ALLOW
+
+
+load = LoadMonitor()
+ptb_guard = UpdateGuard("ptb")
+pyro_guard = UpdateGuard("pyrogram")
+
+
+class GuardHandler(BaseHandler):
+    """First handler PTB tries for every update; ends dispatch for dropped ones."""
+
+    def __init__(self):
+        super().__init__(self._drop, block=True)
+
+    def check_update(self, update: object) -> bool:
+        if not isinstance(update, Update):
+            return False
+        user, chat = update.effective_user, update.effective_chat
+        inline = update.inline_query is not None or update.chosen_inline_result is not None
+        verdict = ptb_guard.check(user.id if user else None, chat.id if chat else None, rate_limited=not inline)
+        if verdict != ALLOW:
+            return True
+        message = update.effective_message
+        if message is not None and update.callback_query is None:
+            load.record_update_age(message.edit_date or message.date)
+        return False
+
+    async def _drop(self, update: Update, context: CallbackContext) -> None:
+        query, chat = update.callback_query, update.effective_chat
+        if query is not None and not auth.blocks(query.from_user.id, chat.id if chat else None):
+            context.application.create_task(_answer_flood(query.answer))
+        raise ApplicationHandlerStop
+
+
+def _pyro_dropped(_, __, update) -> bool:
+    user = getattr(update, "from_user", None)
+    message = getattr(update, "message", None) or update
+    chat = getattr(message, "chat", None)
+    verdict = pyro_guard.check(user.id if user else None, chat.id if chat else None)
+    return verdict != ALLOW
+
+
+async def _pyro_drop(client, update) -> None:
+    if isinstance(update, CallbackQuery):
+        chat = update.message.chat if update.message else None
+        if not auth.blocks(update.from_user.id, chat.id if chat else None):
+            asyncio.create_task(_answer_flood(update.answer))
+    raise StopPropagation
+
+
+async def _answer_flood(answer) -> None:
+    """Stop the spinner on a callback query dropped for flooding, off the dispatch path."""
+    try:
+        await answer(SLOW_DOWN)
+    except Exception as e:
+        LOGGER.debug(f"Dispatch: answering a dropped callback failed: {e}")
+
+
+def instrument(application) -> int:
+    """Wrap every not yet timed coroutine callback on both clients; returns how many were new."""
+    wrapped = 0
+    groups = [application.handlers]
+    dispatcher = getattr(shivuu, "dispatcher", None)
+    if dispatcher is not None:
+        groups.append(dispatcher.groups)
+    for by_group in groups:
+        for group, handlers in by_group.items():
+            if group == GUARD_GROUP:
+                continue
+            for handler in handlers:
+                callback = getattr(handler, "callback", None)
+                if callback is None or getattr(callback, "__timed__", False):
+                    continue
+                timed = handler_metrics.wrap(callback)
+                if timed is not callback:
+                    handler.callback = timed
+                    wrapped += 1
+    return wrapped
+
+
+def report() -> str:
+    lines = ["<b>🚦 Dispatch</b>", ""]
+    state = "shedding" if load.shedding else "normal"
+    lines.append(
+        f"Load: <code>{state}</code> · loop lag <code>{load.loop_lag * 1000:.0f} ms</code>"
+        f" · update age <code>{load.update_age:.1f}s</code> · shed <code>{load.shed}</code>"
+    )
+    for guard in (ptb_guard, pyro_guard):
+        counts = " ".join(f"{k}={v}" for k, v in sorted(guard.verdicts.items())) or "-"
+        lines.append(f"{guard.name}: <code>{counts}</code>")
+
+    return "\n".join(lines)
+
+
+def _prometheus_lines() -> List[str]:
+    lines = [
+        "# HELP shivu_dispatch_updates_total Updates seen by the dispatch guard, by verdict.",
+        "# TYPE shivu_dispatch_updates_total counter",
+    ]
+    for guard in (ptb_guard, pyro_guard):
+        lines += [
+            f'shivu_dispatch_updates_total{{source="{guard.name}",verdict="{verdict}"}} {n}'
+            for verdict, n in sorted(guard.verdicts.items())
+        ]
+    lines += [
+        "# TYPE shivu_event_loop_lag_seconds gauge",
+        f"shivu_event_loop_lag_seconds {load.loop_lag:.6f}",
+        "# TYPE shivu_update_age_seconds gauge",
+        f"shivu_update_age_seconds {load.update_age:.3f}",
+        "# TYPE shivu_spawns_shed_total counter",
+        f"shivu_spawns_shed_total {load.shed}",
+    ]
+    return lines
+
+
+add_collector(_prometheus_lines)
+
+
+async def dispatch_report(update: Update, context: CallbackContext) -> None:
+    if not auth.is_sudo(update.effective_user.id):
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+    await update.message.reply_text(report(), parse_mode="HTML")
+
+
+def setup_dispatch_handlers(application) -> None:
+    """Call after the command handlers so the first instrument pass sees them.
+
+    The catch-all message counter goes in after this: it would shadow /dispatch
+    in group 0, and the load monitor's first tick instruments it.
+    """
+    application.add_handler(GuardHandler(), group=GUARD_GROUP)
+    application.add_handler(CommandHandler("dispatch", dispatch_report, block=False))
+    dropped = pyro_filters.create(_pyro_dropped)
+    shivuu.add_handler(PyroMessageHandler(_pyro_drop, dropped), group=GUARD_GROUP)
+    shivuu.add_handler(PyroCallbackQueryHandler(_pyro_drop, dropped), group=GUARD_GROUP)
+    LOGGER.info(f"Dispatch: timing {instrument(application)} handlers")
+    load.on_tick(lambda: instrument(application))
+    startup.defer("load monitor", load.start)
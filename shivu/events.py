@@ -0,0 +1,128 @@
+"""
+In-process event bus for data mutations.
+
+Code that changes a character, a user's collection or a setting publishes an
+event; caches subscribe and drop exactly the entries it affects, so they can
+keep long TTLs without serving stale data. Handlers run synchronously inside
+`publish`, coroutine handlers are scheduled as tasks.
+
+With `EVENT_RELAY` enabled in the config, every event is also written to the
+`bus_events` collection and each process follows that collection through a
+change stream (needs a replica set, which Atlas provides), so several bot
+processes invalidate each other's caches too.
+"""
+
+import asyncio
+import inspect
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from shivu import LOGGER, Config, db
+from shivu.indexes import index_registry
+from shivu.metrics import background_task
+from shivu.startup import startup
+
+CHARACTER_UPDATED = "character.updated"
+CHARACTER_DELETED = "character.deleted"
+USER_COLLECTION_CHANGED = "user.collection_changed"
+SETTINGS_CHANGED = "settings.changed"
+AUTH_CHANGED = "auth.changed"
+
+RELAY_RETENTION = 3600
+RELAY_RETRY = 30
+
+EventHandler = Callable[..., Any]
+
+relay_collection = db["bus_events"]
+index_registry.declare("bus_events", [("at", 1)], expire_after_seconds=RELAY_RETENTION)
+
+
+class EventBus:
+    def __init__(self, relay: bool = False):
+        self._handlers: Dict[str, List[EventHandler]] = defaultdict(list)
+        self.relay = relay
+        self.origin = f"{os.getpid()}-{id(self):x}"
+        self.stats: Dict[str, int] = defaultdict(int)
+        self._relay_task: Optional[asyncio.Task] = None
+
+    def subscribe(self, event: str, handler: Optional[EventHandler] = None):
+        """Register `handler(**payload)` for `event`; usable as a decorator."""
+        def register(func: EventHandler) -> EventHandler:
+            self._handlers[event].append(func)
+            return func
+        return register(handler) if handler is not None else register
+
+    def _dispatch(self, event: str, payload: Dict[str, Any]) -> None:
+        self.stats[event] += 1
+        for handler in self._handlers.get(event, ()):
+            try:
+                result = handler(**payload)
+                if inspect.isawaitable(result):
+                    background_task(result)
+            except Exception as e:
+                LOGGER.error(f"Event handler {getattr(handler, '__name__', handler)} for {event} failed: {e}")
+
+    def publish(self, event: str, **payload: Any) -> None:
+        self._dispatch(event, payload)
+        if self.relay:
+            try:
+                background_task(self._forward(event, payload))
+            except RuntimeError:
+                pass
+
+    async def _forward(self, event: str, payload: Dict[str, Any]) -> None:
+        try:
+            await relay_collection.insert_one({
+                "event": event, "payload": payload, "origin": self.origin, "at": datetime.utcnow()
+            })
+        except Exception as e:
+            self.stats["relay_errors"] += 1
+            LOGGER.warning(f"Event relay write failed for {event}: {e}")
+
+    async def follow(self) -> None:
+        """Replay events published by other processes until cancelled."""
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.origin": {"$ne": self.origin}}}]
+        while True:
+            try:
+                async with relay_collection.watch(pipeline) as stream:
+                    async for change in stream:
+                        doc = change["fullDocument"]
+                        self.stats["relayed"] += 1
+                        self._dispatch(doc["event"], doc.get("payload") or {})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["relay_errors"] += 1
+                LOGGER.warning(f"Event relay stream stopped: {e}; retrying in {RELAY_RETRY}s")
+                await asyncio.sleep(RELAY_RETRY)
+
+    async def start_relay(self) -> None:
+        if self.relay and (self._relay_task is None or self._relay_task.done()):
+            self._relay_task = background_task(self.follow())
+
+
+bus = EventBus(relay=getattr(Config, "EVENT_RELAY", False))
+startup.defer("event relay", bus.start_relay)
+
+
+def character_updated(character_id, **fields: Any) -> None:
+    bus.publish(CHARACTER_UPDATED, character_id=str(character_id), **fields)
+
+
+def character_deleted(character_id) -> None:
+    bus.publish(CHARACTER_DELETED, character_id=str(character_id))
+
+
+def collection_changed(user_id, character_ids=()) -> None:
+    bus.publish(USER_COLLECTION_CHANGED, user_id=int(user_id),
+                character_ids=[str(cid) for cid in character_ids if cid is not None])
+
+
+def settings_changed(key: str, user_id=None, chat_id=None) -> None:
+    bus.publish(SETTINGS_CHANGED, key=key, user_id=user_id, chat_id=chat_id)
+
+
+def auth_changed(user_id=None, chat_id=None) -> None:
+    bus.publish(AUTH_CHANGED, user_id=user_id, chat_id=chat_id)
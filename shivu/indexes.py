@@ -0,0 +1,267 @@
+"""
+Declarative MongoDB index registry.
+
+Every index the bot relies on is declared here (or by a module through
+`index_registry.declare`) and reconciled once at startup: missing indexes are
+built, existing ones with the same key pattern are left alone, and legacy
+indexes are dropped. `/indexes` shows the outcome together with an explain()
+report of the hot command filters, flagging the ones that still COLLSCAN.
+"""
+
+from dataclasses import dataclass, field
+from html import escape
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from telegram import Update
+from telegram.ext import CallbackContext, CommandHandler
+
+from shivu import LOGGER, OWNER_ID, db, sudo_users
+
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+
+@dataclass
+class IndexSpec:
+    collection: str
+    keys: List[Tuple[str, Any]]
+    unique: bool = False
+    sparse: bool = False
+    expire_after_seconds: Optional[int] = None
+    name: Optional[str] = None
+
+    @property
+    def index_name(self) -> str:
+        return self.name or "_".join(f"{k}_{d}" for k, d in self.keys)
+
+    @property
+    def is_text(self) -> bool:
+        return any(d == TEXT for _, d in self.keys)
+
+    def options(self) -> Dict[str, Any]:
+        opts: Dict[str, Any] = {"name": self.index_name}
+        if self.unique:
+            opts["unique"] = True
+        if self.sparse:
+            opts["sparse"] = True
+        if self.expire_after_seconds is not None:
+            opts["expireAfterSeconds"] = self.expire_after_seconds
+        return opts
+
+    def matches(self, info: Dict[str, Any]) -> bool:
+        existing = [(k, v) for k, v in info.get("key", [])]
+        if self.is_text:
+            return any(k == "_fts" for k, _ in existing)
+        return existing == [(k, d) for k, d in self.keys]
+
+
+@dataclass
+class HotQuery:
+    label: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+
+
+@dataclass
+class IndexRegistry:
+    specs: List[IndexSpec] = field(default_factory=list)
+    legacy: List[Tuple[str, str]] = field(default_factory=list)
+    hot_queries: List[HotQuery] = field(default_factory=list)
+    results: Dict[str, str] = field(default_factory=dict)
+
+    def declare(self, collection: str, keys, **options) -> None:
+        spec = IndexSpec(collection, list(keys), **options)
+        if not any(s.collection == spec.collection and s.keys == spec.keys for s in self.specs):
+            self.specs.append(spec)
+
+    def drop_legacy(self, collection: str, name: str) -> None:
+        self.legacy.append((collection, name))
+
+    def hot_query(self, label: str, collection: str, filter: Dict[str, Any], sort=None) -> None:
+        self.hot_queries.append(HotQuery(label, collection, filter, sort))
+
+    async def _ensure(self, spec: IndexSpec, existing: Dict[str, Dict[str, Any]]) -> str:
+        for name, info in existing.items():
+            if spec.matches(info):
+                if spec.unique and not info.get("unique"):
+                    return f"present as {name} (not unique)"
+                return f"present as {name}"
+        coll = db[spec.collection]
+        try:
+            await coll.create_index(spec.keys, **spec.options())
+            return "created"
+        except DuplicateKeyError:
+            # Existing data violates uniqueness; still index the field for reads
+            await coll.create_index(spec.keys, name=spec.index_name)
+            return "created (non-unique: duplicates exist)"
+        except OperationFailure as e:
+            if e.code in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+                return f"conflict: {e.details.get('errmsg', e) if e.details else e}"
+            if e.code == 11000:
+                await coll.create_index(spec.keys, name=spec.index_name)
+                return "created (non-unique: duplicates exist)"
+            raise
+
+    async def reconcile(self) -> Dict[str, str]:
+        """Bring the database in line with the declared indexes. Safe to run repeatedly."""
+        by_collection: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+        for coll_name, index_name in self.legacy:
+            try:
+                info = await db[coll_name].index_information()
+                if index_name in info:
+                    await db[coll_name].drop_index(index_name)
+                    self.results[f"{coll_name}.{index_name}"] = "dropped (legacy)"
+            except Exception as e:
+                self.results[f"{coll_name}.{index_name}"] = f"drop failed: {e}"
+
+        for spec in self.specs:
+            key = f"{spec.collection}.{spec.index_name}"
+            try:
+                if spec.collection not in by_collection:
+                    by_collection[spec.collection] = await db[spec.collection].index_information()
+                self.results[key] = await self._ensure(spec, by_collection[spec.collection])
+                if self.results[key].startswith("created"):
+                    by_collection.pop(spec.collection, None)
+            except Exception as e:
+                self.results[key] = f"error: {e}"
+                LOGGER.error(f"Index {key} failed: {e}")
+
+        created = sum(1 for r in self.results.values() if r.startswith("created"))
+        LOGGER.info(f"Index reconcile: {len(self.specs)} declared, {created} created")
+        return self.results
+
+    @staticmethod
+    def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+        stages = []
+        stack = [plan]
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, dict):
+                continue
+            stage = node.get("stage")
+            if stage:
+                name = node.get("indexName")
+                stages.append(f"{stage}({name})" if name else stage)
+            stack.extend(v for k, v in node.items() if k in ("inputStage", "queryPlan"))
+            stack.extend(node.get("inputStages", []))
+        return stages
+
+    async def slow_query_report(self) -> List[Dict[str, Any]]:
+        report = []
+        for q in self.hot_queries:
+            try:
+                cursor = db[q.collection].find(q.filter)
+                if q.sort:
+                    cursor = cursor.sort(q.sort)
+                explain = await cursor.limit(1).explain()
+                planner = explain.get("queryPlanner", {})
+                stages = self._plan_stages(planner.get("winningPlan", {}))
+                stats = explain.get("executionStats", {})
+                report.append({
+                    "label": q.label,
+                    "collscan": any(s.startswith("COLLSCAN") for s in stages),
+                    "plan": " <- ".join(stages) or "?",
+                    "examined": stats.get("totalDocsExamined"),
+                })
+            except Exception as e:
+                report.append({"label": q.label, "collscan": None, "plan": f"error: {e}", "examined": None})
+        return report
+
+
+index_registry = IndexRegistry()
+
+# --- Characters catalog ---
+index_registry.declare("anime_characters_lol", [("id", ASCENDING)], unique=True)
+index_registry.declare("anime_characters_lol", [("rarity", ASCENDING), ("anime", ASCENDING)])
+index_registry.declare("anime_characters_lol", [("name", TEXT), ("anime", TEXT)])
+# A catalog document has no `characters` array; this index only cost writes
+index_registry.drop_legacy("anime_characters_lol", "characters.id_1")
+
+# --- Users ---
+index_registry.declare("user_collection_lmaoooo", [("id", ASCENDING)], unique=True)
+index_registry.declare("user_collection_lmaoooo", [("characters.id", ASCENDING)], sparse=True)
+
+# --- Spawn / grab hot path ---
+index_registry.declare("group_rarity_spawns", [("chat_id", ASCENDING), ("rarity_emoji", ASCENDING)])
+index_registry.declare("group_rarity_spawns", [("rarity_emoji", ASCENDING)])
+index_registry.declare("user_totals_lmaoooo", [("chat_id", ASCENDING)])
+index_registry.declare("group_user_totalsssssss", [("group_id", ASCENDING), ("user_id", ASCENDING)])
+index_registry.declare("group_user_totalsssssss", [("group_id", ASCENDING), ("count", DESCENDING)])
+index_registry.declare("top_global_groups", [("group_id", ASCENDING)])
+index_registry.declare("top_global_groups", [("count", DESCENDING)])
+
+# --- Marketplace ---
+# Keyset pagination walks (listed_at, _id); filtered views prefix the equality key
+index_registry.declare("sell_listings", [("listed_at", DESCENDING), ("_id", DESCENDING)])
+index_registry.declare("sell_listings", [("seller_id", ASCENDING), ("listed_at", DESCENDING), ("_id", DESCENDING)])
+index_registry.declare("sell_listings", [("rarity_key", ASCENDING), ("listed_at", DESCENDING), ("_id", DESCENDING), ("price", ASCENDING)])
+index_registry.declare("sell_listings", [("anime_key", ASCENDING), ("listed_at", DESCENDING), ("_id", DESCENDING), ("price", ASCENDING)])
+index_registry.drop_legacy("sell_listings", "listed_at_-1")
+index_registry.drop_legacy("sell_listings", "seller_id_1_listed_at_-1")
+# Filters behind market buttons; unused ones expire a week after they were last registered
+index_registry.declare("market_filters", [("at", ASCENDING)], expire_after_seconds=7 * 24 * 60 * 60)
+
+# --- Moderation ---
+index_registry.declare("Banned_Users", [("user_id", ASCENDING)])
+index_registry.declare("global_ban_users_collection", [("user_id", ASCENDING)])
+index_registry.declare("Banned_Groups", [("chat_id", ASCENDING)])
+index_registry.declare("sudo_users_collection", [("id", ASCENDING)])
+
+# --- Misc feature collections ---
+index_registry.declare("giveaway_participants", [("giveaway_id", ASCENDING), ("user_id", ASCENDING)], unique=True)
+# Winner draws: random sequence numbers, and first-come order
+index_registry.declare("giveaway_participants", [("giveaway_id", ASCENDING), ("seq", ASCENDING)])
+index_registry.declare("giveaway_participants", [("giveaway_id", ASCENDING), ("joined_at", ASCENDING)])
+index_registry.declare("broadcast_jobs", [("status", ASCENDING), ("started_at", DESCENDING)])
+
+# --- Filters used by commands, checked by /indexes ---
+index_registry.hot_query("spawn: group exclusive", "group_rarity_spawns", {"chat_id": -1, "rarity_emoji": "🟢"})
+index_registry.hot_query("spawn: other exclusive", "group_rarity_spawns", {"rarity_emoji": "🟢", "chat_id": {"$ne": -1}})
+index_registry.hot_query("spawn: frequency", "user_totals_lmaoooo", {"chat_id": "-1"})
+index_registry.hot_query("grab: user", "user_collection_lmaoooo", {"id": 0})
+index_registry.hot_query("grab: group total", "group_user_totalsssssss", {"user_id": 0, "group_id": -1})
+index_registry.hot_query("grab: top group", "top_global_groups", {"group_id": -1})
+index_registry.hot_query("check: owners", "user_collection_lmaoooo", {"characters.id": "0"})
+index_registry.hot_query("catalog: by id", "anime_characters_lol", {"id": "0"})
+index_registry.hot_query("catalog: by rarity", "anime_characters_lol", {"rarity": "🟢 Common"})
+index_registry.hot_query("market: latest", "sell_listings", {}, [("listed_at", DESCENDING), ("_id", DESCENDING)])
+index_registry.hot_query("market: by seller", "sell_listings", {"seller_id": 0}, [("listed_at", DESCENDING), ("_id", DESCENDING)])
+index_registry.hot_query("market: by rarity", "sell_listings", {"rarity_key": "🟢"}, [("listed_at", DESCENDING), ("_id", DESCENDING)])
+index_registry.hot_query("market: by anime", "sell_listings", {"anime_key": "naruto"}, [("listed_at", DESCENDING), ("_id", DESCENDING)])
+index_registry.hot_query("chat top", "group_user_totalsssssss", {"group_id": -1}, [("count", DESCENDING)])
+
+
+async def indexes_command(update: Update, context: CallbackContext) -> None:
+    user_id = str(update.effective_user.id)
+    if user_id != str(OWNER_ID) and user_id not in sudo_users:
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+
+    lines = ["<b>🗂 Index Registry</b>", ""]
+    for key, result in sorted(index_registry.results.items()):
+        lines.append(f"<code>{escape(key)}</code>: {escape(result)}")
+    if not index_registry.results:
+        lines.append("<i>Reconcile has not run yet.</i>")
+
+    lines += ["", "<b>🐢 Hot query plans</b>"]
+    for row in await index_registry.slow_query_report():
+        mark = "❓" if row["collscan"] is None else "🔴 COLLSCAN" if row["collscan"] else "🟢"
+        examined = f" · examined {row['examined']}" if row["examined"] is not None else ""
+        lines.append(f"{mark} <b>{escape(row['label'])}</b>\n   <code>{escape(row['plan'])}</code>{examined}")
+
+    chunk = ""
+    for line in lines:
+        if len(chunk) + len(line) + 1 > 4000:
+            await update.message.reply_text(chunk, parse_mode="HTML")
+            chunk = ""
+        chunk += line + "\n"
+    if chunk:
+        await update.message.reply_text(chunk, parse_mode="HTML")
+
+
+def setup_index_handlers(application) -> None:
+    application.add_handler(CommandHandler("indexes", indexes_command, block=False))
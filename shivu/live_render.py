@@ -0,0 +1,183 @@
+"""
+Shared renderer for messages that are edited repeatedly (countdowns, live counters).
+
+One scheduler task serves every live message. Each message is only re-rendered
+when it is due: the interval grows with the time left, so a raid with a minute
+to go is edited every few seconds and only the last seconds tick every second.
+An edit also needs a token from its chat's budget and is skipped when the text
+did not change. `/liverender` reports how many edit calls this saved compared
+to editing every message once per second.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import CallbackContext, CommandHandler
+
+from shivu import LOGGER, OWNER_ID, sudo_users
+from shivu.metrics import background_task
+from shivu.ratelimit import GROUP_CHAT_RATE, PRIVATE_CHAT_RATE, KeyedTokenBucket
+
+TICK = 0.5
+
+# (seconds left at least, seconds between edits), checked top to bottom
+EDIT_INTERVALS = ((120, 15.0), (60, 10.0), (30, 5.0), (10, 3.0), (0, 1.0))
+
+# Render returns the new (text, markup) or None when the message is finished
+RenderFunc = Callable[[float], Awaitable[Optional[Tuple[str, Any]]]]
+EditFunc = Callable[[str, Any], Awaitable[Any]]
+
+
+def edit_interval(remaining: float) -> float:
+    for threshold, interval in EDIT_INTERVALS:
+        if remaining >= threshold:
+            return interval
+    return EDIT_INTERVALS[-1][1]
+
+
+@dataclass
+class LiveMessage:
+    chat_id: int
+    render: RenderFunc
+    edit: EditFunc
+    ends_at: float
+    last_text: Optional[str] = None
+    next_due: float = 0.0
+    last_update: float = 0.0
+    started_at: float = field(default_factory=time.monotonic)
+    dirty: bool = False
+
+
+class LiveRenderer:
+    def __init__(self):
+        self.messages: Dict[Hashable, LiveMessage] = {}
+        self.private_budget = KeyedTokenBucket(PRIVATE_CHAT_RATE, 1.0)
+        # Leave part of the group allowance for the bot's normal replies
+        self.group_budget = KeyedTokenBucket(GROUP_CHAT_RATE / 2, 2.0)
+        self.stats = {"edits": 0, "unchanged": 0, "throttled": 0, "failed": 0, "naive": 0}
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[Hashable, asyncio.TimerHandle] = {}
+
+    def track(self, key: Hashable, chat_id: int, render: RenderFunc, edit: EditFunc, duration: float) -> None:
+        """Keep a message live for `duration` seconds; its first edit is one interval away."""
+        now = time.monotonic()
+        self.messages[key] = LiveMessage(
+            chat_id, render, edit, now + duration, next_due=now + edit_interval(duration)
+        )
+        self._ensure_running()
+
+    def untrack(self, key: Hashable) -> None:
+        live = self.messages.pop(key, None)
+        if live:
+            # A 1/s loop would have edited once per second it was alive
+            self.stats["naive"] += int(time.monotonic() - live.started_at)
+
+    def touch(self, key: Hashable) -> None:
+        """Content changed (e.g. someone joined); re-render on the next tick the budget allows."""
+        live = self.messages.get(key)
+        if live:
+            live.dirty = True
+
+    def _budget(self, chat_id: int) -> KeyedTokenBucket:
+        return self.private_budget if int(chat_id) > 0 else self.group_budget
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = background_task(self._run())
+
+    async def _update(self, key: Hashable, live: LiveMessage, now: float) -> None:
+        remaining = live.ends_at - now
+        live.next_due = now + edit_interval(remaining)
+        live.last_update = now
+        live.dirty = False
+        try:
+            rendered = await live.render(max(0.0, remaining))
+        except Exception as e:
+            LOGGER.warning(f"Live render {key} failed: {e}")
+            rendered = None
+        if rendered is None:
+            self.untrack(key)
+            return
+        text, markup = rendered
+        if text == live.last_text:
+            self.stats["unchanged"] += 1
+            return
+        if not self._budget(live.chat_id).try_acquire(live.chat_id):
+            self.stats["throttled"] += 1
+            live.next_due = now + TICK
+            return
+        try:
+            await live.edit(text, markup)
+            live.last_text = text
+            self.stats["edits"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            LOGGER.debug(f"Live edit {key} failed: {e}")
+
+    async def _run(self) -> None:
+        while self.messages:
+            await asyncio.sleep(TICK)
+            now = time.monotonic()
+            due = []
+            for key, live in list(self.messages.items()):
+                if now >= live.ends_at:
+                    self.untrack(key)
+                elif now >= live.next_due or (live.dirty and now - live.last_update >= 1.0):
+                    due.append((key, live))
+            if due:
+                await asyncio.gather(*(self._update(key, live, now) for key, live in due))
+
+    def edit_once(self, key: Hashable, edit: Callable[[], Awaitable[Any]], delay: float = 1.0) -> None:
+        """Run `edit` after `delay`; requests for the same key in the meantime collapse into one."""
+        if key in self._pending:
+            self.stats["naive"] += 1
+            return
+
+        def fire():
+            self._pending.pop(key, None)
+            self.stats["naive"] += 1
+            self.stats["edits"] += 1
+            asyncio.create_task(self._guarded(key, edit))
+
+        self._pending[key] = asyncio.get_running_loop().call_later(delay, fire)
+
+    async def _guarded(self, key: Hashable, edit: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            await edit()
+        except Exception as e:
+            self.stats["failed"] += 1
+            LOGGER.debug(f"Coalesced edit {key} failed: {e}")
+
+    def saved(self) -> int:
+        live_naive = sum(int(time.monotonic() - m.started_at) for m in self.messages.values())
+        return max(0, self.stats["naive"] + live_naive - self.stats["edits"])
+
+    def report(self) -> str:
+        s = self.stats
+        return (
+            "<b>📡 Live Renderer</b>\n\n"
+            f"Live messages: <code>{len(self.messages)}</code>\n"
+            f"Edits sent: <code>{s['edits']}</code>\n"
+            f"Skipped (unchanged): <code>{s['unchanged']}</code>\n"
+            f"Deferred (chat budget): <code>{s['throttled']}</code>\n"
+            f"Failed: <code>{s['failed']}</code>\n"
+            f"API calls saved: <code>{self.saved()}</code>"
+        )
+
+
+live_renderer = LiveRenderer()
+
+
+async def live_render_report(update: Update, context: CallbackContext) -> None:
+    user_id = str(update.effective_user.id)
+    if user_id != str(OWNER_ID) and user_id not in sudo_users:
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+    await update.message.reply_text(live_renderer.report(), parse_mode="HTML")
+
+
+def setup_live_render_handlers(application) -> None:
+    application.add_handler(CommandHandler("liverender", live_render_report, block=False))
@@ -0,0 +1,255 @@
+"""
+Market purchases that stay correct under concurrent buyers.
+
+`PurchaseEngine` settles a purchase of one `sell_listings` entry; the /market
+handlers in shivu.modules.sell use the instance built there.
+
+`python -m shivu.market_purchase [buyers]` races that many purchases of a
+single listing on a scratch database, in each mode the server supports. It
+checks that exactly one buyer wins and that gold and characters add up, and
+prints p50/p95/max latency of the individual purchases.
+"""
+
+import asyncio
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+
+from shivu import LOGGER, db, lol
+from shivu.events import collection_changed
+
+MARKET_FEE = 0.05
+WRITE_CONFLICT = 112
+LOAD_TEST_BUYERS = 300
+
+
+@dataclass
+class PurchaseResult:
+    status: str  # "ok", "gone", "own" or "funds"
+    listing: Optional[dict] = None
+    balance: int = 0
+    fee: int = 0
+    seller_gets: int = 0
+
+
+class _Rollback(Exception):
+    """Aborts a purchase transaction that has nothing to commit."""
+
+    def __init__(self, result: PurchaseResult):
+        super().__init__(result.status)
+        self.result = result
+
+
+class PurchaseEngine:
+    """Settles a market purchase with conditional writes only.
+
+    The listing is claimed with `find_one_and_delete`, so among any number of
+    concurrent buyers exactly one gets it. The buyer is then debited only if the
+    balance still covers the price, and the character/gold transfer goes out as
+    one ordered `bulk_write`. On a replica set all of it runs in
+    `with_transaction`, which retries the write conflicts losing buyers hit; on
+    a standalone server a failed debit or transfer is compensated instead.
+    """
+
+    def __init__(self, client, listings, users, history):
+        self.client = client
+        self.listings = listings
+        self.users = users
+        self.history = history
+        self._transactions: Optional[bool] = None
+
+    async def supports_transactions(self) -> bool:
+        if self._transactions is None:
+            try:
+                hello = await self.client.admin.command("hello")
+                self._transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+            except Exception:
+                self._transactions = False
+        return self._transactions
+
+    async def _claim(self, listing_id: ObjectId, buyer_id: int, session=None) -> PurchaseResult:
+        listing = await self.listings.find_one_and_delete(
+            {"_id": listing_id, "seller_id": {"$ne": buyer_id}}, session=session
+        )
+        if listing:
+            return PurchaseResult("ok", listing)
+        # Only the losing path pays for telling "your own listing" from "already sold"
+        own = await self.listings.find_one({"_id": listing_id, "seller_id": buyer_id}, {"_id": 1}, session=session)
+        return PurchaseResult("own" if own else "gone")
+
+    async def _settle(self, result: PurchaseResult, buyer_id: int, session=None) -> PurchaseResult:
+        listing = result.listing
+        price = listing["price"]
+        buyer = await self.users.find_one_and_update(
+            {"id": buyer_id, "balance": {"$gte": price}},
+            {"$inc": {"balance": -price}},
+            projection={"balance": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if not buyer:
+            return PurchaseResult("funds", listing)
+
+        result.balance = buyer.get("balance", 0)
+        result.fee = int(price * MARKET_FEE)
+        result.seller_gets = price - result.fee
+        seller_credit = UpdateOne({"id": listing["seller_id"]}, {"$inc": {"balance": result.seller_gets}}, upsert=True)
+        try:
+            await self.users.bulk_write([
+                UpdateOne({"id": buyer_id}, {"$push": {"characters": listing["character"]}}),
+                seller_credit,
+            ], session=session)
+        except BulkWriteError as e:
+            # Ordered: unless the push itself failed, the buyer already has the
+            # character, so rolling back would duplicate it; retry the credit instead
+            if session is not None or e.details["writeErrors"][0]["index"] == 0:
+                raise
+            try:
+                await self.users.bulk_write([seller_credit])
+            except Exception as retry_error:
+                LOGGER.error(
+                    f"Market: crediting seller {listing['seller_id']} {result.seller_gets} "
+                    f"for listing {listing['_id']} failed: {retry_error}"
+                )
+        return result
+
+    async def _record(self, result: PurchaseResult, buyer_id: int, session=None) -> None:
+        listing = result.listing
+        char = listing["character"]
+        await self.history.insert_one({
+            "seller_id": listing["seller_id"],
+            "buyer_id": buyer_id,
+            "character_name": char.get("name", "Unknown"),
+            "character_anime": char.get("anime", "Unknown"),
+            "price": listing["price"],
+            "fee": result.fee,
+            "sold_at": datetime.utcnow()
+        }, session=session)
+
+    async def _buy_in_transaction(self, listing_id: ObjectId, buyer_id: int) -> PurchaseResult:
+        async def purchase(session) -> PurchaseResult:
+            result = await self._claim(listing_id, buyer_id, session)
+            if result.status == "ok":
+                result = await self._settle(result, buyer_id, session)
+            if result.status != "ok":
+                raise _Rollback(result)
+            await self._record(result, buyer_id, session)
+            return result
+
+        async with await self.client.start_session() as session:
+            try:
+                return await session.with_transaction(purchase)
+            except _Rollback as e:
+                return e.result
+
+    async def _buy_compensated(self, listing_id: ObjectId, buyer_id: int) -> PurchaseResult:
+        result = await self._claim(listing_id, buyer_id)
+        if result.status != "ok":
+            return result
+        listing = result.listing
+        try:
+            result = await self._settle(result, buyer_id)
+        except Exception:
+            # seller_gets is only set once the buyer has been debited
+            if result.seller_gets:
+                await self.users.update_one({"id": buyer_id}, {"$inc": {"balance": listing["price"]}})
+            await self.listings.insert_one(listing)
+            raise
+        if result.status != "ok":
+            await self.listings.insert_one(listing)
+            return result
+        # The trade has happened; a missing history entry is not worth undoing it
+        try:
+            await self._record(result, buyer_id)
+        except Exception as e:
+            LOGGER.error(f"Market: recording sale of listing {listing['_id']} failed: {e}")
+        return result
+
+    async def buy(self, listing_id: ObjectId, buyer_id: int) -> PurchaseResult:
+        result = await self._buy(listing_id, buyer_id)
+        if result.status == "ok":
+            collection_changed(buyer_id, [result.listing["character"].get("id")])
+        return result
+
+    async def _buy(self, listing_id: ObjectId, buyer_id: int) -> PurchaseResult:
+        if await self.supports_transactions():
+            try:
+                return await self._buy_in_transaction(listing_id, buyer_id)
+            except PyMongoError as e:
+                # with_transaction retried for up to two minutes; another buyer holds the listing
+                if e.has_error_label("TransientTransactionError") or getattr(e, "code", None) == WRITE_CONFLICT:
+                    return PurchaseResult("gone")
+                # e.g. a deployment that reports a replica set but refuses transactions
+                if not isinstance(e, OperationFailure) or e.code != 20:
+                    raise
+                LOGGER.warning(f"Market: transactions unavailable, falling back: {e}")
+                self._transactions = False
+        return await self._buy_compensated(listing_id, buyer_id)
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+async def load_test(buyers: int = LOAD_TEST_BUYERS) -> None:
+    """Race `buyers` purchases of one listing on a scratch database; exactly one may win."""
+    scratch = lol[f"{db.name}_market_loadtest"]
+    price, seller_id = 1000, 1
+    modes = [("compensated", False)]
+    if await PurchaseEngine(lol, None, None, None).supports_transactions():
+        modes.insert(0, ("transaction", True))
+    try:
+        for label, transactions in modes:
+            await lol.drop_database(scratch.name)
+            users, listings, history = scratch["users"], scratch["sell_listings"], scratch["sell_history"]
+            engine = PurchaseEngine(lol, listings, users, history)
+            engine._transactions = transactions
+            await users.insert_many([{"id": 1000 + i, "balance": price, "characters": []} for i in range(buyers)])
+            listing = await listings.insert_one({
+                "seller_id": seller_id,
+                "character": {"id": "1", "name": "Load test", "anime": "Load test"},
+                "price": price,
+                "listed_at": datetime.utcnow(),
+            })
+
+            latencies: List[float] = []
+
+            async def timed_buy(buyer_id: int) -> PurchaseResult:
+                start = time.perf_counter()
+                try:
+                    # _buy rather than buy: no collection_changed events for scratch users
+                    return await engine._buy(listing.inserted_id, buyer_id)
+                finally:
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(timed_buy(1000 + i) for i in range(buyers)))
+            elapsed = time.perf_counter() - start
+
+            statuses = Counter(r.status for r in results)
+            assert statuses == {"ok": 1, "gone": buyers - 1}, statuses
+            fee = next(r.fee for r in results if r.status == "ok")
+            balances = [doc["balance"] async for doc in users.find({}, {"balance": 1})]
+            assert sum(balances) == buyers * price - fee, sum(balances)
+            assert await users.count_documents({"characters.id": "1"}) == 1
+            assert await listings.count_documents({}) == 0
+            assert await history.count_documents({}) == 1
+            print(
+                f"{label:<12} {buyers} buyers, 1 listing: {dict(statuses)} in {elapsed * 1000:.0f} ms; "
+                f"per purchase p50 {_percentile(latencies, 0.5) * 1000:.1f} ms, "
+                f"p95 {_percentile(latencies, 0.95) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms"
+            )
+    finally:
+        await lol.drop_database(scratch.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(load_test(int(sys.argv[1]) if len(sys.argv) > 1 else LOAD_TEST_BUYERS))
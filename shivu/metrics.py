@@ -0,0 +1,290 @@
+"""
+Handler and database metrics.
+
+`handler_metrics.wrap(callback)` times a PTB or Pyrogram handler callback
+into a latency histogram. While the callback runs, a `HandlerCall` is held in
+a context variable. Motor runs every PyMongo operation on its executor with a
+copy of the caller's context, so `mongo_listener` (a PyMongo command
+listener passed to the client in `shivu/__init__.py`) can credit each
+command's count, duration and returned documents to the handler that issued
+it. Commands issued outside any handler are credited to BACKGROUND.
+
+Calls slower than SLOW_CALL_SECONDS are kept in a ring buffer with their
+database totals. `render_prometheus()` writes everything in the Prometheus
+text format.
+
+The same wrapper sets `shivu.logs.log_context`, so log lines written while a
+handler runs carry its name, user and chat.
+
+Tasks copy the context they are created in, so a worker or flush started from
+inside a handler would keep crediting its commands to that handler.
+`background_task()` starts one with an empty context instead; use it for
+anything that outlives the update that started it.
+
+This module is imported while the `shivu` package is still initialising, so
+it must only import `shivu.logs` from `shivu`.
+"""
+
+import asyncio
+import contextvars
+import inspect
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from pymongo import monitoring
+from pyrogram import StopPropagation
+from telegram.ext import ApplicationHandlerStop
+
+from shivu.logs import log_context
+
+BACKGROUND = "background"
+# Histogram bucket upper bounds, seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LATENCY_SAMPLES = 256
+SLOW_CALL_SECONDS = 1.0
+SLOW_CALL_SAMPLES = 100
+
+# Dispatch control flow, not failures
+_CONTROL_FLOW = (ApplicationHandlerStop, StopPropagation)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        total, out = 0, []
+        for n in self.counts:
+            total += n
+            out.append(total)
+        return out
+
+
+class HandlerCall:
+    """Database totals of one handler invocation."""
+
+    __slots__ = ("name", "queries", "db_seconds", "documents")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.documents = 0
+
+
+current_call: contextvars.ContextVar[Optional[HandlerCall]] = contextvars.ContextVar("current_call", default=None)
+
+
+def background_task(coro) -> asyncio.Task:
+    """Schedule `coro` outside any handler's context; its commands count as BACKGROUND."""
+    return asyncio.get_running_loop().create_task(coro, context=contextvars.Context())
+
+
+class HandlerMetrics:
+    def __init__(self):
+        self.latency: Dict[str, Histogram] = defaultdict(Histogram)
+        self.recent: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.queries: Dict[str, int] = defaultdict(int)
+        self.db_seconds: Dict[str, float] = defaultdict(float)
+        self.documents: Dict[str, int] = defaultdict(int)
+        self.slow: Deque[Dict[str, Any]] = deque(maxlen=SLOW_CALL_SAMPLES)
+        # The command listener runs on Motor's executor threads
+        self._db_lock = threading.Lock()
+
+    def record(self, call: HandlerCall, seconds: float, failed: bool, context: Dict[str, Any]) -> None:
+        self.latency[call.name].observe(seconds)
+        self.recent[call.name].append(seconds)
+        if failed:
+            self.errors[call.name] += 1
+        if seconds >= SLOW_CALL_SECONDS:
+            self.slow.append({
+                "at": datetime.utcnow(),
+                "handler": call.name,
+                "seconds": seconds,
+                "queries": call.queries,
+                "db_seconds": call.db_seconds,
+                "documents": call.documents,
+                "failed": failed,
+                **context,
+            })
+
+    def record_db(self, seconds: float, documents: int) -> None:
+        call = current_call.get()
+        name = call.name if call is not None else BACKGROUND
+        with self._db_lock:
+            self.queries[name] += 1
+            self.db_seconds[name] += seconds
+            self.documents[name] += documents
+            if call is not None:
+                call.queries += 1
+                call.db_seconds += seconds
+                call.documents += documents
+
+    def percentile(self, name: str, q: float) -> float:
+        samples = sorted(self.recent.get(name, ()))
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def calls(self, name: str) -> int:
+        hist = self.latency.get(name)
+        return hist.count if hist else 0
+
+    def wrap(self, callback: Callable) -> Callable:
+        """Time `callback` and credit its database commands to it; no-op for sync or wrapped ones."""
+        if getattr(callback, "__timed__", False) or not inspect.iscoroutinefunction(callback):
+            return callback
+        module = (getattr(callback, "__module__", None) or "").rsplit(".", 1)[-1]
+        name = f"{module}.{getattr(callback, '__qualname__', repr(callback))}"
+
+        async def timed(*args, **kwargs):
+            call = HandlerCall(name)
+            token = current_call.set(call)
+            context = _call_context(args)
+            log_token = log_context.set({
+                "handler": name, "user_id": context.get("user_id"), "chat_id": context.get("chat_id")
+            })
+            start = time.perf_counter()
+            failed = False
+            try:
+                return await callback(*args, **kwargs)
+            except _CONTROL_FLOW:
+                raise
+            except Exception:
+                failed = True
+                raise
+            finally:
+                current_call.reset(token)
+                log_context.reset(log_token)
+                self.record(call, time.perf_counter() - start, failed, context)
+
+        timed.__timed__ = True
+        timed.__wrapped__ = callback
+        return timed
+
+
+def _call_context(args) -> Dict[str, Any]:
+    """User, chat and a text snippet from PTB (update, context) or Pyrogram (client, update) args."""
+    for arg in args[:2]:
+        user = getattr(arg, "effective_user", None) or getattr(arg, "from_user", None)
+        if user is None:
+            continue
+        chat = getattr(arg, "effective_chat", None) or getattr(arg, "chat", None)
+        message = getattr(arg, "effective_message", None) or arg
+        text = getattr(message, "text", None) or getattr(arg, "data", None) or getattr(arg, "query", None) or ""
+        return {"user_id": user.id, "chat_id": getattr(chat, "id", None), "text": str(text)[:40]}
+    return {}
+
+
+def _returned_documents(command: str, reply: Dict[str, Any]) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        if batch is not None:
+            return len(batch)
+    if command == "findAndModify":
+        return int(reply.get("value") is not None)
+    if command == "distinct":
+        return len(reply.get("values") or ())
+    return 0
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Per-command totals, and per-handler totals through `handler_metrics`."""
+
+    def __init__(self):
+        self.commands: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.documents: Dict[str, int] = defaultdict(int)
+        self.failures: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        seconds = event.duration_micros / 1e6
+        documents = _returned_documents(event.command_name, event.reply or {})
+        with self._lock:
+            self.commands[event.command_name] += 1
+            self.seconds[event.command_name] += seconds
+            self.documents[event.command_name] += documents
+        handler_metrics.record_db(seconds, documents)
+
+    def failed(self, event) -> None:
+        seconds = event.duration_micros / 1e6
+        with self._lock:
+            self.commands[event.command_name] += 1
+            self.seconds[event.command_name] += seconds
+            self.failures[event.command_name] += 1
+        handler_metrics.record_db(seconds, 0)
+
+
+handler_metrics = HandlerMetrics()
+mongo_listener = MongoCommandListener()
+
+# Extra metric sources (dispatch verdicts, loop lag, ...): callables returning exposition lines
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def add_collector(func: Callable[[], List[str]]) -> None:
+    _collectors.append(func)
+
+
+def _label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP shivu_handler_duration_seconds Handler run time.",
+        "# TYPE shivu_handler_duration_seconds histogram",
+    ]
+    for name, hist in sorted(handler_metrics.latency.items()):
+        handler = _label(name)
+        for bound, total in zip(LATENCY_BUCKETS + ("+Inf",), hist.cumulative()):
+            lines.append(f'shivu_handler_duration_seconds_bucket{{handler="{handler}",le="{bound}"}} {total}')
+        lines.append(f'shivu_handler_duration_seconds_sum{{handler="{handler}"}} {hist.sum:.6f}')
+        lines.append(f'shivu_handler_duration_seconds_count{{handler="{handler}"}} {hist.count}')
+
+    per_handler = (
+        ("shivu_handler_errors_total", "Handler calls that raised.", handler_metrics.errors),
+        ("shivu_handler_db_queries_total", "Mongo commands issued by handler.", handler_metrics.queries),
+        ("shivu_handler_db_seconds_total", "Mongo time spent by handler.", handler_metrics.db_seconds),
+        ("shivu_handler_db_documents_total", "Documents returned to handler.", handler_metrics.documents),
+    )
+    for metric, help_text, values in per_handler:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{handler="{_label(k)}"}} {v}' for k, v in sorted(dict(values).items())]
+
+    per_command = (
+        ("shivu_mongo_commands_total", "Mongo commands by name.", mongo_listener.commands),
+        ("shivu_mongo_command_seconds_total", "Mongo command time by name.", mongo_listener.seconds),
+        ("shivu_mongo_documents_total", "Documents returned by command name.", mongo_listener.documents),
+        ("shivu_mongo_command_failures_total", "Failed Mongo commands by name.", mongo_listener.failures),
+    )
+    for metric, help_text, values in per_command:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{command="{_label(k)}"}} {v}' for k, v in sorted(dict(values).items())]
+
+    for collect in _collectors:
+        lines += collect()
+    return "\n".join(lines) + "\n"
@@ -7,7 +7,8 @@ from datetime import datetime, timedelta
 from html import escape
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CommandHandler, CallbackQueryHandler, CallbackContext
-from shivu import application, user_collection, collection
+from shivu import application, user_collection, collection, LOGGER
+from shivu.events import collection_changed
 
 pay_cooldown = {}
 pending_payments = {}
@@ -116,7 +117,7 @@ async def get_stock_price(symbol):
                     }
                 return None
     except Exception as e:
-        print(f"Stock fetch error for {symbol}: {e}")
+        LOGGER.error(f"Stock fetch error for {symbol}: {e}")
         return None
 
 async def get_user(uid):
@@ -302,7 +303,7 @@ async def check_fd_maturity():
                         except:
                             pass
         except Exception as e:
-            print(f"FD error: {e}")
+            LOGGER.error(f"FD error: {e}")
 
 async def check_loans():
     async with loan_check_lock:
@@ -372,6 +373,7 @@ async def check_loans():
                             else:
                                 await user_collection.update_one({'id': uid}, {'$set': {'characters': chars, 'loan_amount': 0, 'loan_due_date': None, 'loan_type': None, 'permanent_debt': remaining_debt}})
                                 seized.append(f"Remaining debt: {remaining_debt} gold")
+                            collection_changed(uid, seized_chars)
                         else:
                             if has_char_insurance:
                                 char_coverage = await process_insurance_claim(uid, 'char', remaining_debt)
@@ -403,7 +405,7 @@ async def check_loans():
                         pass
 
             except Exception as e:
-                print(f"Loan error: {e}")
+                LOGGER.error(f"Loan error: {e}")
             await asyncio.sleep(3600)
 
 async def deduct_debt():
@@ -440,7 +442,7 @@ async def deduct_debt():
                         pass
                         
         except Exception as e:
-            print(f"Debt error: {e}")
+            LOGGER.error(f"Debt error: {e}")
 
 async def check_insurance():
     while True:
@@ -503,7 +505,7 @@ async def check_insurance():
                             except:
                                 pass
         except Exception as e:
-            print(f"Insurance error: {e}")
+            LOGGER.error(f"Insurance error: {e}")
 
 async def check_recurring_deposits():
     while True:
@@ -542,7 +544,7 @@ async def check_recurring_deposits():
                             {'$set': {'recurring_deposit.active': False}}
                         )
         except Exception as e:
-            print(f"RD error: {e}")
+            LOGGER.error(f"RD error: {e}")
 
 async def process_investments():
     while True:
@@ -581,7 +583,7 @@ async def process_investments():
                 if updated:
                     await user_collection.update_one({'id': uid}, {'$set': {'investments': investments}})
         except Exception as e:
-            print(f"Investment error: {e}")
+            LOGGER.error(f"Investment error: {e}")
 
 async def post_init(app):
     asyncio.create_task(check_loans())
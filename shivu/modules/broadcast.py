@@ -1,10 +1,36 @@
 import asyncio
+import time
+from datetime import datetime
 from telegram import Update
-from telegram.ext import CallbackContext, CommandHandler
-from shivu import application, top_global_groups_collection, user_collection
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.constants import ChatType
+from telegram.ext import CallbackContext, CommandHandler, TypeHandler
+from shivu import application, db, top_global_groups_collection, user_collection, LOGGER
+from shivu.metrics import background_task
+from shivu.ratelimit import TelegramRateLimiter, retry_after_seconds
+from shivu.startup import startup
 
 # --- CONFIGURATION ---
 OWNER_ID = 8420981179
+WORKERS = 20
+BATCH_SIZE = 500
+MAX_RETRIES = 3
+STATUS_INTERVAL = 5
+# Sees every update after the dispatch guard (-20) and lazy placeholders (-10)
+REVIVE_GROUP = -5
+
+broadcast_jobs = db['broadcast_jobs']
+
+# phase -> (collection, id field); groups first, then users
+TARGET_SOURCES = [
+    ("groups", top_global_groups_collection, "group_id"),
+    ("users", user_collection, "id"),
+]
+
+# phase -> ids flagged broadcast_invalid, so a returning chat is un-flagged without a query per update
+flagged = {phase: set() for phase, _, _ in TARGET_SOURCES}
+
+INVALID_ERRORS = ["chat not found", "bot was blocked", "user is deactivated", "forbidden", "chat_write_forbidden", "bot was kicked"]
 
 # --- UNICODE SMALL CAPS STYLE ---
 class Style:
@@ -14,36 +40,218 @@ class Style:
     FAILED = "❌ ꜰᴀɪʟᴇᴅ :"
     INVALID = "🗑️ ɪɴᴠᴀʟɪᴅ :"
     TOTAL = "👥 ᴛᴏᴛᴀʟ ᴛᴀʀɢᴇᴛꜱ :"
+    SPEED = "⚡ ꜱᴘᴇᴇᴅ :"
     LINE = "──────────────────"
+    FOOTERS = {
+        "done": "✨ ʙʀᴏᴀᴅᴄᴀꜱᴛ ᴄᴏᴍᴘʟᴇᴛᴇᴅ!",
+        "cancelled": "🛑 ʙʀᴏᴀᴅᴄᴀꜱᴛ ꜱᴛᴏᴘᴘᴇᴅ.",
+        "interrupted": "⚠️ ʙʀᴏᴀᴅᴄᴀꜱᴛ ɪɴᴛᴇʀʀᴜᴘᴛᴇᴅ, ᴡɪʟʟ ʀᴇꜱᴜᴍᴇ ᴏɴ ʀᴇꜱᴛᴀʀᴛ.",
+    }
 
-async def send_message(context, message, chat_id):
-    try:
-        await context.bot.forward_message(
-            chat_id=chat_id,
-            from_chat_id=message.chat_id,
-            message_id=message.message_id
-        )
-        return {"status": "success", "chat_id": chat_id}
-    except Exception as e:
-        error_text = str(e).lower()
 
-        if "retry after" in error_text or "flood" in error_text:
-            await asyncio.sleep(5) # Flood ke liye thoda zyada wait behtar hai
+class BroadcastEngine:
+    """Streams targets from Mongo through a bounded worker pool behind a token bucket.
+
+    Progress is checkpointed per batch in `broadcast_jobs`, so a restart resumes from
+    the last finished batch instead of starting over.
+    """
+
+    def __init__(self, bot, job):
+        self.bot = bot
+        self.job = job
+        self.limiter = TelegramRateLimiter()
+        self.queue = asyncio.Queue(maxsize=WORKERS * 2)
+        self.invalid = {phase: [] for phase, _, _ in TARGET_SOURCES}
+        self.sent = job.get('sent', 0)
+        self.failed = job.get('failed', 0)
+        self.invalid_count = job.get('invalid', 0)
+        self.session_sent = 0
+        self.started = time.monotonic()
+        self.cancelled = False
+        self.current_phase = None
+        # Stays "interrupted" unless run() reaches its final checkpoint
+        self.outcome = "interrupted"
+
+    async def _send(self, chat_id):
+        for _ in range(MAX_RETRIES):
+            await self.limiter.acquire(chat_id)
             try:
-                await context.bot.forward_message(
+                await self.bot.forward_message(
                     chat_id=chat_id,
-                    from_chat_id=message.chat_id,
-                    message_id=message.message_id
+                    from_chat_id=self.job['from_chat_id'],
+                    message_id=self.job['message_id']
                 )
-                return {"status": "success", "chat_id": chat_id}
-            except:
-                pass
+                return "success"
+            except RetryAfter as e:
+                # Flood wait applies to the whole bot, not only this chat
+                self.limiter.pause(retry_after_seconds(e) + 1)
+            except Forbidden:
+                return "invalid"
+            except BadRequest as e:
+                if any(x in str(e).lower() for x in INVALID_ERRORS):
+                    return "invalid"
+                return "failed"
+            except TelegramError:
+                return "failed"
+            except Exception as e:
+                LOGGER.error(f"Broadcast send to {chat_id} failed: {e}")
+                return "failed"
+        return "failed"
+
+    async def _worker(self):
+        while True:
+            phase, chat_id = await self.queue.get()
+            try:
+                status = await self._send(chat_id)
+                if status == "success":
+                    self.sent += 1
+                    self.session_sent += 1
+                elif status == "invalid":
+                    self.invalid_count += 1
+                    self.invalid[phase].append(chat_id)
+                else:
+                    self.failed += 1
+            finally:
+                self.queue.task_done()
+
+    async def _prune_invalid(self):
+        """Flag dead chats in one update per collection so later broadcasts skip them."""
+        for phase, coll, field in TARGET_SOURCES:
+            ids = self.invalid[phase]
+            if not ids:
+                continue
+            self.invalid[phase] = []
+            flagged[phase].update(ids)
+            try:
+                await coll.update_many({field: {'$in': ids}}, {'$set': {'broadcast_invalid': True}})
+            except Exception as e:
+                LOGGER.error(f"Broadcast prune failed for {phase}: {e}")
+
+    async def _checkpoint(self, **fields):
+        fields.update({
+            'sent': self.sent,
+            'failed': self.failed,
+            'invalid': self.invalid_count,
+            'updated_at': datetime.utcnow(),
+        })
+        self.job.update(fields)
+        await broadcast_jobs.update_one({'_id': self.job['_id']}, {'$set': fields})
+
+    def throughput(self):
+        elapsed = time.monotonic() - self.started
+        return self.session_sent / elapsed if elapsed > 0 else 0.0
+
+    def render(self, outcome=None):
+        processed = self.sent + self.failed + self.invalid_count
+        total = self.job.get('total', 0)
+        footer = Style.FOOTERS[outcome] if outcome else f"🚀 {processed}/{total} ᴘʀᴏᴄᴇꜱꜱᴇᴅ..."
+        return (
+            f"<b>{Style.STATUS}</b>\n"
+            f"{Style.LINE}\n"
+            f"<b>{Style.SENT}</b> <code>{self.sent}</code>\n"
+            f"<b>{Style.FAILED}</b> <code>{self.failed}</code>\n"
+            f"<b>{Style.INVALID}</b> <code>{self.invalid_count}</code>\n"
+            f"<b>{Style.SPEED}</b> <code>{self.throughput():.1f} msg/s</code>\n"
+            f"{Style.LINE}\n"
+            f"<b>{Style.TOTAL}</b> <code>{total}</code>\n"
+            f"{footer}"
+        )
+
+    async def _edit_status(self, outcome=None):
+        chat_id = self.job.get('status_chat_id')
+        message_id = self.job.get('status_message_id')
+        if not chat_id or not message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                chat_id=chat_id, message_id=message_id,
+                text=self.render(outcome), parse_mode='HTML'
+            )
+        except BadRequest:
+            pass
+        except Exception as e:
+            LOGGER.warning(f"Broadcast status update failed: {e}")
+
+    async def _status_loop(self):
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            await self._edit_status()
+
+    async def _run_phase(self, coll, field, phase, last_id):
+        query = {field: {'$ne': None}, 'broadcast_invalid': {'$ne': True}}
+        if last_id is not None:
+            query[field] = {'$gt': last_id}
+        cursor = coll.find(query, {field: 1, '_id': 0}).sort(field, 1).batch_size(BATCH_SIZE)
+
+        batch_last = last_id
+        in_batch = 0
+        async for doc in cursor:
+            if self.cancelled:
+                break
+            chat_id = doc.get(field)
+            if chat_id is None or chat_id == batch_last:
+                continue
+            await self.queue.put((phase, chat_id))
+            batch_last = chat_id
+            in_batch += 1
+            if in_batch >= BATCH_SIZE:
+                await self.queue.join()
+                await self._prune_invalid()
+                await self._checkpoint(phase=phase, last_id=batch_last)
+                in_batch = 0
+
+        await self.queue.join()
+        await self._prune_invalid()
+        if not self.cancelled:
+            await self._checkpoint(phase=phase, last_id=batch_last)
+
+    async def run(self):
+        workers = [asyncio.create_task(self._worker()) for _ in range(WORKERS)]
+        status_task = asyncio.create_task(self._status_loop())
+        try:
+            phases = [p for p, _, _ in TARGET_SOURCES]
+            start = phases.index(self.job.get('phase', phases[0]))
+            for index, (phase, coll, field) in enumerate(TARGET_SOURCES[start:], start):
+                if self.cancelled:
+                    break
+                self.current_phase = phase
+                last_id = self.job.get('last_id') if index == start else None
+                if index != start:
+                    await self._checkpoint(phase=phase, last_id=None)
+                await self._run_phase(coll, field, phase, last_id)
+
+            outcome = 'cancelled' if self.cancelled else 'done'
+            await self._checkpoint(status=outcome, finished_at=datetime.utcnow())
+            self.outcome = outcome
+        except Exception as e:
+            LOGGER.error(f"Broadcast {self.job['_id']} crashed, will resume on restart: {e}")
+        finally:
+            status_task.cancel()
+            for worker in workers:
+                worker.cancel()
+            await self._edit_status(self.outcome)
+
+
+active_engine = None
 
-        if any(x in error_text for x in ["chat not found", "bot was blocked", "user is deactivated", "forbidden", "chat_write_forbidden"]):
-            # Invalid chats ko list se hatane ka status
-            return {"status": "invalid", "chat_id": chat_id}
 
-        return {"status": "failed", "chat_id": chat_id}
+async def _start_engine(bot, job):
+    global active_engine
+    engine = BroadcastEngine(bot, job)
+    active_engine = engine
+    try:
+        await engine.run()
+    finally:
+        if active_engine is engine:
+            active_engine = None
+
+
+async def _count_targets():
+    total = 0
+    for _, coll, field in TARGET_SOURCES:
+        total += await coll.count_documents({field: {'$ne': None}, 'broadcast_invalid': {'$ne': True}})
+    return total
+
 
 async def broadcast(update: Update, context: CallbackContext) -> None:
     if update.effective_user.id != OWNER_ID:
@@ -55,36 +263,88 @@ async def broadcast(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text("<b>❌ ʀᴇᴘʟʏ ᴛᴏ ᴀ ᴍᴇꜱꜱᴀɢᴇ ᴛᴏ ʙʀᴏᴀᴅᴄᴀꜱᴛ.</b>", parse_mode='HTML')
         return
 
-    # Fetch targets
-    all_chats = await top_global_groups_collection.distinct("group_id")
-    all_users = await user_collection.distinct("id")
-    targets = list(set(all_chats + all_users))
+    if active_engine is not None:
+        await update.message.reply_text("<b>⚠️ ᴀ ʙʀᴏᴀᴅᴄᴀꜱᴛ ɪꜱ ᴀʟʀᴇᴀᴅʏ ʀᴜɴɴɪɴɢ.</b>", parse_mode='HTML')
+        return
+
+    total = await _count_targets()
 
     start_msg = await update.message.reply_text(
-        f"<b>{Style.HEADER}</b>\n{Style.LINE}\n🚀 ʙʀᴏᴀᴅᴄᴀꜱᴛɪɴɢ ᴛᴏ {len(targets)} ᴛᴀʀɢᴇᴛꜱ...",
+        f"<b>{Style.HEADER}</b>\n{Style.LINE}\n🚀 ʙʀᴏᴀᴅᴄᴀꜱᴛɪɴɢ ᴛᴏ {total} ᴛᴀʀɢᴇᴛꜱ...",
         parse_mode='HTML'
     )
 
-    tasks = [send_message(context, message_to_broadcast, chat_id) for chat_id in targets]
-    results = await asyncio.gather(*tasks)
-
-    success = sum(1 for r in results if r["status"] == "success")
-    failed = sum(1 for r in results if r["status"] == "failed")
-    invalid = sum(1 for r in results if r["status"] == "invalid")
-
-    # Final result with Small Caps font
-    final_text = (
-        f"<b>{Style.STATUS}</b>\n"
-        f"{Style.LINE}\n"
-        f"<b>{Style.SENT}</b> <code>{success}</code>\n"
-        f"<b>{Style.FAILED}</b> <code>{failed}</code>\n"
-        f"<b>{Style.INVALID}</b> <code>{invalid}</code>\n"
-        f"{Style.LINE}\n"
-        f"<b>{Style.TOTAL}</b> <code>{len(targets)}</code>\n"
-        f"✨ ʙʀᴏᴀᴅᴄᴀꜱᴛ ᴄᴏᴍᴘʟᴇᴛᴇᴅ!"
-    )
+    job = {
+        'from_chat_id': message_to_broadcast.chat_id,
+        'message_id': message_to_broadcast.message_id,
+        'status': 'running',
+        'phase': TARGET_SOURCES[0][0],
+        'last_id': None,
+        'total': total,
+        'sent': 0,
+        'failed': 0,
+        'invalid': 0,
+        'status_chat_id': start_msg.chat_id,
+        'status_message_id': start_msg.message_id,
+        'started_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow(),
+    }
+    result = await broadcast_jobs.insert_one(job)
+    job['_id'] = result.inserted_id
 
-    await start_msg.edit_text(final_text, parse_mode='HTML')
+    background_task(_start_engine(context.bot, job))
+
+
+async def stop_broadcast(update: Update, context: CallbackContext) -> None:
+    if update.effective_user.id != OWNER_ID:
+        await update.message.reply_text("<b>❌ ɴᴏᴛ ᴀᴜᴛʜᴏʀɪᴢᴇᴅ.</b>", parse_mode='HTML')
+        return
+
+    if active_engine is None:
+        await update.message.reply_text("<b>ℹ️ ɴᴏ ʙʀᴏᴀᴅᴄᴀꜱᴛ ɪꜱ ʀᴜɴɴɪɴɢ.</b>", parse_mode='HTML')
+        return
+
+    active_engine.cancelled = True
+    await update.message.reply_text("<b>🛑 ꜱᴛᴏᴘᴘɪɴɢ ʙʀᴏᴀᴅᴄᴀꜱᴛ...</b>", parse_mode='HTML')
+
+
+async def resume_broadcasts(bot):
+    """Pick up a broadcast that was interrupted by a restart."""
+    job = await broadcast_jobs.find_one({'status': 'running'}, sort=[('started_at', -1)])
+    if not job or active_engine is not None:
+        return
+    LOGGER.info(f"Resuming broadcast {job['_id']} from {job.get('phase')} after {job.get('last_id')}")
+    background_task(_start_engine(bot, job))
+
+
+@startup.on_startup("broadcast invalid ids")
+async def load_flagged():
+    for phase, coll, field in TARGET_SOURCES:
+        flagged[phase].update(await coll.distinct(field, {'broadcast_invalid': True}))
+    LOGGER.info(f"Broadcast: {sum(len(ids) for ids in flagged.values())} chats flagged invalid")
+
+
+async def revive_flagged(update: Update, context: CallbackContext) -> None:
+    """Clear `broadcast_invalid` once a flagged chat reaches the bot again.
+
+    A group counts on any update from it. A user only counts from their private
+    chat: group messages still arrive while they have the bot blocked.
+    """
+    chat = update.effective_chat
+    if chat is None:
+        return
+    phase = "users" if chat.type == ChatType.PRIVATE else "groups"
+    if chat.id not in flagged[phase]:
+        return
+    flagged[phase].discard(chat.id)
+    coll, field = next((c, f) for p, c, f in TARGET_SOURCES if p == phase)
+    try:
+        await coll.update_many({field: chat.id, 'broadcast_invalid': True}, {'$unset': {'broadcast_invalid': ""}})
+    except Exception as e:
+        flagged[phase].add(chat.id)
+        LOGGER.error(f"Broadcast revive failed for {chat.id}: {e}")
 
 # Registration
 application.add_handler(CommandHandler("broadcast", broadcast, block=False))
+application.add_handler(CommandHandler("stopbroadcast", stop_broadcast, block=False))
+application.add_handler(TypeHandler(Update, revive_flagged, block=False), group=REVIVE_GROUP)
@@ -2,6 +2,7 @@ from pymongo import ReturnDocument
 from telegram import Update
 from telegram.ext import CommandHandler, CallbackContext
 from shivu import application, OWNER_ID, user_totals_collection, LOGGER, collection
+from shivu.events import settings_changed
 import random
 
 # Import send_image at module level to avoid repeated imports
@@ -67,6 +68,7 @@ async def change_time(update: Update, context: CallbackContext) -> None:
             upsert=True,
             return_document=ReturnDocument.AFTER
         )
+        settings_changed('message_frequency', chat_id=chat.id)
 
         await update.message.reply_text(
             f'✅ Successfully changed character spawn frequency to every {new_frequency} messages.\n\n'
@@ -123,6 +125,7 @@ async def change_time_sudo(update: Update, context: CallbackContext) -> None:
             upsert=True,
             return_document=ReturnDocument.AFTER
         )
+        settings_changed('message_frequency', chat_id=update.effective_chat.id)
 
         await update.message.reply_text(
             f'✅ Successfully changed character spawn frequency to every {new_frequency} messages.\n\n'
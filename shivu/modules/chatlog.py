@@ -1,4 +1,7 @@
 import asyncio
+import itertools
+import json
+import os
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from collections import defaultdict, deque
@@ -9,7 +12,187 @@ from pyrogram.errors import (
     PeerIdInvalid, BadRequest, FloodWait, 
     UserIsBlocked, ChatWriteForbidden
 )
-from shivu import user_collection, shivuu as app, LEAVELOGS, JOINLOGS
+from shivu import shivuu as app, LEAVELOGS, JOINLOGS, LOGGER
+from shivu.auth import auth
+from shivu.metrics import add_collector, background_task
+from shivu.ratelimit import KeyedTokenBucket, GROUP_CHAT_RATE
+from shivu.stats_service import bot_stats
+from shivu.startup import startup
+
+
+MAX_MESSAGE_LENGTH = 4096
+MAX_PENDING_LOGS = 1000
+LOG_LINGER = 1.0
+MERGE_SEPARATOR = "\n\n"
+OVERFLOW_FILE = "log_overflow.jsonl"
+
+
+class LogShipper:
+    """Priority-ordered log delivery that merges entries per chat.
+
+    Entries wait in a bounded priority queue; when it is full, producers wait
+    briefly and then spill to an append-only file that is drained back once the
+    queue has room. Nothing is dropped unless Telegram refuses the chat outright.
+    The counters are shown by /logship and exported to Prometheus.
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING_LOGS, overflow_file: str = OVERFLOW_FILE):
+        self.queue = asyncio.PriorityQueue(maxsize=max_pending)
+        self.overflow_file = overflow_file
+        self.overflow_lock = asyncio.Lock()
+        self.overflow_pending = os.path.exists(overflow_file)
+        self.counters = defaultdict(int)
+        self.chat_limiter = KeyedTokenBucket(GROUP_CHAT_RATE, 3.0, max_keys=100)
+        self._seq = itertools.count()
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = background_task(self._run())
+
+    async def put(self, chat_id: int, text: str, priority: int = 5):
+        self.start()
+        item = (priority, next(self._seq), chat_id, text)
+        self.counters["queued"] += 1
+        try:
+            self.queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            self.counters["backpressure_waits"] += 1
+        try:
+            await asyncio.wait_for(self.queue.put(item), timeout=1.0)
+        except asyncio.TimeoutError:
+            await self._spill([item])
+
+    async def _spill(self, items):
+        async with self.overflow_lock:
+            lines = "".join(
+                json.dumps({"p": p, "c": c, "t": t}, ensure_ascii=False) + "\n"
+                for p, _, c, t in items
+            )
+            await asyncio.to_thread(self._append_file, lines)
+            self.overflow_pending = True
+            self.counters["overflowed"] += len(items)
+
+    def _append_file(self, lines: str):
+        with open(self.overflow_file, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _take_file(self):
+        try:
+            with open(self.overflow_file, encoding="utf-8") as f:
+                lines = f.readlines()
+            os.remove(self.overflow_file)
+            return lines
+        except FileNotFoundError:
+            return []
+
+    async def _restore_overflow(self):
+        """Move spilled entries back into the queue once it has drained."""
+        if not self.overflow_pending or self.queue.qsize() > self.queue.maxsize // 2:
+            return
+        async with self.overflow_lock:
+            lines = await asyncio.to_thread(self._take_file)
+            self.overflow_pending = False
+        leftover = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            item = (entry["p"], next(self._seq), entry["c"], entry["t"])
+            try:
+                self.queue.put_nowait(item)
+                self.counters["restored"] += 1
+            except asyncio.QueueFull:
+                leftover.append(item)
+        if leftover:
+            self.counters["overflowed"] -= len(leftover)
+            await self._spill(leftover)
+
+    def _drain(self, first):
+        items = [first]
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return items
+
+    @staticmethod
+    def merge(items) -> List[tuple]:
+        """Group entries by chat and pack them into messages of at most 4096 chars.
+
+        Returns (priority, chat_id, text) tuples, most urgent first.
+        """
+        by_chat = {}
+        for priority, seq, chat_id, text in sorted(items):
+            by_chat.setdefault(chat_id, []).append((priority, text))
+
+        messages = []
+        for chat_id, entries in by_chat.items():
+            chunk, chunk_priority = "", None
+            for priority, text in entries:
+                text = text[:MAX_MESSAGE_LENGTH]
+                if chunk and len(chunk) + len(MERGE_SEPARATOR) + len(text) > MAX_MESSAGE_LENGTH:
+                    messages.append((chunk_priority, chat_id, chunk))
+                    chunk, chunk_priority = "", None
+                chunk = f"{chunk}{MERGE_SEPARATOR}{text}" if chunk else text
+                if chunk_priority is None:
+                    chunk_priority = priority
+            if chunk:
+                messages.append((chunk_priority, chat_id, chunk))
+        messages.sort(key=lambda m: m[0])
+        return messages
+
+    async def _run(self):
+        while True:
+            try:
+                await self._restore_overflow()
+                try:
+                    first = await asyncio.wait_for(self.queue.get(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    continue
+                # Give a burst (e.g. a raid of joins) a moment to pile up so it merges
+                await asyncio.sleep(LOG_LINGER)
+                items = self._drain(first)
+                messages = self.merge(items)
+                self.counters["merged_entries"] += len(items) - len(messages)
+                for priority, chat_id, text in messages:
+                    await self.chat_limiter.acquire(chat_id)
+                    if await send_log_direct(chat_id, text):
+                        self.counters["sent_messages"] += 1
+                    else:
+                        self.counters["send_failures"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["processor_errors"] += 1
+                LOGGER.error(f"Log shipper error: {e}")
+
+
+    def report(self) -> str:
+        lines = [
+            "<b>📨 Log shipper</b>",
+            "",
+            f"Queue: <code>{self.queue.qsize()}/{self.queue.maxsize}</code> · "
+            f"overflow file: <code>{'yes' if self.overflow_pending else 'no'}</code>",
+        ]
+        lines += [f"<code>{n:>8}</code> {name}" for name, n in sorted(self.counters.items())]
+        return "\n".join(lines)
+
+    def prometheus_lines(self) -> List[str]:
+        lines = [
+            "# HELP shivu_log_shipper_events_total Log shipper events by kind.",
+            "# TYPE shivu_log_shipper_events_total counter",
+        ]
+        lines += [f'shivu_log_shipper_events_total{{event="{name}"}} {n}' for name, n in sorted(self.counters.items())]
+        lines += [
+            "# TYPE shivu_log_shipper_queued gauge",
+            f"shivu_log_shipper_queued {self.queue.qsize()}",
+            "# TYPE shivu_log_shipper_overflow_pending gauge",
+            f"shivu_log_shipper_overflow_pending {int(self.overflow_pending)}",
+        ]
+        return lines
 
 
 class AdvancedBotAnalytics:
@@ -19,9 +202,7 @@ class AdvancedBotAnalytics:
         self.recent_events = deque(maxlen=100)
         self.max_cache_size = max_cache_size
         self.lock = asyncio.Lock()
-        self.log_queue = asyncio.Queue(maxsize=100)
-        self._processor_task = None
-        self._started = False
+        self.shipper = LogShipper()
     
     async def increment(self, key: str):
         async with self.lock:
@@ -47,68 +228,11 @@ class AdvancedBotAnalytics:
             }
     
     async def queue_log(self, chat_id: int, text: str, priority: int = 5):
-        await self.ensure_processor_started()
-        try:
-            print(f"📥 Queuing log: priority={priority}, chat_id={chat_id}")
-            await asyncio.wait_for(
-                self.log_queue.put((priority, chat_id, text)),
-                timeout=1.0
-            )
-            print(f"✓ Log queued successfully")
-        except asyncio.TimeoutError:
-            print(f"⚠️ Log queue full, dropping message for chat {chat_id}")
-        except Exception as e:
-            print(f"❌ Queue error: {e}")
-    
-    async def ensure_processor_started(self):
-        if not self._started:
-            print("⚡ Starting log processor for the first time")
-            self._started = True
-            self._processor_task = asyncio.create_task(self._process_logs())
-            print("✓ Log processor task created")
-    
-    async def _process_logs(self):
-        print("🚀 Log processor started")
-        batch = []
-        batch_timeout = 2.0
-        
-        while True:
-            try:
-                priority, chat_id, text = await asyncio.wait_for(
-                    self.log_queue.get(),
-                    timeout=batch_timeout
-                )
-                print(f"📨 Log received from queue: priority={priority}, chat_id={chat_id}")
-                batch.append((priority, chat_id, text))
-                
-                if len(batch) >= 5:
-                    print(f"📦 Batch size reached (5), sending batch")
-                    await self._send_batch(batch)
-                    batch = []
-                    
-            except asyncio.TimeoutError:
-                if batch:
-                    print(f"⏰ Timeout reached, sending {len(batch)} logs in batch")
-                    await self._send_batch(batch)
-                    batch = []
-            except Exception as e:
-                print(f"❌ Log processor error: {e}")
-    
-    async def _send_batch(self, batch: List[tuple]):
-        print(f"📤 Sending batch of {len(batch)} logs")
-        batch.sort(key=lambda x: x[0])
-        
-        tasks = [
-            send_log_direct(chat_id, text, timeout=5)
-            for _, chat_id, text in batch
-        ]
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        success_count = sum(1 for r in results if r is True)
-        print(f"✓ Batch sent: {success_count}/{len(batch)} successful")
+        await self.shipper.put(chat_id, text, priority)
 
 
 analytics = AdvancedBotAnalytics()
+add_collector(analytics.shipper.prometheus_lines)
 
 
 @asynccontextmanager
@@ -119,7 +243,7 @@ async def log_operation(operation_name: str):
     finally:
         duration = (datetime.now() - start).total_seconds()
         if duration > 3.0:
-            print(f"⚠️ Slow operation: {operation_name} took {duration:.2f}s")
+            LOGGER.warning(f"Slow operation: {operation_name} took {duration:.2f}s")
 
 
 async def verify_log_channel():
@@ -127,20 +251,17 @@ async def verify_log_channel():
     try:
         # Try to get chat info
         chat = await app.get_chat(JOINLOGS)
-        print(f"✅ Log channel verified: {chat.title} (ID: {JOINLOGS})")
+        LOGGER.info(f"Log channel verified: {chat.title} (ID: {JOINLOGS})")
         return True
     except PeerIdInvalid:
-        print(f"❌ Cannot access log channel {JOINLOGS}")
-        print(f"💡 Please add bot to channel and make it admin")
+        LOGGER.error(f"Cannot access log channel {JOINLOGS}, add the bot there as admin")
         return False
     except Exception as e:
-        print(f"⚠️ Error verifying log channel: {e}")
+        LOGGER.warning(f"Error verifying log channel: {e}")
         return False
 
 
 async def send_log_direct(chat_id: int, text: str, timeout: int = 5) -> bool:
-    print(f"🔄 Attempting to send log to chat_id={chat_id}")
-    
     # Handle new supergroup ID format
     if str(chat_id).startswith("-100"):
         try:
@@ -149,33 +270,34 @@ async def send_log_direct(chat_id: int, text: str, timeout: int = 5) -> bool:
             if result:
                 return True
         except PeerIdInvalid:
-            print(f"⚠️ PeerIdInvalid with original ID, trying alternative format")
+            analytics.shipper.counters["peer_id_retries"] += 1
     
     return await attempt_send(chat_id, text, timeout)
 
 
 async def attempt_send(chat_id: int, text: str, timeout: int) -> bool:
-    for attempt in range(2):
+    counters = analytics.shipper.counters
+    for attempt in range(3):
         try:
-            result = await asyncio.wait_for(
+            await asyncio.wait_for(
                 app.send_message(chat_id, text, disable_web_page_preview=True),
                 timeout=timeout
             )
-            print(f"✅ Log sent successfully to {chat_id}")
             return True
         except FloodWait as e:
-            print(f"⏳ FloodWait: {e.value}s on attempt {attempt + 1}")
-            if attempt == 1: return False
-            await asyncio.sleep(min(e.value, 3))
+            # Wait the full flood window instead of giving up on the entry
+            counters["flood_waits"] += 1
+            await asyncio.sleep(e.value)
         except (PeerIdInvalid, UserIsBlocked, ChatWriteForbidden) as e:
-            print(f"🚫 Cannot send to {chat_id}: {type(e).__name__}")
-            print(f"💡 Make sure bot is added to chat {chat_id} with message permissions")
+            counters["unreachable_chat"] += 1
+            LOGGER.warning(f"Cannot send log to {chat_id}: {type(e).__name__}")
             return False
         except Exception as e:
-            print(f"❌ Send error (attempt {attempt + 1}): {type(e).__name__} - {e}")
-            if attempt == 1: return False
+            counters["send_errors"] += 1
+            if attempt == 2:
+                LOGGER.error(f"Failed to send log to {chat_id}: {type(e).__name__} - {e}")
+                return False
             await asyncio.sleep(0.3)
-    print(f"❌ Failed to send log to {chat_id} after 2 attempts")
     return False
 
 
@@ -185,11 +307,8 @@ async def send_log(chat_id: int, text: str, priority: int = 5):
 
 async def get_user_stats() -> Dict[str, Any]:
     try:
-        total = await asyncio.wait_for(
-            user_collection.count_documents({}), 
-            timeout=1.5
-        )
-        return {"total_users": total}
+        snapshot = await bot_stats.get(timeout=1.5)
+        return {"total_users": snapshot["users"]}
     except Exception:
         return {"total_users": "N/A"}
 
@@ -244,8 +363,6 @@ def create_log_message(template: str, data: Dict[str, Any]) -> str:
 
 async def track_bot_start(user_id: int, first_name: str, username: str, is_new: bool):
     try:
-        print(f"🔍 track_bot_start called: user={user_id}, is_new={is_new}")
-        
         await analytics.increment("bot_starts")
         if is_new:
             await analytics.increment("new_users")
@@ -265,18 +382,14 @@ async def track_bot_start(user_id: int, first_name: str, username: str, is_new:
         
         log = create_log_message("˹𝐁ᴏᴛ 𝐒ᴛᴀʀᴛᴇᴅ˼ 🌸\n#BOTSTART", data)
         
-        print(f"📤 Queuing log to JOINLOGS={JOINLOGS}")
         await send_log(JOINLOGS, log, priority=3 if is_new else 5)
-        print(f"✓ Log queued successfully for user {user_id}")
         
         await analytics.add_event("bot_start", {
             "user_id": user_id,
             "is_new": is_new
         })
     except Exception as e:
-        print(f"❌ track_bot_start error: {e}")
-        import traceback
-        traceback.print_exc()
+        LOGGER.exception(f"track_bot_start error: {e}")
 
 
 @app.on_message(filters.new_chat_members, group=1)
@@ -310,7 +423,7 @@ async def on_new_chat(client: Client, message: Message):
                 "member_count": chat_info['member_count']
             })
     except Exception as e:
-        print(f"❌ on_new_chat: {e}")
+        LOGGER.error(f"on_new_chat: {e}")
 
 
 @app.on_message(filters.left_chat_member, group=1)
@@ -346,15 +459,18 @@ async def on_left_chat(client: Client, message: Message):
                 async with analytics.lock:
                     del analytics.chat_cache[message.chat.id]
     except Exception as e:
-        print(f"❌ on_left_chat: {e}")
+        LOGGER.error(f"on_left_chat: {e}")
 
 
-print("✓ Chatlog module loaded successfully")
+@app.on_message(filters.command("logship"))
+async def logship_report(client: Client, message: Message):
+    if not message.from_user or not auth.is_sudo(message.from_user.id):
+        await message.reply_text("❌ You are not authorized to use this command.")
+        return
+    await message.reply_text(analytics.shipper.report())
 
 
 # Verify log channel access on startup
+@startup.on_startup("chatlog channel check")
 async def startup_check():
-    print("🔍 Verifying log channel access...")
-    await verify_log_channel()
-
-asyncio.create_task(startup_check()) if asyncio.get_event_loop().is_running() else None
\ No newline at end of file
+    await verify_log_channel()
\ No newline at end of file
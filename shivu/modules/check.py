@@ -1,7 +1,6 @@
 from html import escape
 from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Tuple
-from cachetools import TTLCache
 
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import CommandHandler, CallbackQueryHandler, ContextTypes
@@ -9,10 +8,12 @@ from telegram.constants import ParseMode
 from telegram.error import BadRequest, TelegramError
 
 from shivu import application, collection, user_collection
+from shivu.cache import CATALOG_TAG, character_tag, create_cache, owners_tag
 
-character_cache = TTLCache(maxsize=2000, ttl=600)
-anime_cache = TTLCache(maxsize=1000, ttl=900)
-user_cache = TTLCache(maxsize=500, ttl=300)
+# Entries are dropped on character/collection events, so the TTLs are only a backstop
+character_cache = create_cache("check_characters", maxsize=2000, ttl=3600)
+anime_cache = create_cache("check_anime", maxsize=1000, ttl=3600)
+user_cache = create_cache("check_owners", maxsize=500, ttl=1800)
 
 USERS_PER_PAGE = 10
 CHARACTERS_PER_PAGE = 15
@@ -87,57 +88,50 @@ class SearchResult:
 class CharacterRepository:
     @staticmethod
     async def get_by_id(character_id: str) -> Optional[CharacterData]:
-        cache_key = f"char_{character_id}"
-        if cache_key in character_cache:
-            return character_cache[cache_key]
-        
-        data = await collection.find_one({'id': character_id})
-        if data:
-            char = CharacterData.from_dict(data)
-            character_cache[cache_key] = char
-            return char
-        return None
+        async def load() -> Optional[CharacterData]:
+            data = await collection.find_one({'id': character_id})
+            return CharacterData.from_dict(data) if data else None
+        
+        return await character_cache.get_or_load(
+            f"char_{character_id}", load, [character_tag(character_id)]
+        )
     
     @staticmethod
     async def find_by_name(name: str) -> List[Dict]:
         cache_key = f"name_{name.lower()}"
-        if cache_key in character_cache:
-            return character_cache[cache_key]
+        if (cached := character_cache.get(cache_key)) is not None:
+            return cached
         
         results = await collection.find({
             'name': {'$regex': name, '$options': 'i'}
         }).to_list(length=None)
         
         if results:
-            character_cache[cache_key] = results
+            character_cache.set(cache_key, results, [CATALOG_TAG])
         return results
     
     @staticmethod
     async def find_by_anime(anime: str) -> List[Dict]:
         cache_key = f"anime_{anime.lower()}"
-        if cache_key in anime_cache:
-            return anime_cache[cache_key]
+        if (cached := anime_cache.get(cache_key)) is not None:
+            return cached
         
         results = await collection.find({
             'anime': {'$regex': anime, '$options': 'i'}
         }).to_list(length=None)
         
         if results:
-            anime_cache[cache_key] = results
+            anime_cache.set(cache_key, results, [CATALOG_TAG])
         return results
     
     @staticmethod
     async def get_global_count(character_id: str) -> int:
-        cache_key = f"count_{character_id}"
-        if cache_key in user_cache:
-            return user_cache[cache_key]
-        
         try:
-            count = await user_collection.count_documents({
-                'characters.id': character_id
-            })
-            user_cache[cache_key] = count
-            return count
+            return await user_cache.get_or_load(
+                f"count_{character_id}",
+                lambda: user_collection.count_documents({'characters.id': character_id}),
+                [owners_tag(character_id)]
+            )
         except:
             return 0
 
@@ -146,8 +140,8 @@ class UserRepository:
     @staticmethod
     async def get_owners(character_id: str) -> List[UserOwnership]:
         cache_key = f"owners_{character_id}"
-        if cache_key in user_cache:
-            return user_cache[cache_key]
+        if (cached := user_cache.get(cache_key)) is not None:
+            return cached
         
         try:
             cursor = user_collection.find(
@@ -163,7 +157,7 @@ class UserRepository:
                     owners.append(owner)
             
             owners.sort(key=lambda x: x.count, reverse=True)
-            user_cache[cache_key] = owners
+            user_cache.set(cache_key, owners, [owners_tag(character_id)])
             return owners
         except:
             return []
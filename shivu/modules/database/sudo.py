@@ -1,5 +1,7 @@
 from shivu import shivuu as app
 from shivu import sudo_users_collection
+from shivu.auth import auth
+from shivu.events import auth_changed
 
 async def get_user_username(user_id):
     user = await app.get_chat(user_id)
@@ -11,13 +13,13 @@ async def add_to_sudo_users(user_id, username, sudo_title):
         {'$set': {'username': username, 'sudo_title': sudo_title}},
         upsert=True
     )
+    auth_changed(user_id=user_id)
 
 async def remove_from_sudo_users(user_id):
-    await sudo_users_collection.delete_one({"id": user_id})
+    await auth.remove_sudo(user_id)
 
 async def is_user_sudo(user_id):
-    user = await sudo_users_collection.find_one({"id": user_id})
-    return bool(user)
+    return auth.is_sudo(user_id)
 
 async def fetch_sudo_users():
     sudo_users = []
@@ -1,10 +1,11 @@
+import math
 import random
 from dataclasses import dataclass
-from datetime import datetime
 from telegram import Update
 from telegram.ext import CommandHandler, CallbackContext
 
 from shivu import application, user_collection
+from shivu.cooldowns import cooldowns
 
 
 @dataclass(frozen=True)
@@ -24,7 +25,6 @@ class ExploreResult:
 
 
 CONFIG = ExploreConfig()
-user_cooldowns = {}
 
 EXPLORE_ACTIONS = [
     "explored a dungeon",
@@ -37,11 +37,8 @@ EXPLORE_ACTIONS = [
 
 
 def check_cooldown(user_id: int) -> int | None:
-    if user_id not in user_cooldowns:
-        return None
-    
-    elapsed = (datetime.utcnow() - user_cooldowns[user_id]).total_seconds()
-    return None if elapsed >= CONFIG.cooldown else int(CONFIG.cooldown - elapsed)
+    # Rounded up: the last fraction of a second is still cooldown
+    return math.ceil(cooldowns.remaining("explore", user_id)) or None
 
 
 async def explore_cmd(update: Update, context: CallbackContext) -> None:
@@ -81,7 +78,7 @@ async def explore_cmd(update: Update, context: CallbackContext) -> None:
             {'$inc': {'balance': reward - CONFIG.fee}}
         )
 
-        user_cooldowns[user_id] = datetime.utcnow()
+        cooldowns.start("explore", user_id, CONFIG.cooldown)
 
         action = random.choice(EXPLORE_ACTIONS)
         await update.message.reply_text(
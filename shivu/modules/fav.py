@@ -2,6 +2,7 @@ from html import escape
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler
 from shivu import application, user_collection, LOGGER
+from shivu.events import settings_changed
 
 async def fav(update: Update, context: CallbackContext) -> None:
     user_id = update.effective_user.id
@@ -88,6 +89,7 @@ async def handle_fav_callback(update: Update, context: CallbackContext) -> None:
                 return
 
             await user_collection.update_one({'id': user_id}, {'$set': {'favorites': character}})
+            settings_changed('favorites', user_id=user_id)
 
             success_caption = (
                 f"<b>Successfully set as favorite</b>\n\n"
@@ -9,8 +9,10 @@ from typing import Dict, Optional
 
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton, Update
 from telegram.ext import CommandHandler, CallbackQueryHandler, MessageHandler, filters, CallbackContext
+from pymongo import ReturnDocument
 
-from shivu import application, user_collection
+from shivu import application, db, lol, user_collection
+from shivu.cooldowns import cooldowns
 
 
 @dataclass(frozen=True)
@@ -63,24 +65,13 @@ class PendingRiddle:
 
 @dataclass
 class GameState:
-    cooldowns: Dict[int, datetime] = field(default_factory=dict)
     riddles: Dict[int, PendingRiddle] = field(default_factory=dict)
-    stats: Dict[int, Dict[str, int]] = field(default_factory=dict)
 
     def check_cooldown(self, user_id: int) -> float | None:
-        if last := self.cooldowns.get(user_id):
-            elapsed = (datetime.utcnow() - last).total_seconds()
-            if elapsed < CONFIG.cooldown:
-                return CONFIG.cooldown - elapsed
-        return None
+        return cooldowns.remaining("games", user_id) or None
 
     def set_cooldown(self, user_id: int):
-        self.cooldowns[user_id] = datetime.utcnow()
-
-    def record_play(self, user_id: int, game: str):
-        if user_id not in self.stats:
-            self.stats[user_id] = {}
-        self.stats[user_id][game] = self.stats[user_id].get(game, 0) + 1
+        cooldowns.start("games", user_id, CONFIG.cooldown)
 
 
 CONFIG = GameConfig()
@@ -102,47 +93,61 @@ GAME_NAMES = {
 }
 
 
+# Everything the games read; never the characters array
+PROFILE_FIELDS = {
+    '_id': 0, 'balance': 1, 'tokens': 1, 'first_name': 1,
+    'username': 1, 'game_stats': 1, 'last_daily_claim': 1
+}
+
+
 class UserDB:
     @staticmethod
     async def get(user_id: int) -> dict | None:
         try:
-            return await user_collection.find_one({'id': user_id})
+            return await user_collection.find_one({'id': user_id}, PROFILE_FIELDS)
         except Exception:
             return None
 
     @staticmethod
-    async def ensure(user_id: int, first_name: str = None, username: str = None) -> dict:
-        if doc := await UserDB.get(user_id):
-            updates = {}
-            if username and username != doc.get('username'):
-                updates['username'] = username
-            if first_name and first_name != doc.get('first_name'):
-                updates['first_name'] = first_name
-            if updates:
-                await user_collection.update_one({'id': user_id}, {'$set': updates})
-            return doc
-
-        new_user = {
-            'id': user_id,
-            'first_name': first_name or 'Unknown',
-            'username': username,
-            'balance': 0,
-            'tokens': 0,
-            'characters': [],
-            'created_at': datetime.utcnow()
-        }
-        await user_collection.insert_one(new_user)
-        return new_user
-
-    @staticmethod
-    async def change_balance(user_id: int, delta: int) -> dict | None:
-        await user_collection.update_one({'id': user_id}, {'$inc': {'balance': delta}}, upsert=True)
-        return await UserDB.get(user_id)
+    async def settle(user_id: int, stake: int = 0, payout: int = 0, tokens: int = 0, game: str = None,
+                     first_name: str = None, username: str = None, extra: dict = None,
+                     collection=None) -> dict | None:
+        """Apply a whole game in one find_one_and_update and return the new profile.
+
+        With a stake the update only matches while the balance covers it, so
+        None means insufficient funds. Without one the user is created if needed.
+        `collection` defaults to user_collection (the benchmark passes a scratch one).
+        """
+        query = {'id': user_id}
+        if stake > 0:
+            query['balance'] = {'$gte': stake}
+
+        inc = {'balance': payout - stake, 'tokens': tokens}
+        if game:
+            inc[f'game_stats.{game}'] = 1
+        updates = {k: v for k, v in (('first_name', first_name), ('username', username)) if v}
+        updates.update(extra or {})
+
+        update = {'$inc': inc}
+        if updates:
+            update['$set'] = updates
+        if stake <= 0:
+            on_insert = {'characters': [], 'created_at': datetime.utcnow()}
+            if 'first_name' not in updates:
+                on_insert['first_name'] = 'Unknown'
+            update['$setOnInsert'] = on_insert
+
+        collection = user_collection if collection is None else collection
+        return await collection.find_one_and_update(
+            query, update,
+            projection=PROFILE_FIELDS,
+            return_document=ReturnDocument.AFTER,
+            upsert=stake <= 0
+        )
 
     @staticmethod
-    async def change_tokens(user_id: int, delta: int) -> dict | None:
-        await user_collection.update_one({'id': user_id}, {'$inc': {'tokens': delta}}, upsert=True)
-        return await UserDB.get(user_id)
+    async def ensure(user_id: int, first_name: str = None, username: str = None) -> dict:
+        return await UserDB.settle(user_id, first_name=first_name, username=username)
 
 
 class GameUI:
@@ -261,34 +266,30 @@ async def check_cooldown(update: Update, user_id: int) -> bool:
     return False
 
 
-async def validate_amount(update: Update, amount: int, user_id: int) -> bool:
+async def validate_amount(update: Update, amount: int) -> bool:
     if amount <= 0:
         await reply(update, "<b>❌ Invalid Amount</b>\n<blockquote>Amount must be positive</blockquote>")
         return False
-    if not (user := await UserDB.get(user_id)) or user.get('balance', 0) < amount:
-        await reply(update, "<b>💰 Insufficient Balance</b>\n<blockquote>You don't have enough coins</blockquote>")
-        return False
     return True
 
 
 async def process_game(update: Update, context: CallbackContext, game_type: GameType, 
                       amount: int, result: GameResult, extra: str = ""):
-    user_id = update.effective_user.id
-    user = await UserDB.get(user_id)
-    
-    if result.won and result.amount_changed > 0:
-        await UserDB.change_balance(user_id, result.amount_changed)
-    if result.tokens_gained > 0:
-        await UserDB.change_tokens(user_id, result.tokens_gained)
+    user = update.effective_user
+    payout = result.amount_changed if result.won and result.amount_changed > 0 else 0
+    profile = await UserDB.settle(
+        user.id, amount, payout, max(result.tokens_gained, 0), game_type.value,
+        user.first_name, user.username
+    )
+    if not profile:
+        await reply(update, "<b>💰 Insufficient Balance</b>\n<blockquote>You don't have enough coins</blockquote>")
+        return
     
-    game_state.record_play(user_id, game_type.value)
-    game_state.set_cooldown(user_id)
+    game_state.set_cooldown(user.id)
     
     emoji = GAME_EMOJIS.get(game_type, "🎮")
-    msg = GameUI.format_result(result, emoji, user.get('first_name', 'Player'))
-    
-    updated = await UserDB.get(user_id)
-    msg += f"\n<b>Balance:</b> <code>{updated.get('balance', 0):,}</code> coins"
+    msg = GameUI.format_result(result, emoji, profile.get('first_name', 'Player'))
+    msg += f"\n<b>Balance:</b> <code>{profile.get('balance', 0):,}</code> coins"
     
     await reply(update, msg, GameUI.play_again(game_type.value, extra))
 
@@ -309,11 +310,9 @@ async def sbet(update: Update, context: CallbackContext):
         await reply(update, "<b>❌ Invalid Choice</b>\n<blockquote>Must be 'heads' or 'tails'</blockquote>")
         return
     
-    await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
-    if not await validate_amount(update, amount, user_id):
+    if not await validate_amount(update, amount):
         return
     
-    await UserDB.change_balance(user_id, -amount)
     result = GameLogic.coinflip(guess, amount)
     await process_game(update, context, GameType.COINFLIP, amount, result, f"{amount}:{guess}")
 
@@ -334,11 +333,9 @@ async def roll_cmd(update: Update, context: CallbackContext):
         await reply(update, "<b>❌ Invalid Choice</b>\n<blockquote>Must be 'odd' or 'even'</blockquote>")
         return
     
-    await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
-    if not await validate_amount(update, amount, user_id):
+    if not await validate_amount(update, amount):
         return
     
-    await UserDB.change_balance(user_id, -amount)
     result = GameLogic.dice_roll(choice, amount)
     await process_game(update, context, GameType.DICE, amount, result, f"{amount}:{choice}")
 
@@ -359,11 +356,9 @@ async def gamble(update: Update, context: CallbackContext):
         return
     
     pick = 'l' if pick.startswith('l') else 'r'
-    await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
-    if not await validate_amount(update, amount, user_id):
+    if not await validate_amount(update, amount):
         return
     
-    await UserDB.change_balance(user_id, -amount)
     result = GameLogic.gamble(pick, amount)
     await process_game(update, context, GameType.GAMBLE, amount, result, f"{amount}:{pick}")
 
@@ -379,11 +374,9 @@ async def basket(update: Update, context: CallbackContext):
         await reply(update, "<b>📖 Usage</b>\n<blockquote><code>/basket &lt;amount&gt;</code>\n<i>Example: /basket 75</i></blockquote>")
         return
     
-    await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
-    if not await validate_amount(update, amount, user_id):
+    if not await validate_amount(update, amount):
         return
     
-    await UserDB.change_balance(user_id, -amount)
     result = GameLogic.basketball(amount)
     await process_game(update, context, GameType.BASKET, amount, result, str(amount))
 
@@ -399,11 +392,9 @@ async def dart(update: Update, context: CallbackContext):
         await reply(update, "<b>📖 Usage</b>\n<blockquote><code>/dart &lt;amount&gt;</code>\n<i>Example: /dart 50</i></blockquote>")
         return
     
-    await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
-    if not await validate_amount(update, amount, user_id):
+    if not await validate_amount(update, amount):
         return
     
-    await UserDB.change_balance(user_id, -amount)
     result = GameLogic.darts(amount)
     await process_game(update, context, GameType.DART, amount, result, str(amount))
 
@@ -413,11 +404,9 @@ async def stour(update: Update, context: CallbackContext):
     if await check_cooldown(update, user_id):
         return
     
-    await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
-    if not await validate_amount(update, CONFIG.stour_entry_fee, user_id):
+    if not await validate_amount(update, CONFIG.stour_entry_fee):
         return
     
-    await UserDB.change_balance(user_id, -CONFIG.stour_entry_fee)
     result = GameLogic.contract()
     await process_game(update, context, GameType.CONTRACT, CONFIG.stour_entry_fee, result)
 
@@ -435,7 +424,9 @@ async def riddle(update: Update, context: CallbackContext):
     riddle_data = PendingRiddle(answer, time.time() + CONFIG.riddle_timeout, sent.message_id, update.effective_chat.id, question)
     game_state.riddles[user_id] = riddle_data
     game_state.set_cooldown(user_id)
-    game_state.record_play(user_id, GameType.RIDDLE.value)
+    # A riddle counts as played when it is asked, whatever the answer
+    await UserDB.settle(user_id, game=GameType.RIDDLE.value,
+                        first_name=update.effective_user.first_name, username=update.effective_user.username)
     
     async def expire():
         await asyncio.sleep(CONFIG.riddle_timeout)
@@ -476,8 +467,7 @@ async def riddle_answer(update: Update, context: CallbackContext):
     
     # Process answer
     if text == pending.answer:
-        await UserDB.change_tokens(user_id, pending.reward)
-        user = await UserDB.get(user_id)
+        user = await UserDB.settle(user_id, tokens=pending.reward)
         await update.message.reply_text(
             f"<b>✅ Correct</b>\n<blockquote>Earned <b>{pending.reward}</b> token(s)\nTotal: <code>{user.get('tokens', 0)}</code></blockquote>",
             parse_mode="HTML"
@@ -499,9 +489,8 @@ async def games_menu(update: Update, context: CallbackContext):
 
 async def game_stats(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
-    await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
-    user = await UserDB.get(user_id)
-    stats = game_state.stats.get(user_id, {})
+    user = await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
+    stats = user.get('game_stats', {})
     
     if not stats:
         await reply(update, "<b>📊 No Statistics</b>\n<blockquote>You haven't played yet\nUse /games to start</blockquote>")
@@ -543,8 +532,7 @@ async def leaderboard(update: Update, context: CallbackContext):
 
 async def daily_bonus(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
-    await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
-    user = await UserDB.get(user_id)
+    user = await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
     
     if last := user.get('last_daily_claim'):
         if (elapsed := datetime.utcnow() - last) < timedelta(hours=24):
@@ -553,11 +541,7 @@ async def daily_bonus(update: Update, context: CallbackContext):
             return
     
     coins, tokens = random.randint(50, 150), random.randint(0, 2)
-    await UserDB.change_balance(user_id, coins)
-    if tokens > 0:
-        await UserDB.change_tokens(user_id, tokens)
-    
-    await user_collection.update_one({'id': user_id}, {'$set': {'last_daily_claim': datetime.utcnow()}})
+    await UserDB.settle(user_id, payout=coins, tokens=tokens, extra={'last_daily_claim': datetime.utcnow()})
     
     text = f"<b>🎁 Daily Bonus</b>\n<blockquote expandable>Coins: <code>+{coins}</code>"
     if tokens > 0:
@@ -568,8 +552,7 @@ async def daily_bonus(update: Update, context: CallbackContext):
 
 async def tokens_cmd(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
-    await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
-    user = await UserDB.get(user_id)
+    user = await UserDB.ensure(user_id, update.effective_user.first_name, update.effective_user.username)
     
     text = f"<b>💎 Your Tokens</b>\n<b>Player:</b> {update.effective_user.first_name}\n<blockquote>Tokens: <code>{user.get('tokens', 0)}</code>\nBalance: <code>{user.get('balance', 0):,}</code> coins</blockquote>\n<b>How to Earn:</b>\n<blockquote expandable>🧩 Riddles - Solve math (/riddle)\n🤝 Contracts - Complete missions (/stour)\n🎁 Daily - Claim every 24h (/daily)</blockquote>"
     await reply(update, text)
@@ -629,4 +612,59 @@ application.add_handler(CommandHandler("leaderboard", leaderboard, block=False))
 application.add_handler(CommandHandler("daily", daily_bonus, block=False))
 application.add_handler(CommandHandler("helpgames", help_games, block=False))
 application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, riddle_answer, block=False))
-application.add_handler(CallbackQueryHandler(games_callback, pattern=r"^games:", block=False))
\ No newline at end of file
+application.add_handler(CallbackQueryHandler(games_callback, pattern=r"^games:", block=False))
+
+async def benchmark(games: int = 2000, players: int = 50, concurrency: int = 50, owned: int = 1000) -> None:
+    """Coin flips per second: the old read-modify-write sequence against UserDB.settle, on a scratch database."""
+    scratch = lol[f"{db.name}_games_bench"]
+    users = scratch["users"]
+    characters = [{'id': str(i), 'name': f'Character {i}', 'anime': 'Bench', 'rarity': '🟢 Common'} for i in range(owned)]
+    stake = 10
+
+    async def old_flip(uid: int) -> None:
+        # ensure, validate, debit + re-read, process_game read, credit + re-read, final read
+        await users.find_one({'id': uid})
+        await users.find_one({'id': uid})
+        await users.update_one({'id': uid}, {'$inc': {'balance': -stake}}, upsert=True)
+        await users.find_one({'id': uid})
+        await users.find_one({'id': uid})
+        result = GameLogic.coinflip(random.choice(['heads', 'tails']), stake)
+        if result.won and result.amount_changed > 0:
+            await users.update_one({'id': uid}, {'$inc': {'balance': result.amount_changed}}, upsert=True)
+            await users.find_one({'id': uid})
+        await users.find_one({'id': uid})
+
+    async def new_flip(uid: int) -> None:
+        result = GameLogic.coinflip(random.choice(['heads', 'tails']), stake)
+        payout = result.amount_changed if result.won and result.amount_changed > 0 else 0
+        assert await UserDB.settle(uid, stake, payout, 0, GameType.COINFLIP.value, 'Bench', None, collection=users)
+
+    async def run(label: str, flip) -> None:
+        await users.delete_many({})
+        await users.insert_many([
+            {'id': uid, 'first_name': 'Bench', 'balance': games * stake, 'tokens': 0, 'characters': characters}
+            for uid in range(players)
+        ])
+        queue = asyncio.Queue()
+        for i in range(games):
+            queue.put_nowait(i % players)
+
+        async def worker() -> None:
+            while not queue.empty():
+                await flip(queue.get_nowait())
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        print(f"{label:<28} {games / elapsed:9.0f} games/s  ({elapsed * 1000 / games * concurrency:6.1f} ms per game)")
+
+    print(f"{games:,} coin flips by {players} players owning {owned:,} characters, {concurrency} at a time")
+    try:
+        await run("old: 7-9 round trips", old_flip)
+        await run("settle: 1 find_one_and_update", new_flip)
+    finally:
+        await lol.drop_database(scratch.name)
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
@@ -4,6 +4,9 @@ from datetime import datetime, timezone
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton, Update
 from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler
 from shivu import LOGGER, application, user_collection, collection
+from shivu.startup import startup
+from shivu.metrics import background_task
+from shivu.events import collection_changed
 
 # --- CONFIGURATION ---
 LOG_CHANNEL_ID = -1002900862232 
@@ -155,6 +158,8 @@ async def atomic_transfer_character(sender_id: int, receiver_id: int, character:
                 LOGGER.info(f"Created new document for receiver {receiver_id} with character {character['id']}")
             
             LOGGER.info(f"Character {character['id']} successfully transferred to receiver {receiver_id}")
+            collection_changed(sender_id, [character['id']])
+            collection_changed(receiver_id, [character['id']])
             return True
             
         except Exception as push_error:
@@ -450,18 +455,7 @@ async def cleanup_stale_gifts():
         await asyncio.sleep(300)  # Run every 5 minutes
 
 # Start background cleanup when bot starts
+@startup.on_startup("gift cleanup")
 async def on_bot_start():
-    asyncio.create_task(cleanup_stale_gifts())
-    LOGGER.info("Gift system cleanup task started")
     LOGGER.info("Gift system initialized with maximum inventory size: %s", MAX_INVENTORY_SIZE)
-
-# Initialize the cleanup task
-try:
-    # Check if we're in an async context
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
-        asyncio.create_task(on_bot_start())
-    else:
-        loop.run_until_complete(on_bot_start())
-except Exception as e:
-    LOGGER.error(f"Failed to start gift cleanup task: {e}")
\ No newline at end of file
+    background_task(cleanup_stale_gifts())
\ No newline at end of file
@@ -5,6 +5,7 @@ import html
 
 from shivu import collection, user_collection, application
 from shivu.modules.database.sudo import is_user_sudo
+from shivu.events import collection_changed
 
 # --- CONFIGURATION ---
 LOG_GROUP_ID = -1003110990230 
@@ -27,6 +28,7 @@ async def give_character(receiver_id: int, character_id: str) -> CharacterGiftRe
         {'id': receiver_id},
         {'$push': {'characters': character}}
     )
+    collection_changed(receiver_id, [character_id])
     
     caption = (
         f"🎁 <b>Character Added!</b>\n\n"
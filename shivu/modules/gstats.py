@@ -14,6 +14,7 @@ from shivu import (
     pm_users,
     application
 )
+from shivu.stats_service import bot_stats
 
 LOGGER = logging.getLogger(__name__)
 
@@ -167,12 +168,14 @@ async def gstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        # Try to get basic stats
-        total_users = await user_collection.count_documents({})
-        total_chats = await top_global_groups_collection.count_documents({})
-        banned_users_count = await BANNED_USERS.count_documents({})
-        banned_groups_count = await banned_groups_collection.count_documents({})
-        pm_users_count = await pm_users.count_documents({})
+        # Served from the in-memory stats service
+        snapshot = await bot_stats.get()
+        total_users = snapshot['users']
+        total_chats = snapshot['groups']
+        banned_users_count = snapshot['banned_users']
+        banned_groups_count = snapshot['banned_groups']
+        pm_users_count = snapshot['pm_users']
+        refreshed_at = snapshot['totals_refreshed_at'] or datetime.now()
         
         stats_text = (
             f"📊 <b>Global Statistics</b>\n"
@@ -182,7 +185,7 @@ async def gstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"📩 <b>PM Users:</b> {pm_users_count:,}\n"
             f"⛔ <b>Banned Users:</b> {banned_users_count:,}\n"
             f"⛔ <b>Banned Groups:</b> {banned_groups_count:,}\n\n"
-            f"🕒 <i>Updated: {datetime.now().strftime('%Y-%m-%d %H:%M')}</i>"
+            f"🕒 <i>Updated: {refreshed_at.strftime('%Y-%m-%d %H:%M')}</i>"
         )
         
         await update.message.reply_text(stats_text, parse_mode=ParseMode.HTML)
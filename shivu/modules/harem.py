@@ -6,11 +6,20 @@ from html import escape
 from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Any
 from enum import Enum
+from collections import Counter
 import random
 import math
+import time
 import traceback
 from shivu import db, application
-from shivu.modules.hstyle import get_user_style_template, get_user_display_options
+from shivu.cache import CATALOG_TAG, create_cache, user_tag
+from shivu.events import settings_changed
+from shivu.modules.hstyle import DEFAULT_STYLES, get_user_harem_settings, get_user_display_options
+
+# One prepared view per user; dropped when their collection, style, mode or favorite changes
+harem_views = create_cache("harem_views", maxsize=2000, ttl=600)
+# Catalog size per anime, for the "{user_count}/{total_count}" headers
+anime_totals = create_cache("harem_anime_totals", maxsize=20000, ttl=3600)
 
 
 class RarityType(Enum):
@@ -202,7 +211,9 @@ class HaremMessageBuilder:
         self.options = display_options
         self.user_name = user_name
 
-    def build_message(self, characters: List[Character], anime_counts: Dict[str, int]) -> str:
+    def build_message(self, characters: List[Character], anime_counts: Dict[str, int],
+                      character_counts: Optional[Dict[str, int]] = None,
+                      user_anime_counts: Optional[Dict[str, int]] = None) -> str:
         message = self.style['header'].format(
             user_name=escape(self.user_name),
             page=self.page + 1,
@@ -210,11 +221,14 @@ class HaremMessageBuilder:
         )
 
         grouped = self.collection.group_by_anime(characters)
-        character_counts = self.collection.count_by_id(self.collection.characters)
+        if character_counts is None:
+            character_counts = self.collection.count_by_id(self.collection.characters)
+        if user_anime_counts is None:
+            user_anime_counts = Counter(c.anime for c in self.collection.characters)
         included = set()
 
         for anime, chars in grouped.items():
-            user_anime_count = len([c for c in self.collection.characters if c.anime == anime])
+            user_anime_count = user_anime_counts.get(anime, 0)
             total_anime_count = anime_counts.get(anime, 0)
 
             message += self.style['anime_header'].format(
@@ -266,6 +280,50 @@ class HaremMessageBuilder:
         return char_line
 
 
+class HaremView:
+    """
+    A user's harem prepared once per session: the filtered characters in page
+    order, the copy and per-anime counts over the whole collection, the style
+    and the display options. Pages are rendered from slices of that and kept,
+    and the last text sent to each message is remembered so a page press that
+    would not change it skips the edit.
+    """
+
+    def __init__(self, collection: UserCollection, style: Dict, options: DisplayOptions,
+                 per_page: int):
+        self.collection = collection
+        self.style = style
+        self.options = options
+        self.per_page = per_page
+        self.characters = sorted(collection.get_filtered_characters(), key=lambda c: (c.anime, c.id))
+        self.total_pages = math.ceil(len(self.characters) / per_page)
+        self.character_counts = collection.count_by_id(collection.characters)
+        self.user_anime_counts = Counter(c.anime for c in collection.characters)
+        self._pages: Dict[tuple, str] = {}
+        # message id -> text last sent there
+        self.sent: Dict[int, str] = {}
+
+    def page_slice(self, page: int) -> List[Character]:
+        start = page * self.per_page
+        return self.characters[start:start + self.per_page]
+
+    def cached_page(self, page: int, user_name: str) -> Optional[str]:
+        return self._pages.get((page, user_name))
+
+    def render(self, page: int, user_name: str, anime_counts: Dict[str, int]) -> str:
+        key = (page, user_name)
+        text = self._pages.get(key)
+        if text is None:
+            builder = HaremMessageBuilder(
+                self.collection, page, self.total_pages, self.style, self.options, user_name
+            )
+            text = builder.build_message(
+                self.page_slice(page), anime_counts, self.character_counts, self.user_anime_counts
+            )
+            self._pages[key] = text
+        return text
+
+
 class HaremHandler:
     CHARACTERS_PER_PAGE = 10
 
@@ -307,29 +365,65 @@ class HaremHandler:
 
     async def get_anime_counts(self, anime_list: List[str]) -> Dict[str, int]:
         counts = {}
+        missing = []
+        for anime in anime_list:
+            total = anime_totals.get(anime)
+            if total is None:
+                missing.append(anime)
+            else:
+                counts[anime] = total
+        if not missing:
+            return counts
         try:
-            for anime in anime_list:
-                counts[anime] = await self.collection_db.count_documents({"anime": anime})
+            pipeline = [
+                {"$match": {"anime": {"$in": missing}}},
+                {"$group": {"_id": "$anime", "total": {"$sum": 1}}},
+            ]
+            found = {r["_id"]: r["total"] async for r in self.collection_db.aggregate(pipeline)}
+            for anime in missing:
+                counts[anime] = found.get(anime, 0)
+                anime_totals.set(anime, counts[anime], tags=[CATALOG_TAG])
         except Exception as e:
             print(f"Error getting anime counts: {e}")
         return counts
 
+    async def get_view(self, user_id: int) -> Optional[HaremView]:
+        view = harem_views.get(user_id)
+        if view is not None:
+            return view
+        collection = await self.load_user_collection(user_id)
+        if not collection:
+            return None
+        style, options_dict = await get_user_harem_settings(user_id)
+        options = DisplayOptions(**options_dict) if options_dict else DisplayOptions()
+        view = HaremView(collection, style, options, self.CHARACTERS_PER_PAGE)
+        harem_views.set(user_id, view, tags=[user_tag(user_id)])
+        return view
+
+    async def render_page(self, view: HaremView, page: int, user_name: str) -> str:
+        text = view.cached_page(page, user_name)
+        if text is not None:
+            return text
+        anime_counts = await self.get_anime_counts(list({c.anime for c in view.page_slice(page)}))
+        return view.render(page, user_name, anime_counts)
+
     async def show_harem(self, update: Update, context: CallbackContext,
                         page: int = 0, edit: bool = False):
         try:
             user_id = update.effective_user.id
             message = update.message or update.callback_query.message
 
-            collection = await self.load_user_collection(user_id)
-            if not collection:
+            view = await self.get_view(user_id)
+            if not view:
                 await message.reply_text("⚠️ You need to grab a character first using /grab command!")
                 return
 
+            collection = view.collection
             if not collection.characters:
                 await message.reply_text("📭 You don't have any characters yet! Use /grab to catch some.")
                 return
 
-            filtered_chars = collection.get_filtered_characters()
+            filtered_chars = view.characters
             if not filtered_chars:
                 rarity_name = RarityType.get_display(collection.filter_mode) or "Unknown"
                 await message.reply_text(
@@ -338,28 +432,16 @@ class HaremHandler:
                 )
                 return
 
-            filtered_chars.sort(key=lambda x: (x.anime, x.id))
-            total_pages = math.ceil(len(filtered_chars) / self.CHARACTERS_PER_PAGE)
-
+            total_pages = view.total_pages
             if page < 0 or page >= total_pages:
                 page = 0
 
-            start_idx = page * self.CHARACTERS_PER_PAGE
-            end_idx = start_idx + self.CHARACTERS_PER_PAGE
-            current_chars = filtered_chars[start_idx:end_idx]
-
-            style_template = await get_user_style_template(user_id)
-            display_options_dict = await get_user_display_options(user_id)
-            display_options = DisplayOptions(**display_options_dict) if display_options_dict else DisplayOptions()
+            display_options = view.options
+            harem_message = await self.render_page(view, page, update.effective_user.first_name)
 
-            anime_list = list(set(char.anime for char in current_chars))
-            anime_counts = await self.get_anime_counts(anime_list)
-
-            builder = HaremMessageBuilder(
-                collection, page, total_pages, style_template,
-                display_options, update.effective_user.first_name
-            )
-            harem_message = builder.build_message(current_chars, anime_counts)
+            # Same page text means same buttons too; nothing to edit
+            if edit and view.sent.get(message.message_id) == harem_message:
+                return
 
             keyboard = [
                 [InlineKeyboardButton(
@@ -394,6 +476,7 @@ class HaremHandler:
                 display_media = random_char.img_url
                 is_video_display = random_char.is_video or MediaHelper.is_video_url(display_media)
 
+            sent = None
             if display_media:
                 if edit:
                     try:
@@ -402,14 +485,15 @@ class HaremHandler:
                             reply_markup=reply_markup,
                             parse_mode='HTML'
                         )
+                        sent = message
                     except Exception as e:
                         print(f"Edit failed: {e}")
-                        await MediaHelper.send_media_message(
+                        sent = await MediaHelper.send_media_message(
                             message, display_media, harem_message, reply_markup,
                             is_video_display, display_options
                         )
                 else:
-                    await MediaHelper.send_media_message(
+                    sent = await MediaHelper.send_media_message(
                         message, display_media, harem_message, reply_markup,
                         is_video_display, display_options
                     )
@@ -420,12 +504,15 @@ class HaremHandler:
                         reply_markup=reply_markup,
                         parse_mode='HTML'
                     )
+                    sent = message
                 else:
-                    await message.reply_text(
+                    sent = await message.reply_text(
                         text=harem_message,
                         reply_markup=reply_markup,
                         parse_mode='HTML'
                     )
+            if sent is not None:
+                view.sent[sent.message_id] = harem_message
         except Exception as e:
             print(f"Error in show_harem: {e}")
             traceback.print_exc()
@@ -547,6 +634,7 @@ class ModeHandler:
                 {'$set': {'smode': mode}},
                 upsert=True
             )
+            settings_changed('smode', user_id=user_id)
         except Exception as e:
             print(f"Error setting mode: {e}")
             traceback.print_exc()
@@ -715,6 +803,7 @@ class UnfavHandler:
                     {'id': user_id},
                     {'$unset': {'favorites': ""}}
                 )
+                settings_changed('favorites', user_id=user_id)
 
                 if result.matched_count == 0:
                     await query.answer("❌ ғᴀɪʟᴇᴅ ᴛᴏ ᴜᴘᴅᴀᴛᴇ!", show_alert=True)
@@ -839,4 +928,55 @@ application.add_handler(CommandHandler("smode", smode_command, block=False))
 application.add_handler(CommandHandler("unfav", unfav_command, block=False))
 application.add_handler(CallbackQueryHandler(harem_page_callback, pattern='^harem_page:', block=False))
 application.add_handler(CallbackQueryHandler(mode_callback, pattern='^harem_mode_', block=False))
-application.add_handler(CallbackQueryHandler(unfav_callback, pattern="^harem_unfav_", block=False))
\ No newline at end of file
+application.add_handler(CallbackQueryHandler(unfav_callback, pattern="^harem_unfav_", block=False))
+
+def benchmark(characters: int = 20_000, animes: int = 800) -> None:
+    """Render every page of a synthetic harem the old way (per page) and through HaremView."""
+    rng = random.Random(7)
+    rarities = [r.value[1] for r in RarityType if r.value[1]]
+    owned = [
+        Character(id=str(rng.randrange(characters)), name=f"Character {i}",
+                  anime=f"Anime {rng.randrange(animes)}", rarity=rng.choice(rarities))
+        for i in range(characters)
+    ]
+    collection = UserCollection(user_id=1, characters=owned, favorite=owned[0])
+    totals = {f"Anime {a}": 40 for a in range(animes)}
+    style, options, per_page = DEFAULT_STYLES['classic'], DisplayOptions(), HaremHandler.CHARACTERS_PER_PAGE
+
+    def old_page(page: int) -> str:
+        chars = collection.get_filtered_characters()
+        chars.sort(key=lambda x: (x.anime, x.id))
+        total_pages = math.ceil(len(chars) / per_page)
+        current = chars[page * per_page:(page + 1) * per_page]
+        anime_counts = {a: totals[a] for a in {c.anime for c in current}}
+        builder = HaremMessageBuilder(collection, page, total_pages, style, options, "Bench")
+        return builder.build_message(current, anime_counts)
+
+    pages = math.ceil(characters / per_page)
+    sample = range(0, pages, max(1, pages // 50))
+
+    start = time.perf_counter()
+    before = [old_page(p) for p in sample]
+    old_per_page = (time.perf_counter() - start) / len(sample)
+
+    start = time.perf_counter()
+    view = HaremView(collection, style, options, per_page)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    after = [view.render(p, "Bench", totals) for p in range(pages)]
+    new_per_page = (time.perf_counter() - start) / pages
+    start = time.perf_counter()
+    for p in range(pages):
+        view.render(p, "Bench", totals)
+    cached_per_page = (time.perf_counter() - start) / pages
+
+    assert before == [after[p] for p in sample]
+    print(f"{characters:,} characters, {pages:,} pages of {per_page}")
+    print(f"old: rebuild per page        {old_per_page * 1000:9.2f} ms/page")
+    print(f"view: one-time build         {build * 1000:9.2f} ms")
+    print(f"view: first render of a page {new_per_page * 1000:9.3f} ms/page")
+    print(f"view: page already rendered  {cached_per_page * 1000:9.4f} ms/page")
+
+
+if __name__ == "__main__":
+    benchmark()
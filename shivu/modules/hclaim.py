@@ -5,23 +5,24 @@ from datetime import datetime, timedelta, timezone
 from enum import Enum
 from typing import Optional, Dict, Tuple, Set
 from functools import wraps
-from collections import defaultdict, deque
 import asyncio
-import hashlib
 
 import pytz
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, CallbackContext
 from telegram.constants import ParseMode
 from telegram.error import TelegramError, RetryAfter, TimedOut
-from cachetools import TTLCache, LRUCache
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageEnhance
 import io
-from concurrent.futures import ThreadPoolExecutor
 
-from shivu import application, user_collection, collection, sudo_users
+from shivu import application, user_collection, sudo_users
+from shivu.cooldowns import cooldowns
+from shivu.cache import create_cache, invalidate, user_tag
+from shivu.events import collection_changed
+from shivu.card_render import CardRenderer, CardSpec
+from shivu.sampler import sampler
+from shivu.claim_state import claim_state
 
 KOLKATA_TZ = pytz.timezone('Asia/Kolkata')
 UTC_TZ = pytz.UTC
@@ -77,26 +78,16 @@ class ClaimConfig:
     BONUS_STREAK_MILESTONES: Tuple[int, ...] = (3, 5, 7, 10, 14, 21, 30)
     LUCKY_BOOST_CHANCE: float = 0.18
     PITY_SYSTEM_THRESHOLD: int = 25
-    IMAGE_CACHE_SIZE: int = 150
-    PARALLEL_WORKERS: int = 6
+    CARD_WORKERS: int = 2
     SEASONAL_BOOST_MULTIPLIER: float = 1.5
 
 CONFIG = ClaimConfig()
 
 claim_semaphore = asyncio.Semaphore(100)
 active_claims: Set[int] = set()
-rate_limit_tracker = defaultdict(lambda: deque(maxlen=CONFIG.MAX_REQUESTS_PER_WINDOW))
-character_cache = TTLCache(maxsize=1500, ttl=CONFIG.CACHE_TTL)
-user_cache = TTLCache(maxsize=7000, ttl=CONFIG.CACHE_TTL)
-image_cache = LRUCache(maxsize=CONFIG.IMAGE_CACHE_SIZE)
-pity_counter = defaultdict(int)
-executor = ThreadPoolExecutor(max_workers=CONFIG.PARALLEL_WORKERS)
+user_cache = create_cache("hclaim_users", maxsize=7000, ttl=CONFIG.CACHE_TTL)
+card_renderer = CardRenderer(workers=CONFIG.CARD_WORKERS)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler('claims.log'), logging.StreamHandler()]
-)
 logger = logging.getLogger(__name__)
 
 class CharacterNotFound(Exception):
@@ -115,24 +106,17 @@ def to_utc(dt: datetime) -> datetime:
         dt = KOLKATA_TZ.localize(dt)
     return dt.astimezone(UTC_TZ)
 
-def rate_limit_check(user_id: int) -> bool:
-    now = datetime.now()
-    user_requests = rate_limit_tracker[user_id]
-    user_requests.append(now)
-    
-    if len(user_requests) >= CONFIG.MAX_REQUESTS_PER_WINDOW:
-        oldest = user_requests[0]
-        if (now - oldest).total_seconds() < CONFIG.RATE_LIMIT_WINDOW:
-            return False
-    return True
+def rate_limit_check(user_id: int) -> float:
+    """Seconds the user has to wait, 0 when the request may proceed."""
+    return cooldowns.hit("hclaim", user_id, CONFIG.MAX_REQUESTS_PER_WINDOW, CONFIG.RATE_LIMIT_WINDOW)
 
 def rate_limit(func):
     @wraps(func)
     async def wrapper(update: Update, context: CallbackContext):
         user_id = update.effective_user.id
         
-        if not rate_limit_check(user_id):
-            remaining = CONFIG.RATE_LIMIT_WINDOW - int((datetime.now() - rate_limit_tracker[user_id][0]).total_seconds())
+        if wait := rate_limit_check(user_id):
+            remaining = int(wait) + 1
             await update.message.reply_text(
                 f"⚠️ <b>ʀᴀᴛᴇ ʟɪᴍɪᴛ</b>\nWait {remaining}s.",
                 parse_mode=ParseMode.HTML
@@ -215,42 +199,28 @@ class TimeFormatter:
         return special_days.get(day, "")
 
 class CacheManager:
-    @staticmethod
-    def generate_cache_key(*args) -> str:
-        return hashlib.md5('_'.join(map(str, args)).encode()).hexdigest()
-    
     @staticmethod
     async def get_user_data(user_id: int) -> Optional[Dict]:
-        cache_key = CacheManager.generate_cache_key('user', user_id)
-        if cache_key in user_cache:
-            return user_cache[cache_key]
-        user_data = await user_collection.find_one({'id': user_id})
-        if user_data:
-            user_cache[cache_key] = user_data
-        return user_data
+        return await user_cache.get_or_load(
+            user_id, lambda: user_collection.find_one({'id': user_id}), [user_tag(user_id)]
+        )
     
     @staticmethod
     def invalidate_user_cache(user_id: int):
-        cache_key = CacheManager.generate_cache_key('user', user_id)
-        user_cache.pop(cache_key, None)
+        invalidate(user_tag(user_id))
 
 class PitySystem:
     @staticmethod
-    def check_pity(user_id: int) -> bool:
-        count = pity_counter[user_id]
-        if count >= CONFIG.PITY_SYSTEM_THRESHOLD:
-            pity_counter[user_id] = 0
-            return True
-        pity_counter[user_id] += 1
-        return False
+    async def check_pity(user_id: int) -> bool:
+        return await claim_state.bump_pity(user_id, CONFIG.PITY_SYSTEM_THRESHOLD)
     
     @staticmethod
-    def get_pity_progress(user_id: int) -> Tuple[int, int]:
-        return pity_counter[user_id], CONFIG.PITY_SYSTEM_THRESHOLD
+    async def get_pity_progress(user_id: int) -> Tuple[int, int]:
+        return (await claim_state.get(user_id))['pity'], CONFIG.PITY_SYSTEM_THRESHOLD
     
     @staticmethod
-    def reset_pity(user_id: int):
-        pity_counter[user_id] = 0
+    async def reset_pity(user_id: int):
+        await claim_state.reset_pity(user_id)
 
 class LuckSystem:
     @staticmethod
@@ -288,150 +258,20 @@ class LuckSystem:
 
 class ImageProcessor:
     @staticmethod
-    async def create_claim_card(character: Dict, user_name: str, streak: int, rarity: RarityType) -> io.BytesIO:
-        return await asyncio.get_event_loop().run_in_executor(
-            executor, ImageProcessor._generate_card, character, user_name, streak, rarity
-        )
-    
-    @staticmethod
-    def _generate_card(character: Dict, user_name: str, streak: int, rarity: RarityType) -> io.BytesIO:
-        cache_key = f"{character['id']}_{streak}_{user_name}_{rarity.key}"
-        if cache_key in image_cache:
-            return image_cache[cache_key]
-        
-        width, height = 900, 650
-        img = Image.new('RGB', (width, height), color='#0a0a1e')
-        draw = ImageDraw.Draw(img)
-        
-        gradient = Image.new('RGB', (width, height), color='#16213e')
-        draw_gradient = ImageDraw.Draw(gradient)
-        for i in range(height):
-            color = ImageProcessor._interpolate_color('#0f1629', rarity.color, i / height)
-            draw_gradient.line([(0, i), (width, i)], fill=color)
-        
-        img = Image.blend(img, gradient, alpha=0.75)
-        img = img.filter(ImageFilter.GaussianBlur(radius=1.5))
-        
-        enhancer = ImageEnhance.Brightness(img)
-        img = enhancer.enhance(1.1)
-        
-        draw = ImageDraw.Draw(img)
-        
-        try:
-            title_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 45)
-            text_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 28)
-            small_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 22)
-        except:
-            title_font = text_font = small_font = ImageFont.load_default()
-        
-        glow_size = 8
-        for offset in range(1, glow_size):
-            alpha = int(50 / offset)
-            glow_color = ImageProcessor._hex_to_rgba(rarity.color, alpha)
-            draw.text((width//2 + offset, 70 + offset), f"{rarity.emoji} {character['name']}", 
-                     fill=glow_color, font=title_font, anchor='mm')
-        
-        draw.text((width//2, 70), f"{rarity.emoji} {character['name']}", 
-                 fill='white', font=title_font, anchor='mm', stroke_width=2, stroke_fill=rarity.color)
-        
-        draw.text((width//2, 150), f"🎬 {character['anime']}", 
-                 fill='#e8e8e8', font=text_font, anchor='mm')
-        
-        rarity_bg_x = width//2 - 150
-        rarity_bg_y = 195
-        draw.rounded_rectangle(
-            [(rarity_bg_x, rarity_bg_y), (rarity_bg_x + 300, rarity_bg_y + 45)],
-            radius=23, fill=ImageProcessor._hex_to_rgba(rarity.color, 40), 
-            outline=rarity.color, width=3
-        )
-        draw.text((width//2, 217), f"⭐ {rarity.display}", 
-                 fill=rarity.color, font=text_font, anchor='mm', stroke_width=1, stroke_fill='white')
-        
-        streak_y = 290
-        streak_bar_width = 450
-        streak_bar_height = 50
-        streak_x = (width - streak_bar_width) // 2
-        
-        shadow_offset = 4
-        draw.rounded_rectangle(
-            [(streak_x + shadow_offset, streak_y + shadow_offset), 
-             (streak_x + streak_bar_width + shadow_offset, streak_y + streak_bar_height + shadow_offset)],
-            radius=25, fill='#000000'
-        )
-        
-        draw.rounded_rectangle(
-            [(streak_x, streak_y), (streak_x + streak_bar_width, streak_y + streak_bar_height)],
-            radius=25, fill='#1a1f3a', outline=rarity.color, width=4
-        )
-        
-        filled_width = int((min(streak, CONFIG.MAX_STREAK) / CONFIG.MAX_STREAK) * (streak_bar_width - 12))
-        if filled_width > 0:
-            gradient_fill = Image.new('RGB', (filled_width, streak_bar_height - 12), color=rarity.color)
-            draw_fill = ImageDraw.Draw(gradient_fill)
-            for i in range(filled_width):
-                color = ImageProcessor._interpolate_color(rarity.color, '#ffffff', i / filled_width * 0.3)
-                draw_fill.line([(i, 0), (i, streak_bar_height - 12)], fill=color)
-            
-            mask = Image.new('L', (filled_width, streak_bar_height - 12), 0)
-            mask_draw = ImageDraw.Draw(mask)
-            mask_draw.rounded_rectangle([(0, 0), (filled_width, streak_bar_height - 12)], radius=20, fill=255)
-            img.paste(gradient_fill, (streak_x + 6, streak_y + 6), mask)
-        
-        streak_text = f"🔥 Streak: {streak}"
-        if streak > CONFIG.MAX_STREAK:
-            streak_text += f" 👑"
-        draw.text((width//2, streak_y + 25), streak_text, 
-                 fill='white', font=text_font, anchor='mm', stroke_width=2, stroke_fill='#000000')
-        
-        multiplier = min(streak, 10) * 0.5 + 1
-        stats_y = 380
-        stats = [
-            f"⚡ Multiplier: {multiplier:.1f}x",
-            f"🎯 Pity: {pity_counter.get(hash(user_name), 0)}/{CONFIG.PITY_SYSTEM_THRESHOLD}",
-            f"🏆 ID: {character['id']}"
-        ]
-        
-        for i, stat in enumerate(stats):
-            y_pos = stats_y + (i * 45)
-            draw.rounded_rectangle(
-                [(width//2 - 200, y_pos - 18), (width//2 + 200, y_pos + 18)],
-                radius=18, fill=ImageProcessor._hex_to_rgba('#1a1f3a', 150), 
-                outline=rarity.color, width=2
-            )
-            draw.text((width//2, y_pos), stat, fill='#ffffff', font=small_font, anchor='mm')
-        
-        owner_y = 550
-        draw.text((width//2, owner_y), f"👤 Claimed by: {user_name}", 
-                 fill='#b8b8b8', font=text_font, anchor='mm')
-        
-        border_width = 8
-        draw.rectangle([(0, 0), (width, height)], outline=rarity.color, width=border_width)
-        
-        for i in range(border_width):
-            alpha = int(100 - (i * 12))
-            inner_color = ImageProcessor._hex_to_rgba(rarity.color, alpha)
-            draw.rectangle([(i, i), (width - i, height - i)], outline=inner_color, width=1)
-        
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG', optimize=True, quality=90)
-        buffer.seek(0)
-        image_cache[cache_key] = buffer
-        return buffer
-    
-    @staticmethod
-    def _interpolate_color(color1: str, color2: str, factor: float) -> str:
-        c1 = tuple(int(color1[i:i+2], 16) for i in (1, 3, 5))
-        c2 = tuple(int(color2[i:i+2], 16) for i in (1, 3, 5))
-        r = int(c1[0] + (c2[0] - c1[0]) * factor)
-        g = int(c1[1] + (c2[1] - c1[1]) * factor)
-        b = int(c1[2] + (c2[2] - c1[2]) * factor)
-        return f'#{r:02x}{g:02x}{b:02x}'
-    
-    @staticmethod
-    def _hex_to_rgba(hex_color: str, alpha: int = 255) -> Tuple[int, int, int, int]:
-        hex_color = hex_color.lstrip('#')
-        r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-        return (r, g, b, alpha)
+    async def create_claim_card(character: Dict, user_name: str, streak: int, rarity: RarityType, pity: int = 0) -> io.BytesIO:
+        return await card_renderer.render(CardSpec(
+            char_id=str(character['id']),
+            name=character['name'],
+            anime=character['anime'],
+            color=rarity.color,
+            display=str(rarity.display),
+            emoji=rarity.emoji,
+            streak=streak,
+            max_streak=CONFIG.MAX_STREAK,
+            pity=pity,
+            pity_threshold=CONFIG.PITY_SYSTEM_THRESHOLD,
+            user_name=user_name
+        ))
 
 class CharacterManager:
     @staticmethod
@@ -439,10 +279,7 @@ class CharacterManager:
            retry=retry_if_exception_type(Exception))
     async def fetch_character(user_id: int, target_rarity: Optional[str] = None, luck_factor: float = 1.0) -> Tuple[Optional[Dict], RarityType, bool, bool]:
         try:
-            user_data = await CacheManager.get_user_data(user_id)
-            claimed_ids = [c['id'] for c in user_data.get('characters', [])] if user_data else []
-            
-            is_pity = PitySystem.check_pity(user_id)
+            is_pity = await PitySystem.check_pity(user_id)
             is_ultra = LuckSystem.is_ultra_lucky()
             is_lucky = LuckSystem.is_lucky_boost()
             seasonal_event = TimeFormatter.get_seasonal_event()
@@ -467,37 +304,14 @@ class CharacterManager:
             else:
                 selected_rarity = CharacterManager._select_rarity(luck_factor)
             
-            cache_key = CacheManager.generate_cache_key(
-                'char', user_id, selected_rarity.key, len(claimed_ids), int(luck_factor * 100)
-            )
-            
-            if cache_key in character_cache:
-                cached_char = character_cache[cache_key]
-                return cached_char, selected_rarity, is_lucky or is_ultra, is_pity
-            
-            pipeline = [
-                {'$match': {'rarity': selected_rarity.display, 'id': {'$nin': claimed_ids}}},
-                {'$sample': {'size': 1}}
-            ]
+            character = await sampler.sample_one(user_id, [selected_rarity.display])
+            if character is None:
+                character = await sampler.sample_one(user_id)
+                if character is not None:
+                    selected_rarity = CharacterManager._get_rarity_by_display(character.get('rarity', ''))
             
-            cursor = collection.aggregate(pipeline)
-            result = await cursor.to_list(length=1)
-            
-            if not result:
-                fallback_pipeline = [
-                    {'$match': {'id': {'$nin': claimed_ids}}},
-                    {'$sample': {'size': 1}}
-                ]
-                cursor = collection.aggregate(fallback_pipeline)
-                result = await cursor.to_list(length=1)
-                
-                if result:
-                    char_rarity = result[0].get('rarity', '')
-                    selected_rarity = CharacterManager._get_rarity_by_display(char_rarity)
-            
-            if result:
-                character_cache[cache_key] = result[0]
-                return result[0], selected_rarity, is_lucky or is_ultra, is_pity
+            if character is not None:
+                return character, selected_rarity, is_lucky or is_ultra, is_pity
             
             raise CharacterNotFound("No available characters")
         except Exception as e:
@@ -594,7 +408,7 @@ class StreakManager:
 
 class MessageBuilder:
     @staticmethod
-    def build_claim_message(user: object, character: Dict, streak: int, rarity: RarityType, is_lucky: bool = False, is_pity: bool = False) -> Tuple[str, InlineKeyboardMarkup]:
+    def build_claim_message(user: object, character: Dict, streak: int, rarity: RarityType, is_lucky: bool = False, is_pity: bool = False, pity: int = 0) -> Tuple[str, InlineKeyboardMarkup]:
         now_kolkata = get_kolkata_time()
         time_emoji = TimeFormatter.get_time_emoji(now_kolkata.hour)
         day_bonus = TimeFormatter.get_day_bonus(now_kolkata.weekday())
@@ -602,7 +416,7 @@ class MessageBuilder:
         
         multiplier = StreakManager.get_streak_multiplier(streak)
         streak_msg = StreakManager.get_streak_message(streak)
-        pity_progress, pity_max = PitySystem.get_pity_progress(user.id)
+        pity_progress, pity_max = pity, CONFIG.PITY_SYSTEM_THRESHOLD
         
         special_tags = []
         if is_lucky:
@@ -660,9 +474,9 @@ class MessageBuilder:
         )
     
     @staticmethod
-    def build_cooldown_message(remaining: timedelta, streak: int, user_id: int) -> str:
+    def build_cooldown_message(remaining: timedelta, streak: int, pity: int) -> str:
         next_claim = get_kolkata_time() + remaining
-        pity_progress, pity_max = PitySystem.get_pity_progress(user_id)
+        pity_progress, pity_max = pity, CONFIG.PITY_SYSTEM_THRESHOLD
         multiplier = StreakManager.get_streak_multiplier(streak)
         
         return (
@@ -695,14 +509,19 @@ async def reset_cooldown(update: Update, context: CallbackContext):
         reset_date = datetime(2000, 1, 1, tzinfo=UTC_TZ)
         update_fields = {}
         
+        state_fields = {}
+        
         if reset_type in ['cooldown', 'all']:
             update_fields['last_daily_claim'] = reset_date
+            state_fields['last_claim'] = reset_date
         if reset_type in ['streak', 'all']:
             update_fields['claim_streak'] = 0
+            state_fields['streak'] = 0
         if reset_type in ['pity', 'all']:
-            PitySystem.reset_pity(target_id)
+            await PitySystem.reset_pity(target_id)
         
         if update_fields:
+            await claim_state.set(target_id, state_fields)
             result = await user_collection.update_one({'id': target_id}, {'$set': update_fields}, upsert=True)
         else:
             result = type('obj', (object,), {'modified_count': 1})()
@@ -735,9 +554,9 @@ async def daily_claim(update: Update, context: CallbackContext):
     now = datetime.now(UTC_TZ)
     
     try:
-        user_data = await CacheManager.get_user_data(user.id) or {}
-        last_claimed = user_data.get('last_daily_claim')
-        current_streak = user_data.get('claim_streak', 0)
+        state = await claim_state.get(user.id)
+        last_claimed = state['last_claim']
+        current_streak = state['streak']
         
         if last_claimed:
             if last_claimed.tzinfo is None:
@@ -747,7 +566,7 @@ async def daily_claim(update: Update, context: CallbackContext):
             
             if elapsed < timedelta(hours=CONFIG.COOLDOWN_HOURS):
                 remaining = timedelta(hours=CONFIG.COOLDOWN_HOURS) - elapsed
-                cooldown_msg = MessageBuilder.build_cooldown_message(remaining, current_streak, user.id)
+                cooldown_msg = MessageBuilder.build_cooldown_message(remaining, current_streak, state['pity'])
                 await update.message.reply_text(cooldown_msg, parse_mode=ParseMode.HTML)
                 return
         
@@ -760,9 +579,24 @@ async def daily_claim(update: Update, context: CallbackContext):
             high_tier = [RarityType.MYTHIC, RarityType.CELESTIAL, RarityType.LEGENDARY]
             target_rarity = random.choice(high_tier).display
         
-        character, rarity, is_lucky, is_pity = await CharacterManager.fetch_character(user.id, target_rarity, luck_factor)
+        # Only one claim wins if the same user claims twice at once (or from two processes).
+        # Decided before the draw, so a losing claim never bumps or spends the pity counter.
+        if not await claim_state.compare_and_set(
+            user.id, {'last_claim': state['last_claim']}, {'last_claim': now, 'streak': new_streak}
+        ):
+            await update.message.reply_text("⏳ <b>ᴀʟʀᴇᴀᴅʏ ᴄʟᴀɪᴍᴇᴅ</b>", parse_mode=ParseMode.HTML)
+            return
+        
+        # Nothing is given if the draw fails, so hand the claim back (it still holds the cooldown)
+        restore = {'last_claim': state['last_claim'], 'streak': current_streak}
+        try:
+            character, rarity, is_lucky, is_pity = await CharacterManager.fetch_character(user.id, target_rarity, luck_factor)
+        except Exception:
+            await claim_state.set(user.id, restore)
+            raise
         
         if not character:
+            await claim_state.set(user.id, restore)
             await update.message.reply_text(
                 "❗ <b>ɴᴏ ᴄʜᴀʀᴀᴄᴛᴇʀs ᴀᴠᴀɪʟᴀʙʟᴇ</b>\n"
                 "All characters claimed or database empty.",
@@ -774,6 +608,7 @@ async def daily_claim(update: Update, context: CallbackContext):
             {'id': user.id},
             {
                 '$push': {'characters': character},
+                # Still mirrored on the user document; /daily in games reads last_daily_claim
                 '$set': {
                     'last_daily_claim': now,
                     'claim_streak': new_streak,
@@ -785,12 +620,16 @@ async def daily_claim(update: Update, context: CallbackContext):
             upsert=True
         )
         
-        CacheManager.invalidate_user_cache(user.id)
+        collection_changed(user.id, [character.get('id')])
+        
+        pity, _ = await PitySystem.get_pity_progress(user.id)
         
         try:
-            card_image = await ImageProcessor.create_claim_card(character, user.first_name, new_streak, rarity)
+            card_image = await ImageProcessor.create_claim_card(
+                character, user.first_name, new_streak, rarity, pity
+            )
             
-            caption, keyboard = MessageBuilder.build_claim_message(user, character, new_streak, rarity, is_lucky, is_pity)
+            caption, keyboard = MessageBuilder.build_claim_message(user, character, new_streak, rarity, is_lucky, is_pity, pity)
             
             await update.message.reply_photo(
                 photo=card_image,
@@ -802,7 +641,7 @@ async def daily_claim(update: Update, context: CallbackContext):
             card_image.seek(0)
         except Exception as img_error:
             logger.error(f"Image generation failed: {img_error}")
-            caption, keyboard = MessageBuilder.build_claim_message(user, character, new_streak, rarity, is_lucky, is_pity)
+            caption, keyboard = MessageBuilder.build_claim_message(user, character, new_streak, rarity, is_lucky, is_pity, pity)
             
             await update.message.reply_photo(
                 photo=character.get('img_url'),
@@ -2,6 +2,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler
 from html import escape
 from shivu import db, application
+from shivu.events import settings_changed
 
 user_collection = db['user_collection_lmaoooo']
 
@@ -355,6 +356,7 @@ async def hstyle_callback(update: Update, context: CallbackContext):
             {'$set': {'harem_style': 'classic', 'harem_display_options': {}}},
             upsert=True
         )
+        settings_changed('harem_style', user_id=user_id)
         await query.answer("✅ Reset to default style", show_alert=True)
         await query.edit_message_text(
             text=(
@@ -378,6 +380,7 @@ async def hstyle_callback(update: Update, context: CallbackContext):
                 {'$set': {'harem_style': style_key}},
                 upsert=True
             )
+            settings_changed('harem_style', user_id=user_id)
             await query.answer(f"✅ {style_data['name']} applied!", show_alert=False)
             await query.edit_message_text(
                 text=(
@@ -409,6 +412,7 @@ async def hstyle_callback(update: Update, context: CallbackContext):
             {'$set': {'harem_display_options': options}},
             upsert=True
         )
+        settings_changed('harem_style', user_id=user_id)
         
         status = "enabled" if options[option_key] else "disabled"
         opt_name = DISPLAY_OPTIONS[option_key]['name']
@@ -460,18 +464,24 @@ async def hstyle_callback(update: Update, context: CallbackContext):
         )
 
 
+async def get_user_harem_settings(user_id):
+    """Get user's style template and display options with one projected lookup"""
+    user = await user_collection.find_one(
+        {'id': user_id}, {'_id': 0, 'harem_style': 1, 'harem_display_options': 1}
+    ) or {}
+    style = DEFAULT_STYLES.get(user.get('harem_style', 'classic'), DEFAULT_STYLES['classic'])
+    return style, user.get('harem_display_options') or {}
+
+
 async def get_user_style_template(user_id):
     """Get user's selected style template"""
-    user = await user_collection.find_one({'id': user_id})
-    if user:
-        style_key = user.get('harem_style', 'classic')
-        return DEFAULT_STYLES.get(style_key, DEFAULT_STYLES['classic'])
-    return DEFAULT_STYLES['classic']
+    style, _ = await get_user_harem_settings(user_id)
+    return style
 
 
 async def get_user_display_options(user_id):
     """Get user's display options"""
-    user = await user_collection.find_one({'id': user_id})
+    user = await user_collection.find_one({'id': user_id}, {'_id': 0, 'harem_display_options': 1})
     if user:
         return user.get('harem_display_options', {})
     return {}
@@ -528,8 +538,7 @@ async def format_harem_page(user_id, user_name, characters_data, page, total_pag
     Returns:
         Formatted HTML text for the harem page
     """
-    style = await get_user_style_template(user_id)
-    options = await get_user_display_options(user_id)
+    style, options = await get_user_harem_settings(user_id)
     
     # Start with header
     text = style['header'].format(
@@ -2,8 +2,6 @@ import re, time, hashlib
 from html import escape
 from typing import List, Dict, Optional
 from dataclasses import dataclass
-from cachetools import TTLCache, LRUCache
-from pymongo import ASCENDING, TEXT
 from functools import lru_cache
 
 from telegram import Update, InlineQueryResultPhoto, InlineQueryResultVideo, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent, InlineQueryResultCachedPhoto, SwitchInlineQueryChosenChat
@@ -11,6 +9,7 @@ from telegram.ext import InlineQueryHandler, CallbackQueryHandler, ChosenInlineR
 from telegram.constants import ParseMode
 
 from shivu import application, db
+from shivu.cache import CATALOG_TAG, create_cache, owners_tag, user_tag
 
 collection = db['anime_characters_lol']
 user_collection = db['user_collection_lmaoooo']
@@ -31,21 +30,12 @@ RARITY_MAP = {
     "rare": ("🟣", 19), "common": ("🟢", 20)
 }
 
-try:
-    collection.create_index([('id', ASCENDING)], unique=True, background=True)
-    collection.create_index([('rarity', ASCENDING), ('anime', ASCENDING)], background=True)
-    collection.create_index([('name', TEXT), ('anime', TEXT)], background=True)
-    user_collection.create_index([('id', ASCENDING)], unique=True, background=True)
-    user_collection.create_index([('characters.id', ASCENDING)], background=True, sparse=True)
-except: pass
-
-char_cache = TTLCache(maxsize=80000, ttl=2400)
-user_cache = TTLCache(maxsize=50000, ttl=1200)
-query_cache = LRUCache(maxsize=15000)
-count_cache = TTLCache(maxsize=30000, ttl=1800)
-feedback_cache = TTLCache(maxsize=10000, ttl=3600)
-view_cache = TTLCache(maxsize=5000, ttl=600)
-wishlist_cache = TTLCache(maxsize=5000, ttl=1800)
+user_cache = create_cache("inline_users", maxsize=50000, ttl=3600)
+query_cache = create_cache("inline_queries", maxsize=15000)
+count_cache = create_cache("inline_counts", maxsize=30000, ttl=1800)
+feedback_cache = create_cache("inline_feedback", maxsize=10000, ttl=3600)
+view_cache = create_cache("inline_views", maxsize=5000, ttl=600)
+wishlist_cache = create_cache("inline_wishlists", maxsize=5000, ttl=1800)
 
 CAPS = str.maketrans('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ', 'ᴀʙᴄᴅᴇғɢʜɪᴊᴋʟᴍɴᴏᴘǫʀsᴛᴜᴠᴡxʏᴢᴀʙᴄᴅᴇғɢʜɪᴊᴋʟᴍɴᴏᴘǫʀsᴛᴜᴠᴡxʏᴢ')
 
@@ -67,16 +57,12 @@ def trunc(t: str, l: int = 22) -> str: return t[:l-2] + '..' if len(t) > l else
 def cache_key(*args) -> str: return hashlib.md5(str(args).encode()).hexdigest()
 
 async def get_user(uid: int) -> Optional[Dict]:
-    k = f"u{uid}"
-    if k in user_cache: return user_cache[k]
-    u = await user_collection.find_one({'id': uid}, {'_id': 0})
-    if u: user_cache[k] = u
-    return u
+    return await user_cache.get_or_load(f"u{uid}", lambda: user_collection.find_one({'id': uid}, {'_id': 0}), [user_tag(uid)])
 
 async def bulk_count(ids: List[str]) -> Dict[str, int]:
     if not ids: return {}
     k = cache_key('bulk', tuple(sorted(ids[:150])))
-    if k in count_cache: return count_cache[k]
+    if (cached := count_cache.get(k)) is not None: return cached
     pipe = [
         {'$match': {'characters.id': {'$in': ids}}},
         {'$project': {'characters.id': 1}},
@@ -86,12 +72,12 @@ async def bulk_count(ids: List[str]) -> Dict[str, int]:
     ]
     results = await user_collection.aggregate(pipe).to_list(None)
     counts = {r['_id']: r['count'] for r in results}
-    count_cache[k] = counts
+    count_cache.set(k, counts, [owners_tag(cid) for cid in ids])
     return counts
 
 async def get_owners(cid: str, lim: int = 100) -> List[Dict]:
     k = f"o{cid}{lim}"
-    if k in count_cache: return count_cache[k]
+    if (cached := count_cache.get(k)) is not None: return cached
     pipe = [
         {'$match': {'characters.id': cid}},
         {'$project': {'id': 1, 'first_name': 1, 'username': 1, 'characters': {'$filter': {'input': '$characters', 'as': 'c', 'cond': {'$eq': ['$$c.id', cid]}}}}},
@@ -101,12 +87,12 @@ async def get_owners(cid: str, lim: int = 100) -> List[Dict]:
         {'$project': {'characters': 0}}
     ]
     owners = await user_collection.aggregate(pipe).to_list(lim)
-    count_cache[k] = owners
+    count_cache.set(k, owners, [owners_tag(cid)])
     return owners
 
 async def search_chars(q: str, lim: int = 1000) -> List[Dict]:
     k = cache_key('search', q, lim)
-    if k in query_cache: return query_cache[k]
+    if (cached := query_cache.get(k)) is not None: return cached
     if q:
         chars = await collection.find({'$text': {'$search': q}}, {'_id': 0, 'score': {'$meta': 'textScore'}}).sort([('score', {'$meta': 'textScore'})]).limit(lim).to_list(lim)
         if not chars:
@@ -114,7 +100,7 @@ async def search_chars(q: str, lim: int = 1000) -> List[Dict]:
             chars = await collection.find({'$or': [{'name': rx}, {'anime': rx}, {'id': q}]}, {'_id': 0}).limit(lim).to_list(lim)
     else:
         chars = await collection.find({}, {'_id': 0}).limit(lim).to_list(lim)
-    query_cache[k] = chars
+    query_cache.set(k, chars, [CATALOG_TAG])
     return chars
 
 async def filter_chars(chars: List[Dict], mode: str, uid: int = None) -> List[Dict]:
@@ -5,6 +5,7 @@ from datetime import datetime
 from telegram import Update
 from telegram.ext import CommandHandler, CallbackContext
 from shivu import application, user_collection
+from shivu.events import collection_changed
 
 # Configuration
 OWNER_ID = 8420981179
@@ -78,6 +79,7 @@ async def kill(update: Update, context: CallbackContext) -> None:
         )
         
         if result.modified_count > 0:
+            collection_changed(target.id, [c.get('id') for c in characters])
             top_chars_list = [
                 f"{i+1}. {c.get('name', 'Unknown')} ({c.get('rarity', 'N/A')})"
                 for i, c in enumerate(characters[:5])
@@ -6,8 +6,9 @@ from html import escape
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler
 
-from shivu import application, OWNER_ID, user_collection, top_global_groups_collection, group_user_totals_collection
-from shivu import sudo_users as SUDO_USERS
+from shivu import application, user_collection, top_global_groups_collection, group_user_totals_collection
+from shivu.auth import auth
+from shivu.stats_service import bot_stats
 
 SPINNER = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
 VIDEOS = [
@@ -172,7 +173,7 @@ async def chat_stats(update: Update, context: CallbackContext, edit=False, cid=N
 async def stats(update: Update, context: CallbackContext, edit=False):
     # FIXED: Check both command and callback
     uid = update.effective_user.id
-    if uid != OWNER_ID and str(uid) not in SUDO_USERS:
+    if not auth.is_sudo(uid):
         return await (update.callback_query.answer(sc("unauthorized."), show_alert=True) if edit else update.message.reply_text(sc("unauthorized.")))
 
     q = update.callback_query if edit else None
@@ -181,22 +182,19 @@ async def stats(update: Update, context: CallbackContext, edit=False):
 
     task = asyncio.create_task(anim(msg, "computing"))
     try:
-        u = await user_collection.count_documents({})
-        g = len(await group_user_totals_collection.distinct('group_id'))
-        c = await user_collection.count_documents({"characters": {"$exists": True, "$type": "array"}})
-        res = await user_collection.aggregate([{"$match": {"characters": {"$exists": True, "$type": "array"}}}, {"$project": {"cc": {"$size": "$characters"}}}, {"$group": {"_id": None, "tot": {"$sum": "$cc"}}}]).to_list(1)
-        tc = res[0]['tot'] if res else 0
+        s = await bot_stats.get()
+        u, g, c, tc = s['users'], s['active_groups'], s['collectors'], s['owned_characters']
         task.cancel()
 
         vid = get_video()
-        cap = f"<a href='{vid}'>&#8205;</a><b>⸻{sc('system stats')}⸻</b>\n\n{sc('users')}: <b>{u:,}</b>\n{sc('collectors')}: <b>{c:,}</b>\n{sc('groups')}: <b>{g:,}</b>\n{sc('chars')}: <b>{tc:,}</b>\n\n{sc('avg')}: <b>{tc/c:.1f}</b>\n{sc('rate')}: <b>{(c/u*100):.1f}%</b>\n\n<i>{datetime.now().strftime('%H:%M:%S')}</i>"
+        cap = f"<a href='{vid}'>&#8205;</a><b>⸻{sc('system stats')}⸻</b>\n\n{sc('users')}: <b>{u:,}</b>\n{sc('collectors')}: <b>{c:,}</b>\n{sc('groups')}: <b>{g:,}</b>\n{sc('chars')}: <b>{tc:,}</b>\n\n{sc('avg')}: <b>{(tc/c if c else 0):.1f}</b>\n{sc('rate')}: <b>{(c/u*100 if u else 0):.1f}%</b>\n\n<i>{datetime.now().strftime('%H:%M:%S')}</i>"
 
         btns = InlineKeyboardMarkup([[InlineKeyboardButton("🔄", callback_data="lb_st")], [InlineKeyboardButton("❌", callback_data="lb_close")]])
         await msg.edit_text(cap, parse_mode='HTML', reply_markup=btns)
     except: pass
 
 async def export_users(update: Update, context: CallbackContext):
-    if str(update.effective_user.id) not in SUDO_USERS: return await update.message.reply_text(sc('unauthorized.'))
+    if not auth.is_sudo(update.effective_user.id): return await update.message.reply_text(sc('unauthorized.'))
     msg = await update.message.reply_text(sc('exporting...'))
     task = asyncio.create_task(anim(msg, "generating"))
     try:
@@ -211,7 +209,7 @@ async def export_users(update: Update, context: CallbackContext):
     except: pass
 
 async def export_groups(update: Update, context: CallbackContext):
-    if str(update.effective_user.id) not in SUDO_USERS: return await update.message.reply_text(sc('unauthorized.'))
+    if not auth.is_sudo(update.effective_user.id): return await update.message.reply_text(sc('unauthorized.'))
     msg = await update.message.reply_text(sc('exporting...'))
     task = asyncio.create_task(anim(msg, "generating"))
     try:
@@ -1,11 +1,14 @@
 import asyncio 
-import time 
+import math 
 import random 
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup 
 from telegram.ext import CommandHandler, CallbackContext 
 from telegram.error import TelegramError 
-from shivu import application, user_collection, collection 
+from shivu import application, user_collection
+from shivu.cooldowns import cooldowns 
+from shivu.events import collection_changed
+from shivu.sampler import sampler
  
 # --- CONFIGURATION ---
 PROPOSAL_COST = 2000 
@@ -26,18 +29,10 @@ REJECT_IMAGES = [
     "https://files.catbox.moe/3m3um2.jpg"
 ]
 
-cooldowns = {'dice': {}, 'propose': {}} 
-
 # --- HELPER FUNCTIONS ---
 def check_cooldown(user_id, cmd_type, cooldown_time): 
-    try: 
-        if user_id in cooldowns[cmd_type]: 
-            elapsed = time.time() - cooldowns[cmd_type][user_id] 
-            if elapsed < cooldown_time: 
-                return False, int(cooldown_time - elapsed) 
-        cooldowns[cmd_type][user_id] = time.time() 
-        return True, 0 
-    except: return True, 0 
+    rem = cooldowns.try_acquire(f"marry:{cmd_type}", user_id, cooldown_time)
+    return not rem, math.ceil(rem)
 
 async def is_user_joined(context: CallbackContext, user_id: int) -> bool:
     try:
@@ -48,10 +43,7 @@ async def is_user_joined(context: CallbackContext, user_id: int) -> bool:
 async def get_unique_chars(user_id, rarities=None, count=1): 
     try: 
         rarities = rarities or ['🟢 Common', '🟣 Rare', '🟡 Legendary'] 
-        user_data = await user_collection.find_one({'id': user_id}) 
-        claimed_ids = [c.get('id') for c in user_data.get('characters', [])] if user_data else [] 
-        pipeline = [{'$match': {'rarity': {'$in': rarities}, 'id': {'$nin': claimed_ids}}}, {'$sample': {'size': count}}] 
-        return await collection.aggregate(pipeline).to_list(length=None) 
+        return await sampler.sample(user_id, rarities, count) 
     except: return [] 
 
 async def add_char_to_user(user_id, username, first_name, char): 
@@ -61,6 +53,7 @@ async def add_char_to_user(user_id, username, first_name, char):
             {'$push': {'characters': char}, '$set': {'username': username, 'first_name': first_name}}, 
             upsert=True
         )
+        collection_changed(user_id, [char.get('id')])
         return True
     except: return False
 
@@ -2,13 +2,10 @@ from telegram import Update
 from telegram.ext import CommandHandler, ContextTypes
 from shivu import (
     application,
-    db, 
-    collection,
-    user_collection,
-    BANNED_USERS,
     sudo_users,
     LOGGER
 )
+from shivu.stats_service import bot_stats
 
 OWNER_ID = 5147822244
 
@@ -22,18 +19,18 @@ async def db_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        # Get database stats
-        stats = await db.command("dbStats")
+        # Served from the in-memory stats service
+        snapshot = await bot_stats.get()
+        stats = snapshot['db']
 
         # Format the data
         storage_size = stats.get('storageSize', 0) / (1024 * 1024)  # Convert to MB
         data_size = stats.get('dataSize', 0) / (1024 * 1024)
         index_size = stats.get('indexSize', 0) / (1024 * 1024)
 
-        # Count documents in collections
-        users_count = await user_collection.count_documents({})
-        characters_count = await collection.count_documents({})
-        banned_users_count = await BANNED_USERS.count_documents({})
+        users_count = snapshot['users']
+        characters_count = snapshot['characters']
+        banned_users_count = snapshot['banned_users']
 
         message = f"""
 📊 **Database Statistics**
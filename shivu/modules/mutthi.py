@@ -2,8 +2,6 @@ from dataclasses import dataclass, field, asdict
 from datetime import datetime, timezone, timedelta
 from typing import Optional, List, Dict, Any, Set
 from enum import Enum
-import asyncio
-import random
 from functools import wraps
 import logging
 
@@ -12,13 +10,22 @@ from telegram.ext import CallbackContext, CommandHandler, CallbackQueryHandler
 from telegram.error import BadRequest, TimedOut, NetworkError
 from telegram.constants import ParseMode, ChatAction
 
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
 from shivu import application, db, user_collection
+from shivu.auth import auth
+from shivu.cache import create_cache, invalidate
+from shivu.live_render import live_renderer
+from shivu.events import collection_changed
+from shivu.giveaway_draw import draw_by_reservoir, draw_by_seq, draw_first
 
 collection = db['anime_characters_lol']
 giveaway_collection = db['giveaways']
 participant_collection = db['giveaway_participants']
 
-SUDO_USERS = {"8297659126", "8420981179", "5147822244"}
+ACTIVE_GIVEAWAYS_TAG = "giveaways:active"
+active_cache = create_cache("giveaways_active", maxsize=1, ttl=30)
 
 logger = logging.getLogger(__name__)
 
@@ -255,11 +262,10 @@ class GiveawayUI:
 
 
 class GiveawayManager:
-    _lock = asyncio.Lock()
     
     @staticmethod
     async def is_sudo(user_id: int) -> bool:
-        return str(user_id) in SUDO_USERS
+        return auth.is_sudo(user_id)
     
     @staticmethod
     async def get_active_giveaway(character_id: Optional[str] = None) -> Optional[dict]:
@@ -270,10 +276,14 @@ class GiveawayManager:
     
     @staticmethod
     async def get_all_active_giveaways() -> List[dict]:
-        return await giveaway_collection.find({
-            "status": "active",
-            "end_time": {"$gt": datetime.now(timezone.utc)}
-        }).to_list(None)
+        return await active_cache.get_or_load(
+            "active",
+            lambda: giveaway_collection.find({
+                "status": "active",
+                "end_time": {"$gt": datetime.now(timezone.utc)}
+            }).to_list(None),
+            [ACTIVE_GIVEAWAYS_TAG]
+        )
     
     @staticmethod
     async def create_giveaway(char_id: str, giveaway_type: str, 
@@ -305,12 +315,14 @@ class GiveawayManager:
             "max_winners": max_winners,
             "winners": [],
             "participant_count": 0,
+            "next_seq": 0,
             "requirements": requirements or {},
             "message_id": message_id,
             "chat_id": chat_id
         }
         
         await giveaway_collection.insert_one(giveaway_data)
+        invalidate(ACTIVE_GIVEAWAYS_TAG)
         
         msg = "╔═══════════════════════╗\n"
         msg += "║ ✅ <b>GIVEAWAY CREATED</b> ║\n"
@@ -324,60 +336,71 @@ class GiveawayManager:
     @staticmethod
     async def join_giveaway(user_id: int, char_id: str, 
                           user_name: str = "Anonymous") -> tuple[bool, str]:
-        async with GiveawayManager._lock:
-            giveaway_data = await GiveawayManager.get_active_giveaway(char_id)
-            if not giveaway_data:
-                return False, "⚠️ No active giveaway found"
-            
-            giveaway = Giveaway.from_db(giveaway_data)
-            
-            if not giveaway.is_active:
-                return False, "⏰ Giveaway has ended"
-            
-            existing = await participant_collection.find_one({
-                "giveaway_id": giveaway_data["_id"],
-                "user_id": user_id
-            })
-            
-            if existing:
-                return False, "✅ You're already entered in this giveaway!"
+        giveaway_data = await GiveawayManager.get_active_giveaway(char_id)
+        if not giveaway_data:
+            return False, "⚠️ No active giveaway found"
+        
+        giveaway = Giveaway.from_db(giveaway_data)
+        
+        if not giveaway.is_active:
+            return False, "⏰ Giveaway has ended"
+        
+        existing = await participant_collection.find_one({
+            "giveaway_id": giveaway_data["_id"],
+            "user_id": user_id
+        })
+        
+        if existing:
+            return False, "✅ You're already entered in this giveaway!"
+        
+        if giveaway.requirements:
+            user_data = await user_collection.find_one({"id": user_id})
+            if not user_data:
+                return False, "⚠️ User data not found"
             
-            if giveaway.requirements:
-                user_data = await user_collection.find_one({"id": user_id})
-                if not user_data:
-                    return False, "⚠️ User data not found"
-                
-                if giveaway.requirements.get('min_balance'):
-                    balance = user_data.get('balance', 0)
-                    if balance < giveaway.requirements['min_balance']:
-                        return False, f"⚠️ Minimum balance required: {giveaway.requirements['min_balance']:,} gold"
-                
-                if giveaway.requirements.get('min_characters'):
-                    char_count = len(user_data.get('characters', []))
-                    if char_count < giveaway.requirements['min_characters']:
-                        return False, f"⚠️ Minimum {giveaway.requirements['min_characters']} characters required"
+            if giveaway.requirements.get('min_balance'):
+                balance = user_data.get('balance', 0)
+                if balance < giveaway.requirements['min_balance']:
+                    return False, f"⚠️ Minimum balance required: {giveaway.requirements['min_balance']:,} gold"
             
+            if giveaway.requirements.get('min_characters'):
+                char_count = len(user_data.get('characters', []))
+                if char_count < giveaway.requirements['min_characters']:
+                    return False, f"⚠️ Minimum {giveaway.requirements['min_characters']} characters required"
+        
+        # The counter hands out the entry's sequence number used by the winner draw
+        counters = await giveaway_collection.find_one_and_update(
+            {"_id": giveaway_data["_id"]},
+            {"$inc": {"participant_count": 1, "next_seq": 1}},
+            projection={"participant_count": 1, "next_seq": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        
+        try:
             await participant_collection.insert_one({
                 "giveaway_id": giveaway_data["_id"],
                 "user_id": user_id,
                 "user_name": user_name,
                 "joined_at": datetime.now(timezone.utc),
-                "entries": 1
+                "entries": 1,
+                "seq": counters["next_seq"] - 1
             })
-            
+        except DuplicateKeyError:
+            # A second tap got here first; its number stays unused
             await giveaway_collection.update_one(
                 {"_id": giveaway_data["_id"]},
-                {"$inc": {"participant_count": 1}}
+                {"$inc": {"participant_count": -1}}
             )
-            
-            msg = "╔═══════════════════════╗\n"
-            msg += "║  ✅ <b>ENTRY SUCCESS!</b> ║\n"
-            msg += "╚═══════════════════════╝\n\n"
-            msg += f"🎁 You're now entered!\n"
-            msg += f"👥 Total Entries: <b>{giveaway.participant_count + 1}</b>\n"
-            msg += f"🍀 Good luck!"
-            
-            return True, msg
+            return False, "✅ You're already entered in this giveaway!"
+        
+        msg = "╔═══════════════════════╗\n"
+        msg += "║  ✅ <b>ENTRY SUCCESS!</b> ║\n"
+        msg += "╚═══════════════════════╝\n\n"
+        msg += f"🎁 You're now entered!\n"
+        msg += f"👥 Total Entries: <b>{counters['participant_count']}</b>\n"
+        msg += f"🍀 Good luck!"
+        
+        return True, msg
     
     @staticmethod
     async def end_giveaway(char_id: str) -> tuple[bool, str, List[int]]:
@@ -391,38 +414,26 @@ class GiveawayManager:
         
         giveaway = Giveaway.from_db(giveaway_data)
         
-        participants = await participant_collection.find({
-            "giveaway_id": giveaway_data["_id"]
-        }).to_list(None)
+        winners = await GiveawayManager.draw_winners(giveaway_data, giveaway.max_winners)
         
-        if not participants:
+        if not winners:
             await giveaway_collection.update_one(
                 {"_id": giveaway_data["_id"]},
                 {"$set": {"status": "ended"}}
             )
+            invalidate(ACTIVE_GIVEAWAYS_TAG)
             return True, "⚠️ No participants in giveaway", []
         
         character = await collection.find_one({"id": char_id})
         
-        if giveaway.giveaway_type == "random":
-            num_winners = min(giveaway.max_winners, len(participants))
-            winners = random.sample(participants, num_winners)
-        elif giveaway.giveaway_type == "first_come":
-            sorted_participants = sorted(participants, key=lambda x: x['joined_at'])
-            num_winners = min(giveaway.max_winners, len(sorted_participants))
-            winners = sorted_participants[:num_winners]
-        else:
-            num_winners = min(giveaway.max_winners, len(participants))
-            winners = random.sample(participants, num_winners)
-        
         winner_ids = [w['user_id'] for w in winners]
         
-        for winner in winners:
-            await user_collection.update_one(
-                {"id": winner['user_id']},
-                {"$push": {"characters": character}},
-                upsert=True
-            )
+        await user_collection.bulk_write(
+            [UpdateOne({"id": uid}, {"$push": {"characters": character}}, upsert=True) for uid in winner_ids],
+            ordered=False
+        )
+        for uid in winner_ids:
+            collection_changed(uid, [character.get('id')])
         
         await giveaway_collection.update_one(
             {"_id": giveaway_data["_id"]},
@@ -434,6 +445,7 @@ class GiveawayManager:
                 }
             }
         )
+        invalidate(ACTIVE_GIVEAWAYS_TAG)
         
         message = "╔═══════════════════════╗\n"
         message += "║ 🎊 <b>GIVEAWAY ENDED!</b> ║\n"
@@ -442,10 +454,25 @@ class GiveawayManager:
         message += f"🏆 <b>WINNERS:</b>\n"
         for i, winner in enumerate(winners, 1):
             message += f"{i}. <a href='tg://user?id={winner['user_id']}'>{winner['user_name']}</a>\n"
-        message += f"\n👥 Total Participants: <code>{len(participants)}</code>"
+        message += f"\n👥 Total Participants: <code>{giveaway.participant_count}</code>"
         
         return True, message, winner_ids
     
+    @staticmethod
+    async def draw_winners(giveaway_data: dict, max_winners: int) -> List[dict]:
+        giveaway_id = giveaway_data["_id"]
+        if giveaway_data.get("giveaway_type") == "first_come":
+            return await draw_first(participant_collection, giveaway_id, max_winners)
+        
+        count = giveaway_data.get("participant_count", 0)
+        next_seq = giveaway_data.get("next_seq")
+        # Every entry has a sequence number only if the giveaway was created with the counter
+        if next_seq is not None and next_seq >= count:
+            winners = await draw_by_seq(participant_collection, giveaway_id, next_seq, max_winners)
+            if len(winners) >= min(max_winners, count):
+                return winners
+        return await draw_by_reservoir(participant_collection, giveaway_id, max_winners)
+    
     @staticmethod
     async def is_participant(user_id: int, giveaway_id) -> bool:
         existing = await participant_collection.find_one({
@@ -619,10 +646,14 @@ async def giveaway_callback_handler(update: Update, context: CallbackContext):
             await query.answer(message, show_alert=True)
             
             if success:
-                await asyncio.sleep(1)
-                giveaway_data = await GiveawayManager.get_active_giveaway(char_id)
-                if giveaway_data:
-                    await render_giveaway(query.message, context, giveaway_data, user_id, edit=True)
+                card = query.message
+
+                async def refresh():
+                    giveaway_data = await GiveawayManager.get_active_giveaway(char_id)
+                    if giveaway_data:
+                        await render_giveaway(card, context, giveaway_data, user_id, edit=True)
+
+                live_renderer.edit_once((card.chat_id, card.message_id), refresh)
         
         elif data.startswith("g5rf_"):
             char_id = data.split("_", 1)[1]
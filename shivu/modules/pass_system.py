@@ -3,6 +3,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMe
 from telegram.ext import CommandHandler, CallbackContext, CallbackQueryHandler
 from html import escape
 from shivu import application, user_collection, collection, user_totals_collection, LOGGER
+from shivu.events import collection_changed
 
 OWNER_ID = 8420981179
 
@@ -137,6 +138,7 @@ async def pclaim_command(update: Update, context: CallbackContext):
             mythic_chars = await collection.find({'rarity': '🏵 Mythic'}).limit(mythic_chars_count).to_list(length=mythic_chars_count)
             if mythic_chars:
                 await user_collection.update_one({'id': user_id}, {'$push': {'characters': {'$each': mythic_chars}}})
+                collection_changed(user_id, [c.get('id') for c in mythic_chars])
                 await user_totals_collection.update_one({'id': user_id}, {'$inc': {'count': len(mythic_chars)}}, upsert=True)
                 premium_msg = f"\n{to_small_caps('bonus')}: {len(mythic_chars)} {to_small_caps('mythic added')}"
         await update.message.reply_text(f"{to_small_caps('claimed')}\n{to_small_caps('reward')}: <code>{reward:,}</code>\n{to_small_caps('claims')}: {new_claims}/6{premium_msg}", parse_mode='HTML')
@@ -161,6 +163,7 @@ async def sweekly_command(update: Update, context: CallbackContext):
         await user_collection.update_one({'id': user_id}, update_data)
         if mythic_char:
             await user_totals_collection.update_one({'id': user_id}, {'$inc': {'count': 1}}, upsert=True)
+            collection_changed(user_id, [mythic_char.get('id')])
         char_msg = f"\n{to_small_caps('bonus char')}: {mythic_char.get('name', 'unknown')}" if mythic_char else ""
         await update.message.reply_text(f"{to_small_caps('streak claimed')}\n{to_small_caps('bonus')}: <code>{bonus:,}</code>{char_msg}", parse_mode='HTML')
     except Exception as e:
@@ -187,6 +190,7 @@ async def tasks_command(update: Update, context: CallbackContext):
             mythic_char = await collection.find_one({'rarity': '🏵 Mythic'})
             if mythic_char:
                 await user_collection.update_one({'id': user_id}, {'$push': {'characters': mythic_char}, '$set': {'pass_data.mythic_unlocked': True}})
+                collection_changed(user_id, [mythic_char.get('id')])
                 await user_totals_collection.update_one({'id': user_id}, {'$inc': {'count': 1}}, upsert=True)
                 mythic_unlocked = True
         mythic_status = to_small_caps('unlocked') if mythic_unlocked else to_small_caps('locked')
@@ -298,6 +302,7 @@ async def approve_elite_command(update: Update, context: CallbackContext):
         mythic_chars = await collection.find({'rarity': '🏵 Mythic'}).limit(5).to_list(length=5)
         await user_collection.update_one({'id': target_user_id}, {'$set': {'pass_data.tier': 'elite', 'pass_data.elite_expires': expires, 'pass_data.pending_elite_payment': None}, '$inc': {'balance': activation_bonus}, '$push': {'characters': {'$each': mythic_chars}}})
         await user_totals_collection.update_one({'id': target_user_id}, {'$inc': {'count': len(mythic_chars)}}, upsert=True)
+        collection_changed(target_user_id, [c.get('id') for c in mythic_chars])
         await update.message.reply_text(f"{to_small_caps('elite activated')}\n{to_small_caps('user')}: <code>{target_user_id}</code>\n{to_small_caps('gold')}: <code>{activation_bonus:,}</code>\n{to_small_caps('mythics')}: {len(mythic_chars)}", parse_mode='HTML')
         try:
             await context.bot.send_message(chat_id=target_user_id, text=f"{to_small_caps('elite pass activated')}\n\n{to_small_caps('gold')}: <code>{activation_bonus:,}</code>\n{to_small_caps('mythics')}: {len(mythic_chars)}\n{to_small_caps('expires')}: {expires.strftime('%Y-%m-%d')}", parse_mode='HTML')
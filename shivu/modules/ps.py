@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, InputMediaPhoto 
 from telegram.ext import CallbackContext, CommandHandler, CallbackQueryHandler 
 from shivu import application, db, user_collection 
+from shivu.events import collection_changed
 
 # --- DATABASE & CONFIG ---
 collection = db['anime_characters_lol'] 
@@ -183,6 +184,7 @@ async def luv_callback(update: Update, context: CallbackContext):
         if user.get('balance', 0) < deal['final']: return await q.answer("❌ ɴᴏᴛ ᴇɴᴏᴜɢʜ ɢᴏʟᴅ!", show_alert=True)
         char = next(c for c in luv_data['characters'] if str(c.get("id")) == cid)
         await user_collection.update_one({"id": uid}, {"$inc": {"balance": -deal['final']}, "$push": {"characters": char, "private_store.purchased": cid}})
+        collection_changed(uid, [cid])
         await q.answer("🎊 ᴘᴜʀᴄʜᴀsᴇᴅ!", show_alert=True)
         await q.message.delete()
 
@@ -1,5 +1,7 @@
 import asyncio
+import math
 import random
+import time
 from datetime import datetime, timedelta
 from dataclasses import dataclass, field, asdict
 from typing import List, Dict, Optional, Tuple
@@ -8,9 +10,13 @@ from enum import IntEnum
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message
 from pyrogram.errors import MessageNotModified, BadRequest
+from pymongo import UpdateOne
 
 from shivu.config import Development as Config
 from shivu import shivuu, db, user_collection, collection
+from shivu.live_render import live_renderer
+from shivu.cooldowns import cooldowns
+from shivu.events import collection_changed
 
 class Rarity(IntEnum):
     COMMON = 1
@@ -46,6 +52,9 @@ RARITY_DISPLAY = {
 
 OWNER_IDS = [8420981179, 5147822244]  # Changed to list
 GLOBAL_ID = "global_raid"
+BUCKET_TTL = 600
+MENTION_BATCH = 200
+CHAR_PROJECTION = {"_id": 0, "id": 1, "name": 1, "anime": 1, "rarity": 1, "img_url": 1}
 
 @dataclass
 class RaidConfig:
@@ -76,7 +85,6 @@ class ActiveRaid:
 class RaidDatabase:
     def __init__(self):
         self.settings = db['raid_settings']
-        self.cooldowns = db['raid_cooldown']
         self.active = db['active_raids']
         self._cache: Optional[RaidConfig] = None
         self._cache_time: Optional[datetime] = None
@@ -97,17 +105,12 @@ class RaidDatabase:
         await self.settings.update_one({"_id": GLOBAL_ID}, {"$set": kwargs}, upsert=True)
 
     async def check_cooldown(self, user_id: int, chat_id: int) -> Tuple[bool, int]:
-        cd = await self.cooldowns.find_one({"user": user_id, "chat": chat_id})
-        if cd and cd.get("until") and datetime.utcnow() < cd["until"]:
-            return False, int((cd["until"] - datetime.utcnow()).total_seconds())
-        return True, 0
+        # Rounded up: the last fraction of a second is still cooldown
+        remaining = math.ceil(cooldowns.remaining("raid", user_id, chat_id))
+        return remaining <= 0, remaining
 
     async def set_cooldown(self, user_id: int, chat_id: int, minutes: int) -> None:
-        await self.cooldowns.update_one(
-            {"user": user_id, "chat": chat_id},
-            {"$set": {"until": datetime.utcnow() + timedelta(minutes=minutes)}},
-            upsert=True
-        )
+        cooldowns.start("raid", user_id, minutes * 60, chat_id)
 
     async def create_raid(self, raid: ActiveRaid) -> None:
         await self.active.insert_one({
@@ -152,24 +155,74 @@ class UserManager:
         await user_collection.update_one({"id": user_id}, {"$inc": {"balance": amount}}, upsert=True)
 
     @staticmethod
-    async def add_character(user_id: int, char: Dict) -> None:
+    def owned_entry(char: Dict) -> Dict:
         rarity = char.get("rarity")
         if isinstance(rarity, int):
             rarity = RARITY_DISPLAY.get(rarity, "🟢 Common")
-        
+        return {
+            "id": char.get("id"), "name": char.get("name"),
+            "anime": char.get("anime"), "rarity": rarity, "img_url": char.get("img_url", "")
+        }
+
+    @staticmethod
+    async def add_character(user_id: int, char: Dict) -> None:
         await user_collection.update_one(
             {"id": user_id},
-            {"$push": {"characters": {
-                "id": char.get("id"), "name": char.get("name"),
-                "anime": char.get("anime"), "rarity": rarity, "img_url": char.get("img_url", "")
-            }}},
+            {"$push": {"characters": UserManager.owned_entry(char)}},
             upsert=True
         )
+        collection_changed(user_id, [char.get("id")])
+
+    @staticmethod
+    async def apply_rewards(coins: Dict[int, int], chars: Dict[int, List[Dict]]) -> None:
+        """Every participant's coins and characters in a single bulk write."""
+        ops = []
+        for uid in set(coins) | set(chars):
+            update = {}
+            if coins.get(uid):
+                update["$inc"] = {"balance": coins[uid]}
+            if chars.get(uid):
+                update["$push"] = {"characters": {"$each": [UserManager.owned_entry(c) for c in chars[uid]]}}
+            if update:
+                ops.append(UpdateOne({"id": uid}, update, upsert=True))
+        if ops:
+            await user_collection.bulk_write(ops, ordered=False)
+            for uid, won in chars.items():
+                if won:
+                    collection_changed(uid, [c.get("id") for c in won])
+
+class RarityBucket:
+    """Projected catalog entries per configured rarity set, refreshed every BUCKET_TTL."""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[int, ...], Tuple[float, List[Dict]]] = {}
+
+    async def _load(self, rarities: List[int]) -> List[Dict]:
+        chars = await collection.find({"rarity": {"$in": rarities}}, CHAR_PROJECTION).to_list(None)
+        if not chars:
+            rarity_strings = [RARITY_DISPLAY.get(r, f"R{r}") for r in rarities]
+            chars = await collection.find({"rarity": {"$in": rarity_strings}}, CHAR_PROJECTION).to_list(None)
+        return chars
+
+    async def sample(self, rarities: List[int], count: int) -> List[Dict]:
+        if count <= 0:
+            return []
+        key = tuple(sorted(rarities))
+        cached = self._buckets.get(key)
+        if not cached or time.monotonic() - cached[0] > BUCKET_TTL:
+            cached = (time.monotonic(), await self._load(rarities))
+            self._buckets[key] = cached
+        chars = cached[1]
+        return random.choices(chars, k=count) if chars else []
+
+    def clear(self) -> None:
+        self._buckets.clear()
 
 class RaidExecutor:
-    def __init__(self, db_mgr: RaidDatabase, usr_mgr: UserManager):
+    def __init__(self, db_mgr: RaidDatabase, usr_mgr: UserManager, bucket: RarityBucket):
         self.db = db_mgr
         self.usr = usr_mgr
+        self.bucket = bucket
 
     async def execute(self, client: Client, message: Message, raid_id: str) -> None:
         raid = await self.db.get_raid(raid_id)
@@ -187,56 +240,62 @@ class RaidExecutor:
         await self._send_results(client, message, raid, results, config)
         await self.db.cleanup_old(raid.chat_id)
 
+    @staticmethod
+    def _roll(config: RaidConfig) -> str:
+        roll = random.randint(1, 100)
+        threshold = config.crit_chance
+        if roll <= threshold:
+            return "crit"
+        for outcome, chance in (("char", config.char_chance), ("coins", config.coin_chance), ("loss", config.loss_chance)):
+            threshold += chance
+            if roll <= threshold:
+                return outcome
+        return "nothing"
+
     async def _process_all(self, participants: List[int], config: RaidConfig) -> List[Dict]:
+        rolls = [(uid, self._roll(config)) for uid in participants]
+        needed = sum(1 for _, outcome in rolls if outcome in ("crit", "char"))
+        pool = iter(await self.bucket.sample(config.rarities, needed))
+
         results = []
-        for uid in participants:
-            roll = random.randint(1, 100)
-            threshold = 0
-            
-            if roll <= (threshold := config.crit_chance):
-                char = await self._get_char(config.rarities)
+        coins_by_user: Dict[int, int] = {}
+        chars_by_user: Dict[int, List[Dict]] = {}
+
+        def credit(uid: int, amount: int) -> None:
+            coins_by_user[uid] = coins_by_user.get(uid, 0) + amount
+
+        for uid, outcome in rolls:
+            if outcome in ("crit", "char"):
+                char = next(pool, None)
                 coins = random.randint(config.coin_min, config.coin_max)
-                if char:
-                    await self.usr.add_character(uid, char)
-                    await self.usr.update_balance(uid, coins)
-                    rarity = RARITY_DISPLAY.get(char.get("rarity"), "🟢 Common") if isinstance(char.get("rarity"), int) else char.get("rarity")
+                if not char:
+                    coins = coins * 2 if outcome == "crit" else coins
+                    credit(uid, coins)
+                    results.append({"uid": uid, "type": "coins", "coins": coins, "double": outcome == "crit"})
+                    continue
+                chars_by_user.setdefault(uid, []).append(char)
+                rarity = RARITY_DISPLAY.get(char.get("rarity"), "🟢 Common") if isinstance(char.get("rarity"), int) else char.get("rarity")
+                if outcome == "crit":
+                    credit(uid, coins)
                     results.append({"uid": uid, "type": "crit", "char": char, "rarity": rarity, "coins": coins})
                 else:
-                    await self.usr.update_balance(uid, coins * 2)
-                    results.append({"uid": uid, "type": "coins", "coins": coins * 2, "double": True})
-            
-            elif roll <= (threshold := threshold + config.char_chance):
-                char = await self._get_char(config.rarities)
-                if char:
-                    await self.usr.add_character(uid, char)
-                    rarity = RARITY_DISPLAY.get(char.get("rarity"), "🟢 Common") if isinstance(char.get("rarity"), int) else char.get("rarity")
                     results.append({"uid": uid, "type": "char", "char": char, "rarity": rarity})
-                else:
-                    coins = random.randint(config.coin_min, config.coin_max)
-                    await self.usr.update_balance(uid, coins)
-                    results.append({"uid": uid, "type": "coins", "coins": coins})
-            
-            elif roll <= (threshold := threshold + config.coin_chance):
+
+            elif outcome == "coins":
                 coins = random.randint(config.coin_min, config.coin_max)
-                await self.usr.update_balance(uid, coins)
+                credit(uid, coins)
                 results.append({"uid": uid, "type": "coins", "coins": coins})
-            
-            elif roll <= (threshold := threshold + config.loss_chance):
+
+            elif outcome == "loss":
                 loss = random.randint(config.loss_min, config.loss_max)
-                await self.usr.update_balance(uid, -loss)
+                credit(uid, -loss)
                 results.append({"uid": uid, "type": "loss", "coins": loss})
-            
+
             else:
                 results.append({"uid": uid, "type": "nothing"})
-        
-        return results
 
-    async def _get_char(self, rarities: List[int]) -> Optional[Dict]:
-        chars = await collection.find({"rarity": {"$in": rarities}}).to_list(None)
-        if not chars:
-            rarity_strings = [RARITY_DISPLAY.get(r, f"R{r}") for r in rarities]
-            chars = await collection.find({"rarity": {"$in": rarity_strings}}).to_list(None)
-        return random.choice(chars) if chars else None
+        await self.usr.apply_rewards(coins_by_user, chars_by_user)
+        return results
 
     async def _send_results(self, client: Client, msg: Message, raid: ActiveRaid, results: List[Dict], config: RaidConfig) -> None:
         total_coins = sum(r.get("coins", 0) for r in results if r["type"] in ("crit", "coins"))
@@ -250,8 +309,10 @@ class RaidExecutor:
             f"<b>🏆 ʟᴏᴏᴛ:</b>\n"
         )
 
+        mentions = await self._get_mentions(client, [r["uid"] for r in results])
+
         for r in results:
-            user_text = await self._get_mention(client, r["uid"])
+            user_text = mentions.get(r["uid"], "Unknown")
             
             if r["type"] == "crit":
                 char_id = r["char"].get("id", "???")
@@ -292,17 +353,34 @@ class RaidExecutor:
         except (MessageNotModified, BadRequest):
             pass
 
-    async def _get_mention(self, client: Client, user_id: int) -> str:
+    async def _get_mentions(self, client: Client, user_ids: List[int]) -> Dict[int, str]:
+        """Resolve names with one get_users call per MENTION_BATCH ids."""
+        ids = list(dict.fromkeys(user_ids))
+        chunks = [ids[i:i + MENTION_BATCH] for i in range(0, len(ids), MENTION_BATCH)]
+        mentions = {}
+        await asyncio.gather(*(self._resolve_chunk(client, c, mentions) for c in chunks))
+        return mentions
+
+    async def _resolve_chunk(self, client: Client, ids: List[int], mentions: Dict[int, str]) -> None:
+        """One unresolvable peer fails the whole call; split the chunk until it is isolated."""
         try:
-            user = await client.get_users(user_id)
-            return f"@{user.username}" if user.username else user.first_name
-        except:
-            return "Unknown"
+            users = await client.get_users(ids)
+        except Exception:
+            if len(ids) > 1:
+                half = len(ids) // 2
+                await asyncio.gather(
+                    self._resolve_chunk(client, ids[:half], mentions),
+                    self._resolve_chunk(client, ids[half:], mentions),
+                )
+            return
+        for user in users if isinstance(users, list) else [users]:
+            mentions[user.id] = f"@{user.username}" if user.username else user.first_name
 
 # Initialize
 db_mgr = RaidDatabase()
 usr_mgr = UserManager()
-executor = RaidExecutor(db_mgr, usr_mgr)
+rarity_bucket = RarityBucket()
+executor = RaidExecutor(db_mgr, usr_mgr, rarity_bucket)
 
 @shivuu.on_message(filters.command("setraidloss") & filters.user(OWNER_IDS))
 async def set_loss(_, m: Message):
@@ -404,50 +482,39 @@ async def start_raid(client: Client, message: Message):
     btn = InlineKeyboardMarkup([[InlineKeyboardButton("⚔️ ᴊᴏɪɴ ʀᴀɪᴅ", callback_data=f"jr:{raid_id}")]])
     msg = await message.reply_text(text, reply_markup=btn)
 
-    asyncio.create_task(countdown_updater(client, msg, raid_id, config.duration))
+    track_countdown(msg, raid_id, config.duration, message.from_user.mention)
     await asyncio.sleep(config.duration)
+    live_renderer.untrack(raid_id)
 
     if await db_mgr.get_raid(raid_id):
         await executor.execute(client, msg, raid_id)
 
-async def countdown_updater(client: Client, message: Message, raid_id: str, duration: int):
-    config = await db_mgr.get_config()
-    start_time = datetime.utcnow()
-    
-    for i in range(duration):
-        await asyncio.sleep(1)
-        
-        raid = await db_mgr.get_raid(raid_id)
-        if not raid:
-            break
-
-        elapsed = int((datetime.utcnow() - start_time).total_seconds())
-        time_left = max(0, duration - elapsed)
-        
-        if time_left == 0:
-            break
-
-        try:
-            starter = await client.get_users(raid.starter_id)
-            mention = starter.mention
-        except:
-            mention = "Unknown"
+def track_countdown(message: Message, raid_id: str, duration: int, mention: str) -> None:
+    btn = InlineKeyboardMarkup([[InlineKeyboardButton("⚔️ ᴊᴏɪɴ ʀᴀɪᴅ", callback_data=f"jr:{raid_id}")]])
 
+    async def render(time_left: float):
+        raid = await db_mgr.get_raid(raid_id)
+        if not raid or time_left < 1:
+            return None
+        config = await db_mgr.get_config()
         text = (
             f"<blockquote>⚔️ <b>sʜᴀᴅᴏᴡ ʀᴀɪᴅ ʙᴇɢɪɴs!</b> ⚔️</blockquote>\n\n"
             f"<code>ᴊᴏɪɴ ɴᴏᴡ ᴀɴᴅ ᴄᴏʟʟᴇᴄᴛ ᴛʀᴇᴀsᴜʀᴇs!</code>\n\n"
-            f"⏱ <b>ᴛɪᴍᴇ:</b> <code>{time_left}s</code>\n"
+            f"⏱ <b>ᴛɪᴍᴇ:</b> <code>{int(time_left)}s</code>\n"
             f"💰 <b>ғᴇᴇ:</b> <code>{config.charge} ᴄᴏɪɴs</code>\n"
             f"👥 <b>ᴘᴀʀᴛɪᴄɪᴘᴀɴᴛs:</b> <code>{len(raid.participants)}</code>\n\n"
             f"━━━━━━━━━━━━━━━\n<i>ʙʏ</i> {mention}"
         )
-        btn = InlineKeyboardMarkup([[InlineKeyboardButton("⚔️ ᴊᴏɪɴ ʀᴀɪᴅ", callback_data=f"jr:{raid_id}")]])
-        
+        return text, btn
+
+    async def edit(text, markup):
         try:
-            await message.edit_text(text, reply_markup=btn)
+            await message.edit_text(text, reply_markup=markup)
         except (MessageNotModified, BadRequest):
             pass
 
+    live_renderer.track(raid_id, message.chat.id, render, edit, duration)
+
 @shivuu.on_callback_query(filters.regex(r"^jr:"))
 async def join_raid(client: Client, query: CallbackQuery):
     user_id = query.from_user.id
@@ -473,6 +540,7 @@ async def join_raid(client: Client, query: CallbackQuery):
     await usr_mgr.update_balance(user_id, -config.charge)
     await db_mgr.add_participant(raid_id, user_id)
     await db_mgr.set_cooldown(user_id, raid.chat_id, config.cooldown)
+    live_renderer.touch(raid_id)
     await query.answer("⚔️ ᴊᴏɪɴᴇᴅ ʀᴀɪᴅ!")
 
 @shivuu.on_message(filters.command("setraidcharge") & filters.user(OWNER_IDS))
@@ -2,10 +2,15 @@ import traceback
 from telegram import Update
 from telegram.ext import CommandHandler, CallbackContext
 from shivu import application, db, LOGGER
+from shivu.cache import create_cache, settings_tag
+from shivu.events import settings_changed
 
 spawn_settings_collection = db['spawn_settings']
 group_rarity_collection = db['group_rarity_spawns']
 
+# Read on every spawn; dropped through settings.changed whenever they are edited
+settings_cache = create_cache("spawn_settings", maxsize=5000, ttl=3600)
+
 RARITY_MAP = {
     1: "🟢 Common", 2: "🟣 Rare", 3: "🟡 Legendary", 4: "💮 Special Edition",
     5: "💫 Neon", 6: "✨ Manga", 7: "🎭 Cosplay", 8: "🎐 Celestial",
@@ -49,13 +54,19 @@ EMOJI_TO_NAME = {
 NAME_TO_EMOJI = {v: k for k, v in EMOJI_TO_NAME.items()}
 
 
+async def _load_spawn_settings():
+    settings = await spawn_settings_collection.find_one({'type': 'rarity_control'})
+    if not settings:
+        settings = {'type': 'rarity_control', 'rarities': DEFAULT_RARITIES.copy()}
+        await spawn_settings_collection.insert_one(settings)
+    return settings
+
+
 async def get_spawn_settings():
     try:
-        settings = await spawn_settings_collection.find_one({'type': 'rarity_control'})
-        if not settings:
-            settings = {'type': 'rarity_control', 'rarities': DEFAULT_RARITIES.copy()}
-            await spawn_settings_collection.insert_one(settings)
-        return settings
+        return await settings_cache.get_or_load(
+            'rarity_control', _load_spawn_settings, [settings_tag('rarity_control')]
+        )
     except Exception as e:
         LOGGER.error(f"Error getting spawn settings: {e}")
         return {'type': 'rarity_control', 'rarities': DEFAULT_RARITIES.copy()}
@@ -68,6 +79,7 @@ async def update_spawn_settings(rarities):
             {'$set': {'rarities': rarities}},
             upsert=True
         )
+        settings_changed('rarity_control')
         return True
     except Exception as e:
         LOGGER.error(f"Error updating spawn settings: {e}")
@@ -76,7 +88,12 @@ async def update_spawn_settings(rarities):
 
 async def get_group_exclusive(chat_id):
     try:
-        return await group_rarity_collection.find_one({'chat_id': chat_id})
+        return await settings_cache.get_or_load(
+            ('group_exclusive', chat_id),
+            lambda: group_rarity_collection.find_one({'chat_id': chat_id}),
+            [settings_tag('group_exclusive')],
+            cache_none=True
+        )
     except Exception as e:
         LOGGER.error(f"Error getting group exclusive: {e}")
         return None
@@ -167,6 +184,8 @@ async def setg_command(update: Update, context: CallbackContext):
             }},
             upsert=True
         )
+        # Setting one group can also clear the same rarity from another group
+        settings_changed('group_exclusive')
 
         await update.message.reply_text(
             f"✅ Group exclusive set!\n"
@@ -202,6 +221,7 @@ async def unsetg_command(update: Update, context: CallbackContext):
 
         chat_id = int(context.args[0])
         result = await group_rarity_collection.delete_one({'chat_id': chat_id})
+        settings_changed('group_exclusive', chat_id=chat_id)
 
         if result.deleted_count > 0:
             await update.message.reply_text(
@@ -4,12 +4,14 @@ Atomic thread-safe code redemption with MongoDB backend.
 Handles currency and character rewards with race condition protection.
 """
 
+import io
 import random
 import string
 import html
-import time
 from datetime import datetime, UTC
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import CommandHandler, ContextTypes
@@ -17,7 +19,10 @@ from telegram.ext import CommandHandler, ContextTypes
 # Database imports
 from shivu import collection, user_collection, application
 from shivu import db 
-from shivu.modules.database.sudo import is_user_sudo
+from shivu.auth import auth
+from shivu.indexes import index_registry
+from shivu.cooldowns import cooldowns
+from shivu.events import collection_changed
 
 # --- CONFIGURATION ---
 LOG_GROUP_ID = -1003110990230  # Channel ID for logging activities
@@ -25,63 +30,109 @@ OWNER_ID = 8297659126  # Bot owner's Telegram ID
 CODE_TTL_DAYS = 30  # Codes auto-delete after 30 days to save space
 # ---------------------
 
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+MAX_GENERATION_ROUNDS = 5  # Collision retries for a batch; each round is one insert_many
+MAX_CODES_PER_COMMAND = 1000
+# ---------------------
+
 # Database collection for redeem codes
 codes_collection = db['redeem_codes']
+# One document per (code, user) claim; replaces the claimed_by array on the code
+claims_collection = db['redeem_claims']
+
+# --- DATABASE INDEXES (reconciled at startup by shivu.indexes) ---
+# Unique index prevents duplicate codes at database level
+index_registry.declare("redeem_codes", [("code", 1)], unique=True)
+# TTL index auto-deletes old codes after 30 days
+index_registry.declare("redeem_codes", [("created_at", 1)], expire_after_seconds=CODE_TTL_DAYS * 24 * 60 * 60, name="code_expiry_index")
+# Claims: uniqueness of (code, user) is what stops a second claim
+index_registry.declare("redeem_claims", [("code", 1), ("user_id", 1)], unique=True)
+index_registry.declare("redeem_claims", [("claimed_at", 1)], expire_after_seconds=CODE_TTL_DAYS * 24 * 60 * 60)
+# Claims no longer live in the code document
+index_registry.drop_legacy("redeem_codes", "claim_validation_index")
+
+# --- HELPER FUNCTIONS ---
 
-# Rate limiting cache: user_id -> last_redeem_timestamp
-# Cleared periodically to prevent memory leaks
-_redeem_rate_cache = {}
-_auth_cache = {}  # Simple cache for auth checks: user_id -> (is_sudo, timestamp)
-_AUTH_CACHE_TTL = 300  # 5 minutes cache for sudo checks
+def random_code() -> str:
+    """Random code in the SIYA-XXXX-XXXX format."""
+    part1 = ''.join(random.choices(CODE_ALPHABET, k=4))
+    part2 = ''.join(random.choices(CODE_ALPHABET, k=4))
+    return f"SIYA-{part1}-{part2}"
 
-# --- DATABASE INDEX SETUP FUNCTION ---
-async def setup_redeem_code_indexes():
+async def create_codes(template: Dict[str, Any], count: int) -> List[str]:
     """
-    Creates necessary indexes for optimal performance.
-    Run this once during bot initialization.
+    Creates `count` codes sharing `template` with one insert_many per round.
+    The unique index on `code` catches collisions; only those codes are
+    regenerated in the next round, so no code is probed before inserting.
     """
-    try:
-        # Unique index prevents duplicate codes at database level
-        await codes_collection.create_index([("code", 1)], unique=True)
-        
-        # TTL index auto-deletes old codes after 30 days
-        await codes_collection.create_index(
-            [("created_at", 1)],
-            expireAfterSeconds=CODE_TTL_DAYS * 24 * 60 * 60,
-            name="code_expiry_index"
-        )
-        
-        # Compound index for fast claim validation
-        await codes_collection.create_index(
-            [("code", 1), ("claimed_by", 1)],
-            name="claim_validation_index"
-        )
-        
-        print("✅ Redeem system indexes created successfully")
-    except Exception as e:
-        print(f"❌ Failed to create database indexes: {e}")
-
-# --- HELPER FUNCTIONS ---
-
-async def generate_unique_code(max_attempts: int = 10) -> str:
+    created: List[str] = []
+    needed = count
+    for _ in range(MAX_GENERATION_ROUNDS):
+        batch = set()
+        while len(batch) < needed:
+            batch.add(random_code())
+        docs = [
+            {**template, 'code': code, 'remaining': template['quantity'], 'claimed': 0}
+            for code in batch
+        ]
+        try:
+            await codes_collection.insert_many(docs, ordered=False)
+            return created + list(batch)
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if any(err.get('code') != 11000 for err in errors):
+                raise
+            collided = {docs[err['index']]['code'] for err in errors}
+            created += [code for code in batch if code not in collided]
+            needed = len(collided)
+    raise RuntimeError(f"{needed} codes still colliding after {MAX_GENERATION_ROUNDS} rounds")
+
+async def ensure_claim_counter(code_info: Dict[str, Any]) -> None:
     """
-    Generates a unique code with duplicate prevention.
-    Uses database check to ensure no collisions.
+    Moves a code created with the old claimed_by array to the claims collection
+    and a `remaining` counter. Runs once per legacy code.
     """
-    for attempt in range(max_attempts):
-        part1 = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-        part2 = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-        code = f"SIYA-{part1}-{part2}"
-        
-        # Database check ensures no duplicate codes exist
-        existing = await codes_collection.find_one({'code': code})
-        if not existing:
-            return code
-    
-    # Fallback: use timestamp if max attempts reached
-    timestamp = int(time.time()) % 10000
-    part1 = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-    return f"SIYA-{part1}-{timestamp:04d}"
+    if 'remaining' in code_info:
+        return
+    claimed_by = code_info.get('claimed_by', [])
+    if claimed_by:
+        try:
+            await claims_collection.insert_many(
+                [{'code': code_info['code'], 'user_id': uid, 'claimed_at': code_info.get('created_at', datetime.now(UTC))}
+                 for uid in claimed_by],
+                ordered=False
+            )
+        except BulkWriteError:
+            pass  # Another redeem already moved some of them
+    await codes_collection.update_one(
+        {'code': code_info['code'], 'remaining': {'$exists': False}},
+        {
+            '$set': {'remaining': max(0, code_info.get('quantity', 0) - len(claimed_by)), 'claimed': len(claimed_by)},
+            '$unset': {'claimed_by': ''}
+        }
+    )
+
+async def release_claim(code: str, user_id: int) -> None:
+    """Gives a claim back, e.g. when the reward could not be delivered."""
+    await claims_collection.delete_one({'code': code, 'user_id': user_id})
+    await codes_collection.update_one({'code': code}, {'$inc': {'remaining': 1, 'claimed': -1}})
+
+async def reply_codes(msg, codes: List[str], header: str) -> None:
+    """Sends generated codes inline, or as a text file when there are too many."""
+    listing = "\n".join(codes)
+    if len(listing) < 3500:
+        await msg.reply_text(f"{header}\n\n<code>{listing}</code>", parse_mode=ParseMode.HTML)
+        return
+    document = io.BytesIO(listing.encode())
+    document.name = "codes.txt"
+    await msg.reply_document(document=document, caption=header, parse_mode=ParseMode.HTML)
+
+def parse_code_count(args: List[str], index: int) -> int:
+    """Optional trailing [Codes] argument: how many separate codes to create."""
+    count = int(args[index]) if len(args) > index else 1
+    if not 1 <= count <= MAX_CODES_PER_COMMAND:
+        raise ValueError(f"Codes must be between 1 and {MAX_CODES_PER_COMMAND}")
+    return count
 
 async def send_log(context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
     """Sends formatted log messages to the configured log channel."""
@@ -96,28 +147,17 @@ async def send_log(context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
 
 async def check_auth_cached(user_id: int) -> bool:
     """
-    Checks if user is owner or sudo with simple time-based caching.
+    Checks if user is owner or sudo against the in-memory auth service.
     Returns True if user is authorized, False otherwise.
     """
     # Always allow owner
     if user_id == OWNER_ID:
         return True
     
-    # Check cache first
-    current_time = time.time()
-    cached = _auth_cache.get(user_id)
-    if cached:
-        is_sudo, timestamp = cached
-        if current_time - timestamp < _AUTH_CACHE_TTL:
-            return is_sudo
-    
-    # Cache miss or expired - query database
-    is_sudo = await is_user_sudo(user_id)
-    _auth_cache[user_id] = (is_sudo, current_time)
-    return is_sudo
+    return auth.is_sudo(user_id)
 
 async def check_auth(update: Update) -> bool:
-    """Wrapper for auth check using cached version."""
+    """Wrapper for auth check."""
     user_id = update.effective_user.id
     return await check_auth_cached(user_id)
 
@@ -152,14 +192,7 @@ def check_rate_limit(user_id: int, cooldown_seconds: float = 2.0) -> bool:
     Basic rate limiting to prevent command spam.
     Returns True if allowed, False if rate limited.
     """
-    current_time = time.time()
-    last_time = _redeem_rate_cache.get(user_id, 0)
-    
-    if current_time - last_time < cooldown_seconds:
-        return False
-    
-    _redeem_rate_cache[user_id] = current_time
-    return True
+    return not cooldowns.try_acquire("redeem", user_id, cooldown_seconds)
 
 # --- CURRENCY GENERATION COMMAND ---
 
@@ -179,8 +212,9 @@ async def gen_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     # Validate command arguments
     if len(context.args) < 2:
         await msg.reply_text(
-            "Usage: <code>/gen [Amount] [Quantity]</code>\n"
-            "Example: <code>/gen 5000 10</code>",
+            "Usage: <code>/gen [Amount] [Quantity] [Codes]</code>\n"
+            "Example: <code>/gen 5000 10</code>\n"
+            "<i>Codes: how many separate codes to create (default 1).</i>",
             parse_mode=ParseMode.HTML
         )
         return
@@ -189,57 +223,54 @@ async def gen_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         # Parse and validate input values
         amount = float(context.args[0])
         quantity = int(context.args[1])
+        count = parse_code_count(context.args, 2)
         
         if amount <= 0 or quantity <= 0:
             await msg.reply_text("❌ Amount and quantity must be positive numbers.", parse_mode=ParseMode.HTML)
             return
             
     except ValueError:
-        await msg.reply_text("❌ Invalid format. Use numbers for amount and quantity.", parse_mode=ParseMode.HTML)
-        return
-
-    # Generate unique code with duplicate prevention
-    try:
-        code_str = await generate_unique_code()
-    except Exception as e:
-        await msg.reply_text("❌ Failed to generate unique code. Please try again.", parse_mode=ParseMode.HTML)
-        print(f"Code generation error: {e}")
+        await msg.reply_text(
+            f"❌ Invalid format. Use numbers for amount and quantity (and 1-{MAX_CODES_PER_COMMAND} codes).",
+            parse_mode=ParseMode.HTML
+        )
         return
 
-    # Prepare code document for database
-    code_data = {
-        'code': code_str,
+    # Fields shared by every code of the batch
+    template = {
         'type': 'currency',
         'amount': amount,
         'quantity': quantity,
-        'claimed_by': [],
         'created_at': datetime.now(UTC),
         'created_by': user_id
     }
     
-    # Save to database with error handling
+    # Generate and save the codes in bulk
     try:
-        await codes_collection.insert_one(code_data)
+        codes = await create_codes(template, count)
     except Exception as e:
-        # Handle duplicate key error (should not happen with generate_unique_code)
-        if "duplicate key error" in str(e).lower():
-            await msg.reply_text("⚠️ Generated code already exists. Please try the command again.", parse_mode=ParseMode.HTML)
-        else:
-            await msg.reply_text("❌ Failed to save code to database.", parse_mode=ParseMode.HTML)
+        await msg.reply_text("❌ Failed to save codes to database.", parse_mode=ParseMode.HTML)
         print(f"Database Error: {e}")
         return
 
     # Send success response to admin
     formatted_amount = format_currency_amount(amount)
-    await msg.reply_text(
-        f"✅ <b>Currency Code Created!</b>\n\n"
-        f"🎫 <b>Code:</b> <code>{code_str}</code>\n"
-        f"💰 <b>Value:</b> {formatted_amount}\n"
-        f"👥 <b>Total Claims:</b> {quantity}\n"
-        f"⏰ <b>Expires:</b> After {CODE_TTL_DAYS} days\n\n"
-        f"<i>Code will remain valid even after bot restart.</i>",
-        parse_mode=ParseMode.HTML
-    )
+    if count == 1:
+        await msg.reply_text(
+            f"✅ <b>Currency Code Created!</b>\n\n"
+            f"🎫 <b>Code:</b> <code>{codes[0]}</code>\n"
+            f"💰 <b>Value:</b> {formatted_amount}\n"
+            f"👥 <b>Total Claims:</b> {quantity}\n"
+            f"⏰ <b>Expires:</b> After {CODE_TTL_DAYS} days\n\n"
+            f"<i>Code will remain valid even after bot restart.</i>",
+            parse_mode=ParseMode.HTML
+        )
+    else:
+        await reply_codes(
+            msg, codes,
+            f"✅ <b>{count} Currency Codes Created!</b>\n"
+            f"💰 <b>Value:</b> {formatted_amount} | 👥 <b>Claims each:</b> {quantity}"
+        )
 
     # Log the code generation
     executor_name = html.escape(msg.from_user.first_name)
@@ -247,7 +278,7 @@ async def gen_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         f"📢 <b>#CURRENCY_GEN</b>\n"
         f"Admin: {executor_name} (<code>{user_id}</code>)\n"
         f"Amount: {formatted_amount} | Qty: {quantity}\n"
-        f"Code: <code>{code_str}</code>"
+        f"Code: <code>{codes[0]}</code>" + (f" (+{count - 1} more)" if count > 1 else "")
     )
     await send_log(context, log_text)
 
@@ -269,8 +300,9 @@ async def waifu_gen_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Validate command arguments
     if len(context.args) < 2:
         await msg.reply_text(
-            "Usage: <code>/sgen [Character_ID] [Quantity]</code>\n"
-            "Example: <code>/sgen abc123 5</code>",
+            "Usage: <code>/sgen [Character_ID] [Quantity] [Codes]</code>\n"
+            "Example: <code>/sgen abc123 5</code>\n"
+            "<i>Codes: how many separate codes to create (default 1).</i>",
             parse_mode=ParseMode.HTML
         )
         return
@@ -279,13 +311,17 @@ async def waifu_gen_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Normalize character ID to ensure consistent format
         char_id = normalize_character_id(context.args[0])
         quantity = int(context.args[1])
+        count = parse_code_count(context.args, 2)
         
         if quantity <= 0:
             await msg.reply_text("❌ Quantity must be a positive number.", parse_mode=ParseMode.HTML)
             return
             
     except ValueError:
-        await msg.reply_text("❌ Quantity must be a valid number.", parse_mode=ParseMode.HTML)
+        await msg.reply_text(
+            f"❌ Quantity must be a valid number (and 1-{MAX_CODES_PER_COMMAND} codes).",
+            parse_mode=ParseMode.HTML
+        )
         return
 
     # Fetch character data from main collection
@@ -306,47 +342,41 @@ async def waifu_gen_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         print(f"Character fetch error: {e}")
         return
 
-    # Generate unique code with duplicate prevention
-    try:
-        code_str = await generate_unique_code()
-    except Exception as e:
-        await msg.reply_text("❌ Failed to generate unique code. Please try again.", parse_mode=ParseMode.HTML)
-        print(f"Code generation error: {e}")
-        return
-
-    # Prepare code document for database
-    code_data = {
-        'code': code_str,
+    # Fields shared by every code of the batch
+    template = {
         'type': 'character',
         'character_id': char_id,  # Store normalized ID for reference
         'waifu_data': waifu_data,
         'quantity': quantity,
-        'claimed_by': [],
         'created_at': datetime.now(UTC),
         'created_by': user_id
     }
     
-    # Save to database with error handling
+    # Generate and save the codes in bulk
     try:
-        await codes_collection.insert_one(code_data)
+        codes = await create_codes(template, count)
     except Exception as e:
-        if "duplicate key error" in str(e).lower():
-            await msg.reply_text("⚠️ Generated code already exists. Please try the command again.", parse_mode=ParseMode.HTML)
-        else:
-            await msg.reply_text("❌ Failed to save code to database.", parse_mode=ParseMode.HTML)
+        await msg.reply_text("❌ Failed to save codes to database.", parse_mode=ParseMode.HTML)
         print(f"Database Error: {e}")
         return
 
     # Send success response to admin
-    await msg.reply_text(
-        f"✅ <b>Character Code Created!</b>\n\n"
-        f"🎫 <b>Code:</b> <code>{code_str}</code>\n"
-        f"👤 <b>Character:</b> {html.escape(waifu_data['name'])}\n"
-        f"🏷️ <b>ID:</b> <code>{char_id}</code>\n"
-        f"👥 <b>Total Claims:</b> {quantity}\n"
-        f"⏰ <b>Expires:</b> After {CODE_TTL_DAYS} days",
-        parse_mode=ParseMode.HTML
-    )
+    if count == 1:
+        await msg.reply_text(
+            f"✅ <b>Character Code Created!</b>\n\n"
+            f"🎫 <b>Code:</b> <code>{codes[0]}</code>\n"
+            f"👤 <b>Character:</b> {html.escape(waifu_data['name'])}\n"
+            f"🏷️ <b>ID:</b> <code>{char_id}</code>\n"
+            f"👥 <b>Total Claims:</b> {quantity}\n"
+            f"⏰ <b>Expires:</b> After {CODE_TTL_DAYS} days",
+            parse_mode=ParseMode.HTML
+        )
+    else:
+        await reply_codes(
+            msg, codes,
+            f"✅ <b>{count} Character Codes Created!</b>\n"
+            f"👤 <b>Character:</b> {html.escape(waifu_data['name'])} | 👥 <b>Claims each:</b> {quantity}"
+        )
 
     # Log the code generation
     executor_name = html.escape(msg.from_user.first_name)
@@ -354,7 +384,7 @@ async def waifu_gen_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"📢 <b>#CHARACTER_GEN</b>\n"
         f"Admin: {executor_name} (<code>{user_id}</code>)\n"
         f"Character: {html.escape(waifu_data['name'])} (<code>{char_id}</code>)\n"
-        f"Code: <code>{code_str}</code>"
+        f"Code: <code>{codes[0]}</code>" + (f" (+{count - 1} more)" if count > 1 else "")
     )
     await send_log(context, log_text)
 
@@ -401,52 +431,42 @@ async def redeem_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await msg.reply_text("❌ Invalid code. Code not found.", parse_mode=ParseMode.HTML)
         return
 
+    await ensure_claim_counter(code_info)
+
     """
-    ATOMIC UPDATE - THREAD SAFE
-    This single database operation prevents race conditions by:
-    1. Checking user hasn't claimed before ($ne operator)
-    2. Ensuring quantity limit not reached ($expr with $size)
-    3. Only updating if both conditions pass
-    This prevents the claimed_by list from ever exceeding quantity limit.
+    ATOMIC CLAIM - O(1) PER CLAIM
+    1. Inserting (code, user_id) into the uniquely indexed claims collection
+       fails if this user already claimed the code.
+    2. Decrementing `remaining` only while it is above zero caps the claims
+       at the code's quantity, however many users redeem at once.
+    If step 2 fails the claim from step 1 is removed again.
     """
-    result = await codes_collection.update_one(
-        {
-            'code': code,
-            'claimed_by': {'$ne': user_id},  # User not in claimed list
-            '$expr': {'$lt': [{'$size': '$claimed_by'}, '$quantity']}  # Quantity check
-        },
+    try:
+        await claims_collection.insert_one({'code': code, 'user_id': user_id, 'claimed_at': datetime.now(UTC)})
+    except DuplicateKeyError:
+        await msg.reply_text(
+            "⚠️ <b>Already Claimed:</b> You have already claimed this code.",
+            parse_mode=ParseMode.HTML
+        )
+        return
+
+    updated_code = await codes_collection.find_one_and_update(
+        {'code': code, 'remaining': {'$gt': 0}},
         {
-            '$push': {'claimed_by': user_id},
+            '$inc': {'remaining': -1, 'claimed': 1},
             '$set': {'last_claimed_at': datetime.now(UTC)}
-        }
+        },
+        projection={'claimed': 1, 'quantity': 1},
+        return_document=ReturnDocument.AFTER
     )
 
-    # Handle update result
-    if result.modified_count == 0:
-        # Fetch current state for accurate error messages
-        current_code_info = await codes_collection.find_one({'code': code})
-        if not current_code_info:
+    if updated_code is None:
+        await claims_collection.delete_one({'code': code, 'user_id': user_id})
+        if not await codes_collection.count_documents({'code': code}, limit=1):
             await msg.reply_text("❌ Code no longer exists.", parse_mode=ParseMode.HTML)
-            return
-
-        claimed_by = current_code_info.get('claimed_by', [])
-        quantity = current_code_info.get('quantity', 0)
-        
-        # Determine exact failure reason
-        if user_id in claimed_by:
-            await msg.reply_text(
-                "⚠️ <b>Already Claimed:</b> You have already claimed this code.",
-                parse_mode=ParseMode.HTML
-            )
-        elif len(claimed_by) >= quantity:
-            await msg.reply_text(
-                f"❌ <b>Fully Claimed:</b> This code has reached its limit of {quantity} claims.",
-                parse_mode=ParseMode.HTML
-            )
         else:
-            # This case should rarely occur - indicates database inconsistency
             await msg.reply_text(
-                "❌ Unable to process claim. Please try again.",
+                f"❌ <b>Fully Claimed:</b> This code has reached its limit of {code_info.get('quantity', 0)} claims.",
                 parse_mode=ParseMode.HTML
             )
         return
@@ -482,6 +502,7 @@ async def redeem_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 {'$addToSet': {'characters': waifu_data}},  # Prevent duplicates
                 upsert=True
             )
+            collection_changed(user_id, [waifu_data.get('id')])
             
             # Try to send character card with image
             try:
@@ -514,19 +535,13 @@ async def redeem_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             log_detail = f"Character: {html.escape(waifu_data['name'])}"
         else:
             # Rollback claim for unknown reward type
-            await codes_collection.update_one(
-                {'code': code},
-                {'$pull': {'claimed_by': user_id}}
-            )
+            await release_claim(code, user_id)
             await msg.reply_text("❌ Unknown reward type. Code has been reset.", parse_mode=ParseMode.HTML)
             return
 
     except Exception as e:
         # Critical: Rollback claim if reward distribution fails
-        await codes_collection.update_one(
-            {'code': code},
-            {'$pull': {'claimed_by': user_id}}
-        )
+        await release_claim(code, user_id)
         await msg.reply_text(
             "❌ <b>Failed to process reward.</b>\n"
             "Your claim has been rolled back. Please try again later.",
@@ -537,7 +552,7 @@ async def redeem_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     # Log successful redemption
     user_name = html.escape(msg.from_user.first_name)
-    total_claimed = len(code_info.get('claimed_by', [])) + 1
+    total_claimed = updated_code.get('claimed', 0)
     log_text = (
         f"📢 <b>#REDEEM_LOG</b>\n"
         f"User: {user_name} (<code>{user_id}</code>)\n"
@@ -573,6 +588,7 @@ async def revoke_code_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     result = await codes_collection.delete_one({'code': code})
 
     if result.deleted_count > 0:
+        await claims_collection.delete_many({'code': code})
         await msg.reply_text(
             f"🗑️ <b>Code Revoked</b>\n\n"
             f"Code: <code>{code}</code>\n"
@@ -626,7 +642,7 @@ async def list_codes_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         for idx, code in enumerate(codes, 1):
             code_type = code.get('type', 'unknown')
-            claimed = len(code.get('claimed_by', []))
+            claimed = code.get('claimed', len(code.get('claimed_by', [])))
             total = code.get('quantity', 0)
             created_date = code['created_at'].strftime('%Y-%m-%d')
             code_value = code['code']
@@ -656,31 +672,6 @@ async def list_codes_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await msg.reply_text("❌ Failed to fetch codes from database.", parse_mode=ParseMode.HTML)
         print(f"List codes error: {e}")
 
-# --- CLEANUP FUNCTION FOR CACHE ---
-
-async def cleanup_caches():
-    """
-    Periodically clears old entries from caches to prevent memory leaks.
-    Should be run as a background task.
-    """
-    while True:
-        await asyncio.sleep(3600)  # Run every hour
-        current_time = time.time()
-        
-        # Clean rate limit cache (keep only last 2 hours)
-        global _redeem_rate_cache
-        _redeem_rate_cache = {
-            k: v for k, v in _redeem_rate_cache.items() 
-            if current_time - v < 7200  # 2 hours
-        }
-        
-        # Clean auth cache (keep only valid entries)
-        global _auth_cache
-        _auth_cache = {
-            k: v for k, v in _auth_cache.items() 
-            if current_time - v[1] < _AUTH_CACHE_TTL
-        }
-
 # --- REGISTER COMMAND HANDLERS ---
 # Note: block=False allows parallel execution of commands
 
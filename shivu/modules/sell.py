@@ -3,35 +3,191 @@ from telegram.ext import CallbackContext, CommandHandler, CallbackQueryHandler
 from telegram.error import BadRequest
 from datetime import datetime, timedelta
 from bson import ObjectId
-from shivu import application, db, user_collection
+from bson.errors import InvalidId
+from collections import OrderedDict
+from dataclasses import dataclass
+from shivu import application, db, lol, user_collection
+from shivu.cache import create_cache, user_tag
+from shivu.events import collection_changed
+from shivu.market_purchase import MARKET_FEE, PurchaseEngine
+from shivu.startup import startup
 import asyncio
-from typing import Optional, Dict, List
+import base64
+import json
+import re
+import struct
+import zlib
+from typing import Optional, List
 
 collection = db['anime_characters_lol']
 sell_listings = db['sell_listings']
 sell_history = db['sell_history']
+market_filters = db['market_filters']
 
 MIN_PRICE = 100
 MAX_PRICE = 1000000
-MARKET_FEE = 0.05
 MAX_LISTINGS_PER_USER = 10
 CACHE_TIMEOUT = 300
 BATCH_SIZE = 50
 
-cache_store: Dict[str, tuple] = {}
+seller_names = create_cache("sell_seller_names", maxsize=5000, ttl=CACHE_TIMEOUT)
+
+EPOCH = datetime(1970, 1, 1)
+MAX_FILTERS = 5000
+PRICE_RANGE_RE = re.compile(r"^(\d+)-(\d+)$")
+FILTER_EXPIRED = "⚠️ ᴇxᴘɪʀᴇᴅ, ʀᴜɴ ᴛʜᴇ ᴄᴏᴍᴍᴀɴᴅ ᴀɢᴀɪɴ"
+
+
+@dataclass
+class MarketCursor:
+    """Opaque page position carried in button callback data.
+
+    Packs the shown listing's (listed_at, _id) keyset, its page number, the
+    result total and the id of the filter being browsed into 43 url-safe chars.
+    """
+    listed_at: datetime
+    oid: ObjectId
+    page: int
+    total: int
+    filter_id: int
+
+    _FORMAT = ">q12sIII"
+
+    def encode(self) -> str:
+        ms = int((self.listed_at - EPOCH).total_seconds() * 1000)
+        raw = struct.pack(self._FORMAT, ms, self.oid.binary, self.page, self.total, self.filter_id)
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> Optional["MarketCursor"]:
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            ms, oid, page, total, filter_id = struct.unpack(cls._FORMAT, raw)
+            return cls(EPOCH + timedelta(milliseconds=ms), ObjectId(oid), page, total, filter_id)
+        except (ValueError, struct.error, InvalidId):
+            return None
+
+    @classmethod
+    def at(cls, listing: dict, page: int, total: int, filter_id: int) -> "MarketCursor":
+        return cls(listing.get("listed_at") or EPOCH, listing["_id"], page, total, filter_id)
+
+
+class MarketQuery:
+    """Keyset pagination over sell_listings ordered by (listed_at, _id) newest first.
+
+    Filters are registered under a short id so buttons only carry the id; every
+    page flip is a single indexed find returning one listing. Registered filters
+    are also stored in `market_filters` so buttons keep working after a restart
+    or an eviction from memory; an id found in neither has expired.
+    """
+
+    SORT_NEWEST = [("listed_at", -1), ("_id", -1)]
+    SORT_OLDEST = [("listed_at", 1), ("_id", 1)]
+
+    def __init__(self):
+        self._filters: "OrderedDict[int, dict]" = OrderedDict()
+
+    def _remember(self, filter_id: int, query: dict) -> None:
+        self._filters[filter_id] = query
+        self._filters.move_to_end(filter_id)
+        while len(self._filters) > MAX_FILTERS:
+            self._filters.popitem(last=False)
+
+    async def register_filter(self, query: dict) -> int:
+        if not query:
+            return 0
+        encoded = json.dumps(query, sort_keys=True)
+        filter_id = zlib.crc32(encoded.encode()) or 1
+        self._remember(filter_id, query)
+        await market_filters.update_one(
+            {"_id": filter_id}, {"$set": {"query": encoded, "at": datetime.utcnow()}}, upsert=True
+        )
+        return filter_id
+
+    async def get_filter(self, filter_id: int) -> Optional[dict]:
+        """The registered filter, {} for the whole market, None once it has expired."""
+        if not filter_id:
+            return {}
+        query = self._filters.get(filter_id)
+        if query is None:
+            doc = await market_filters.find_one({"_id": filter_id}, {"query": 1})
+            if doc is None:
+                return None
+            query = json.loads(doc["query"])
+            self._remember(filter_id, query)
+        return query
+
+    @staticmethod
+    def parse_args(args: List[str]) -> dict:
+        """`/market [rarity emoji] [min-max] [anime name]` -> Mongo filter."""
+        query = {}
+        anime = []
+        for arg in args:
+            price = PRICE_RANGE_RE.match(arg)
+            if price:
+                low, high = sorted((int(price.group(1)), int(price.group(2))))
+                query["price"] = {"$gte": low, "$lte": high}
+            elif not any(ch.isalnum() for ch in arg) and "rarity_key" not in query:
+                query["rarity_key"] = arg
+            else:
+                anime.append(arg)
+        if anime:
+            query["anime_key"] = " ".join(anime).lower()
+        return query
+
+    async def count(self, query: dict) -> int:
+        return await sell_listings.count_documents(query)
+
+    async def first(self, query: dict) -> Optional[dict]:
+        return await sell_listings.find_one(query, sort=self.SORT_NEWEST)
+
+    async def step(self, query: dict, cursor: MarketCursor, forward: bool) -> Optional[dict]:
+        """The listing right after (forward) or before the cursor position."""
+        op = "$lt" if forward else "$gt"
+        keyset = {"$or": [
+            {"listed_at": {op: cursor.listed_at}},
+            {"listed_at": cursor.listed_at, "_id": {op: cursor.oid}},
+        ]}
+        full = {"$and": [query, keyset]} if query else keyset
+        return await sell_listings.find_one(full, sort=self.SORT_NEWEST if forward else self.SORT_OLDEST)
+
+    async def get(self, oid: ObjectId) -> Optional[dict]:
+        return await sell_listings.find_one({"_id": oid})
+
+
+market_query = MarketQuery()
+
+
+purchase_engine = PurchaseEngine(lol, sell_listings, user_collection, sell_history)
+
+
+def listing_keys(char: dict) -> dict:
+    """Normalised fields the marketplace filters and indexes on."""
+    rarity = char.get("rarity") or ""
+    return {
+        "rarity_key": rarity.split(" ")[0] if rarity else "",
+        "anime_key": (char.get("anime") or "").lower(),
+    }
+
+
+@startup.on_startup("market listing keys")
+async def backfill_listing_keys():
+    """Give listings created before filters existed their rarity/anime keys."""
+    await sell_listings.update_many(
+        {"anime_key": {"$exists": False}},
+        [{"$set": {
+            "anime_key": {"$toLower": {"$ifNull": ["$character.anime", ""]}},
+            "rarity_key": {"$arrayElemAt": [{"$split": [{"$ifNull": ["$character.rarity", ""]}, " "]}, 0]},
+        }}]
+    )
 
 async def get_cached_user(bot, user_id: int) -> Optional[str]:
-    cache_key = f"user_{user_id}"
-    if cache_key in cache_store:
-        data, timestamp = cache_store[cache_key]
-        if datetime.utcnow().timestamp() - timestamp < CACHE_TIMEOUT:
-            return data
+    async def load() -> str:
+        user = await bot.get_chat(user_id)
+        return user.first_name[:15]
     
     try:
-        user = await bot.get_chat(user_id)
-        username = user.first_name[:15]
-        cache_store[cache_key] = (username, datetime.utcnow().timestamp())
-        return username
+        return await seller_names.get_or_load(user_id, load, [user_tag(user_id)])
     except:
         return "Unknown"
 
@@ -95,27 +251,29 @@ def create_listing_caption(listing: dict, seller_name: str, is_own: bool, page:
             f"</blockquote>\n\n"
         )
     
-    caption += f"📖 <b>ᴘᴀɢᴇ:</b> {page+1}/{total}"
+    caption += f"📖 <b>ᴘᴀɢᴇ:</b> {page+1}/{max(total, page+1)}"
     return caption
 
-def create_navigation_buttons(listing: dict, page: int, total: int, is_own: bool) -> InlineKeyboardMarkup:
+def create_navigation_buttons(cursor: MarketCursor, is_own: bool) -> InlineKeyboardMarkup:
     buttons = []
+    token = cursor.encode()
+    page, total = cursor.page, max(cursor.total, cursor.page + 1)
     
     if is_own:
-        buttons.append([InlineKeyboardButton("🗑️ ʀᴇᴍᴏᴠᴇ ʟɪsᴛɪɴɢ", callback_data=f"market_remove_{listing['_id']}")])
+        buttons.append([InlineKeyboardButton("🗑️ ʀᴇᴍᴏᴠᴇ ʟɪsᴛɪɴɢ", callback_data=f"market_remove_{token}")])
     else:
-        buttons.append([InlineKeyboardButton("💳 ʙᴜʏ ɴᴏᴡ", callback_data=f"bi_{listing['_id']}")])
+        buttons.append([InlineKeyboardButton("💳 ʙᴜʏ ɴᴏᴡ", callback_data=f"bi_{token}")])
     
     if total > 1:
         nav = []
         if page > 0:
-            nav.append(InlineKeyboardButton("⬅️ ᴘʀᴇᴠ", callback_data=f"market_page_{page-1}"))
+            nav.append(InlineKeyboardButton("⬅️ ᴘʀᴇᴠ", callback_data=f"market_p_{token}"))
         nav.append(InlineKeyboardButton(f"• {page+1}/{total} •", callback_data="market_pageinfo"))
         if page < total - 1:
-            nav.append(InlineKeyboardButton("ɴᴇxᴛ ➡️", callback_data=f"market_page_{page+1}"))
+            nav.append(InlineKeyboardButton("ɴᴇxᴛ ➡️", callback_data=f"market_n_{token}"))
         buttons.append(nav)
     
-    buttons.append([InlineKeyboardButton("🔄 ʀᴇғʀᴇsʜ", callback_data="market_refresh")])
+    buttons.append([InlineKeyboardButton("🔄 ʀᴇғʀᴇsʜ", callback_data=f"market_refresh_{cursor.filter_id}")])
     
     return InlineKeyboardMarkup(buttons)
 
@@ -170,10 +328,12 @@ async def sell(update: Update, context: CallbackContext):
             "character": char_to_sell,
             "price": price,
             "listed_at": datetime.utcnow(),
-            "views": 0
+            "views": 0,
+            **listing_keys(char_to_sell)
         })
         
         await user_collection.update_one({"id": user_id}, {"$pull": {"characters": char_to_sell}})
+        collection_changed(user_id, [char_id])
         
         fee = int(price * MARKET_FEE)
         you_get = price - fee
@@ -221,6 +381,7 @@ async def unsell(update: Update, context: CallbackContext):
         
         await user_collection.update_one({"id": user_id}, {"$push": {"characters": listing["character"]}}, upsert=True)
         await sell_listings.delete_one({"_id": listing["_id"]})
+        collection_changed(user_id, [listing["character"].get("id")])
         
         await update.message.reply_text(
             f"✅ <b>ʀᴇᴍᴏᴠᴇᴅ ғʀᴏᴍ ᴍᴀʀᴋᴇᴛ</b>\n\n"
@@ -235,9 +396,11 @@ async def unsell(update: Update, context: CallbackContext):
 async def market(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
     
-    listings = await sell_listings.find({}).sort("listed_at", -1).limit(200).to_list(length=200)
+    query = market_query.parse_args(context.args or [])
+    filter_id = await market_query.register_filter(query)
+    listing, total = await asyncio.gather(market_query.first(query), market_query.count(query))
     
-    if not listings:
+    if not listing:
         await update.message.reply_text(
             "🏪 <b>ᴍᴀʀᴋᴇᴛᴘʟᴀᴄᴇ</b>\n\n"
             "<blockquote>😔 ɴᴏ ᴄʜᴀʀᴀᴄᴛᴇʀs ᴄᴜʀʀᴇɴᴛʟʏ ᴀᴠᴀɪʟᴀʙʟᴇ\n\n"
@@ -245,22 +408,22 @@ async def market(update: Update, context: CallbackContext):
             "• /sell - ʟɪsᴛ ʏᴏᴜʀ ᴄʜᴀʀᴀᴄᴛᴇʀs\n"
             "• /mymarket - ʏᴏᴜʀ ʟɪsᴛɪɴɢs\n"
             "• /msales - ᴛʀᴀᴅᴇ ʜɪsᴛᴏʀʏ\n"
-            "• /lists - ᴠɪᴇᴡ ᴀʟʟ ʟɪsᴛɪɴɢs</blockquote>",
+            "• /lists - ᴠɪᴇᴡ ᴀʟʟ ʟɪsᴛɪɴɢs\n"
+            "• /market 🟡 1000-50000 naruto - ғɪʟᴛᴇʀ</blockquote>",
             parse_mode="HTML"
         )
         return
     
-    context.user_data['market_listings'] = [str(l['_id']) for l in listings]
-    context.user_data['market_page'] = 0
-    context.user_data['viewing_mine'] = False
-    await render_market_page(update.message, context, listings, 0, user_id)
+    await render_market_page(update.message, context, listing, MarketCursor.at(listing, 0, total, filter_id), user_id)
 
 async def mymarket(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
     
-    listings = await sell_listings.find({"seller_id": user_id}).sort("listed_at", -1).limit(100).to_list(length=100)
+    query = {"seller_id": user_id}
+    filter_id = await market_query.register_filter(query)
+    listing, total = await asyncio.gather(market_query.first(query), market_query.count(query))
     
-    if not listings:
+    if not listing:
         await update.message.reply_text(
             "📦 <b>ʏᴏᴜʀ ʟɪsᴛɪɴɢs</b>\n\n"
             "<blockquote>😔 ʏᴏᴜ ʜᴀᴠᴇ ɴᴏ ᴀᴄᴛɪᴠᴇ ʟɪsᴛɪɴɢs\n\n"
@@ -269,13 +432,11 @@ async def mymarket(update: Update, context: CallbackContext):
         )
         return
     
-    context.user_data['market_listings'] = [str(l['_id']) for l in listings]
-    context.user_data['market_page'] = 0
-    context.user_data['viewing_mine'] = True
-    await render_market_page(update.message, context, listings, 0, user_id, my_listings=True)
+    await render_market_page(update.message, context, listing, MarketCursor.at(listing, 0, total, filter_id), user_id)
 
 async def lists(update: Update, context: CallbackContext):
-    listings = await sell_listings.find({}).sort("listed_at", -1).limit(200).to_list(length=200)
+    listings_task = sell_listings.find({}).sort(MarketQuery.SORT_NEWEST).limit(BATCH_SIZE).to_list(length=BATCH_SIZE)
+    listings, total = await asyncio.gather(listings_task, sell_listings.estimated_document_count())
     
     if not listings:
         await update.message.reply_text(
@@ -287,12 +448,12 @@ async def lists(update: Update, context: CallbackContext):
         return
     
     text = f"📋 <b>ᴍᴀʀᴋᴇᴛ ʟɪsᴛɪɴɢs</b>\n\n"
-    text += f"<blockquote><b>ᴛᴏᴛᴀʟ ʟɪsᴛɪɴɢs:</b> {len(listings)}/200</blockquote>\n\n"
+    text += f"<blockquote><b>ᴛᴏᴛᴀʟ ʟɪsᴛɪɴɢs:</b> {total}</blockquote>\n\n"
     
-    seller_tasks = [get_cached_user(context.bot, listing["seller_id"]) for listing in listings[:BATCH_SIZE]]
+    seller_tasks = [get_cached_user(context.bot, listing["seller_id"]) for listing in listings]
     seller_names = await asyncio.gather(*seller_tasks)
     
-    for idx, (listing, seller_name) in enumerate(zip(listings[:BATCH_SIZE], seller_names), 1):
+    for idx, (listing, seller_name) in enumerate(zip(listings, seller_names), 1):
         char = listing["character"]
         price = listing["price"]
         
@@ -312,18 +473,14 @@ async def lists(update: Update, context: CallbackContext):
     if text:
         await update.message.reply_text(text, parse_mode="HTML")
     
-    if len(listings) > BATCH_SIZE:
+    if total > BATCH_SIZE:
         await update.message.reply_text(
-            f"<blockquote>📊 <b>sʜᴏᴡɪɴɢ:</b> {BATCH_SIZE}/{len(listings)} ʟɪsᴛɪɴɢs\n\n"
+            f"<blockquote>📊 <b>sʜᴏᴡɪɴɢ:</b> {BATCH_SIZE}/{total} ʟɪsᴛɪɴɢs\n\n"
             f"💡 ᴜsᴇ /market ᴛᴏ ʙʀᴏᴡsᴇ ᴡɪᴛʜ ɪᴍᴀɢᴇs</blockquote>",
             parse_mode="HTML"
         )
 
-async def render_market_page(message, context, listings, page, user_id, my_listings=False):
-    if page >= len(listings):
-        return
-    
-    listing = listings[page]
+async def render_market_page(message, context, listing, cursor, user_id):
     char = listing["character"]
     seller_id = listing["seller_id"]
     
@@ -333,8 +490,8 @@ async def render_market_page(message, context, listings, page, user_id, my_listi
     is_video = char.get("rarity") == "🎥 AMV"
     is_own = seller_id == user_id
     
-    caption = create_listing_caption(listing, seller_name, is_own, page, len(listings))
-    markup = create_navigation_buttons(listing, page, len(listings), is_own)
+    caption = create_listing_caption(listing, seller_name, is_own, cursor.page, cursor.total)
+    markup = create_navigation_buttons(cursor, is_own)
     
     try:
         if is_video:
@@ -394,35 +551,44 @@ async def market_callback(update: Update, context: CallbackContext):
     user_id = query.from_user.id
     data = query.data
     
-    if data.startswith("market_page_"):
-        await query.answer()
-        page = int(data.split("_")[2])
-        listings = [await sell_listings.find_one({"_id": ObjectId(lid)}) for lid in context.user_data.get('market_listings', [])]
-        listings = [l for l in listings if l]
-        
-        if listings:
-            context.user_data['market_page'] = page
-            await update_market_display(query, context, listings, page, user_id)
-    
-    elif data == "market_pageinfo":
+    if data == "market_pageinfo":
         await query.answer("📖 ᴜsᴇ ᴀʀʀᴏᴡs ᴛᴏ ɴᴀᴠɪɢᴀᴛᴇ")
     
-    elif data == "market_refresh":
-        is_mine = context.user_data.get('viewing_mine', False)
-        filter_query = {"seller_id": user_id} if is_mine else {}
+    elif data.startswith(("market_n_", "market_p_")):
+        cursor = MarketCursor.decode(data[len("market_n_"):])
+        if not cursor:
+            await query.answer("⚠️ ᴇxᴘɪʀᴇᴅ, ᴜsᴇ /market ᴀɢᴀɪɴ", show_alert=True)
+            return
+        
+        forward = data.startswith("market_n_")
+        filter_query = await market_query.get_filter(cursor.filter_id)
+        if filter_query is None:
+            await query.answer(FILTER_EXPIRED, show_alert=True)
+            return
+        listing = await market_query.step(filter_query, cursor, forward)
+        
+        if not listing:
+            await query.answer("😔 ɴᴏ ᴍᴏʀᴇ ʟɪsᴛɪɴɢs" if forward else "📖 ᴀʟʀᴇᴀᴅʏ ᴏɴ ғɪʀsᴛ ᴘᴀɢᴇ")
+            return
         
-        listings = await sell_listings.find(filter_query).sort("listed_at", -1).limit(200).to_list(length=200)
-        if listings:
-            context.user_data['market_listings'] = [str(l['_id']) for l in listings]
-            context.user_data['market_page'] = 0
-            await update_market_display(query, context, listings, 0, user_id)
+        await query.answer()
+        page = cursor.page + 1 if forward else max(cursor.page - 1, 0)
+        await update_market_display(query, context, listing, MarketCursor.at(listing, page, cursor.total, cursor.filter_id), user_id)
+    
+    elif data.startswith("market_refresh_"):
+        filter_id = int(data.replace("market_refresh_", "") or 0)
+        filter_query = await market_query.get_filter(filter_id)
+        if filter_query is None:
+            await query.answer(FILTER_EXPIRED, show_alert=True)
+        elif await show_first_page(query, context, filter_id, filter_query, user_id):
             await query.answer("🔄 ʀᴇғʀᴇsʜᴇᴅ")
         else:
             await query.answer("😔 ɴᴏ ʟɪsᴛɪɴɢs", show_alert=True)
     
     elif data.startswith("bi_"):
-        listing_id = data.replace("bi_", "")
-        listing = await sell_listings.find_one({"_id": ObjectId(listing_id)})
+        token = data.replace("bi_", "")
+        cursor = MarketCursor.decode(token)
+        listing = await market_query.get(cursor.oid) if cursor else None
         
         if not listing:
             await query.answer("⚠️ ʟɪsᴛɪɴɢ ɴᴏ ʟᴏɴɢᴇʀ ᴀᴠᴀɪʟᴀʙʟᴇ", show_alert=True)
@@ -465,8 +631,8 @@ async def market_callback(update: Update, context: CallbackContext):
         )
         
         buttons = [[
-            InlineKeyboardButton("✅ ᴄᴏɴғɪʀᴍ ᴘᴜʀᴄʜᴀsᴇ", callback_data=f"cf_{listing['_id']}"),
-            InlineKeyboardButton("❌ ᴄᴀɴᴄᴇʟ", callback_data="market_cancel")
+            InlineKeyboardButton("✅ ᴄᴏɴғɪʀᴍ ᴘᴜʀᴄʜᴀsᴇ", callback_data=f"cf_{token}"),
+            InlineKeyboardButton("❌ ᴄᴀɴᴄᴇʟ", callback_data=f"market_c_{token}")
         ]]
         
         try:
@@ -480,61 +646,34 @@ async def market_callback(update: Update, context: CallbackContext):
             await query.answer()
     
     elif data.startswith("cf_"):
-        listing_id = data.replace("cf_", "")
-        listing = await sell_listings.find_one({"_id": ObjectId(listing_id)})
+        cursor = MarketCursor.decode(data.replace("cf_", ""))
+        if not cursor:
+            await query.answer("⚠️ ʟɪsᴛɪɴɢ ɴᴏ ʟᴏɴɢᴇʀ ᴀᴠᴀɪʟᴀʙʟᴇ", show_alert=True)
+            return
         
-        if not listing:
+        result = await purchase_engine.buy(cursor.oid, user_id)
+        
+        if result.status == "gone":
             await query.answer("⚠️ ʟɪsᴛɪɴɢ ɴᴏ ʟᴏɴɢᴇʀ ᴀᴠᴀɪʟᴀʙʟᴇ", show_alert=True)
             return
         
-        if listing["seller_id"] == user_id:
+        if result.status == "own":
             await query.answer("⚠️ ᴄᴀɴ'ᴛ ʙᴜʏ ʏᴏᴜʀ ᴏᴡɴ ʟɪsᴛɪɴɢ", show_alert=True)
             return
         
-        user_data = await user_collection.find_one({"id": user_id}, {"balance": 1})
-        balance = user_data.get("balance", 0) if user_data else 0
-        price = listing["price"]
-        
-        if balance < price:
-            shortage = price - balance
+        if result.status == "funds":
             await query.answer(
                 f"⚠️ ɪɴsᴜғғɪᴄɪᴇɴᴛ ʙᴀʟᴀɴᴄᴇ\n\n"
-                f"💰 ɴᴇᴇᴅ: {price:,} ɢᴏʟᴅ\n"
-                f"💵 ʜᴀᴠᴇ: {balance:,} ɢᴏʟᴅ\n"
-                f"📉 sʜᴏʀᴛ: {shortage:,} ɢᴏʟᴅ",
+                f"💰 ɴᴇᴇᴅ: {result.listing['price']:,} ɢᴏʟᴅ",
                 show_alert=True
             )
             return
         
+        listing = result.listing
         char = listing["character"]
-        fee = int(price * MARKET_FEE)
-        seller_gets = price - fee
-        
-        update_buyer = user_collection.update_one(
-            {"id": user_id},
-            {"$inc": {"balance": -price}, "$push": {"characters": char}},
-            upsert=True
-        )
-        
-        update_seller = user_collection.update_one(
-            {"id": listing["seller_id"]},
-            {"$inc": {"balance": seller_gets}},
-            upsert=True
-        )
-        
-        delete_listing = sell_listings.delete_one({"_id": listing["_id"]})
-        
-        insert_history = sell_history.insert_one({
-            "seller_id": listing["seller_id"],
-            "buyer_id": user_id,
-            "character_name": char.get("name", "Unknown"),
-            "character_anime": char.get("anime", "Unknown"),
-            "price": price,
-            "fee": fee,
-            "sold_at": datetime.utcnow()
-        })
-        
-        await asyncio.gather(update_buyer, update_seller, delete_listing, insert_history)
+        price = listing["price"]
+        fee = result.fee
+        seller_gets = result.seller_gets
         
         try:
             await context.bot.send_message(
@@ -565,7 +704,7 @@ async def market_callback(update: Update, context: CallbackContext):
             f"</blockquote>\n\n"
             f"<blockquote>"
             f"💰 <b>ᴘᴀɪᴅ:</b> <code>{price:,}</code> ɢᴏʟᴅ\n"
-            f"💵 <b>ɴᴇᴡ ʙᴀʟᴀɴᴄᴇ:</b> <code>{balance - price:,}</code> ɢᴏʟᴅ"
+            f"💵 <b>ɴᴇᴡ ʙᴀʟᴀɴᴄᴇ:</b> <code>{result.balance:,}</code> ɢᴏʟᴅ"
             f"</blockquote>\n\n"
             f"🎉 ᴄʜᴀʀᴀᴄᴛᴇʀ ᴀᴅᴅᴇᴅ ᴛᴏ ʏᴏᴜʀ ᴄᴏʟʟᴇᴄᴛɪᴏɴ!"
         )
@@ -580,8 +719,8 @@ async def market_callback(update: Update, context: CallbackContext):
             await query.answer("✨ ᴘᴜʀᴄʜᴀsᴇᴅ sᴜᴄᴄᴇssғᴜʟʟʏ!")
     
     elif data.startswith("market_remove_"):
-        listing_id = data.replace("market_remove_", "")
-        listing = await sell_listings.find_one({"_id": ObjectId(listing_id), "seller_id": user_id})
+        cursor = MarketCursor.decode(data.replace("market_remove_", ""))
+        listing = await sell_listings.find_one({"_id": cursor.oid, "seller_id": user_id}) if cursor else None
         
         if not listing:
             await query.answer("⚠️ ʟɪsᴛɪɴɢ ɴᴏᴛ ғᴏᴜɴᴅ", show_alert=True)
@@ -595,39 +734,44 @@ async def market_callback(update: Update, context: CallbackContext):
         delete_list = sell_listings.delete_one({"_id": listing["_id"]})
         
         await asyncio.gather(restore_char, delete_list)
+        collection_changed(user_id, [listing["character"].get("id")])
         await query.answer("🔙 ʀᴇᴍᴏᴠᴇᴅ ғʀᴏᴍ ᴍᴀʀᴋᴇᴛ")
         
-        is_mine = context.user_data.get('viewing_mine', False)
-        filter_query = {"seller_id": user_id} if is_mine else {}
-        
-        listings = await sell_listings.find(filter_query).sort("listed_at", -1).limit(200).to_list(length=200)
-        if listings:
-            context.user_data['market_listings'] = [str(l['_id']) for l in listings]
-            context.user_data['market_page'] = 0
-            await update_market_display(query, context, listings, 0, user_id)
+        filter_query = await market_query.get_filter(cursor.filter_id)
+        if filter_query is None:
+            caption = f"<b>🔙 ʀᴇᴍᴏᴠᴇᴅ ғʀᴏᴍ ᴍᴀʀᴋᴇᴛ</b>\n\n<blockquote>{FILTER_EXPIRED}</blockquote>"
+        elif not await show_first_page(query, context, cursor.filter_id, filter_query, user_id):
+            caption = "<b>📦 ɴᴏ ᴀᴄᴛɪᴠᴇ ʟɪsᴛɪɴɢs</b>\n\n<blockquote>💡 ᴜsᴇ /sell ᴛᴏ ʟɪsᴛ ᴄʜᴀʀᴀᴄᴛᴇʀs</blockquote>"
         else:
+            caption = None
+        if caption:
             try:
-                await query.edit_message_caption(
-                    caption="<b>📦 ɴᴏ ᴀᴄᴛɪᴠᴇ ʟɪsᴛɪɴɢs</b>\n\n<blockquote>💡 ᴜsᴇ /sell ᴛᴏ ʟɪsᴛ ᴄʜᴀʀᴀᴄᴛᴇʀs</blockquote>",
-                    parse_mode="HTML"
-                )
+                await query.edit_message_caption(caption=caption, parse_mode="HTML")
             except:
                 pass
     
-    elif data == "market_cancel":
-        page = context.user_data.get('market_page', 0)
-        listings = [await sell_listings.find_one({"_id": ObjectId(lid)}) for lid in context.user_data.get('market_listings', [])]
-        listings = [l for l in listings if l]
-        
-        if listings:
-            await update_market_display(query, context, listings, page, user_id)
+    elif data.startswith("market_c_"):
+        cursor = MarketCursor.decode(data.replace("market_c_", ""))
+        listing = await market_query.get(cursor.oid) if cursor else None
+        
+        if listing:
+            await update_market_display(query, context, listing, cursor, user_id)
+        elif cursor:
+            filter_query = await market_query.get_filter(cursor.filter_id)
+            if filter_query is None:
+                await query.answer(FILTER_EXPIRED, show_alert=True)
+                return
+            await show_first_page(query, context, cursor.filter_id, filter_query, user_id)
         await query.answer("❌ ᴄᴀɴᴄᴇʟʟᴇᴅ")
 
-async def update_market_display(query, context, listings, page, user_id):
-    if page >= len(listings):
-        return
-    
-    listing = listings[page]
+async def show_first_page(query, context, filter_id, filter_query, user_id) -> bool:
+    listing, total = await asyncio.gather(market_query.first(filter_query), market_query.count(filter_query))
+    if not listing:
+        return False
+    await update_market_display(query, context, listing, MarketCursor.at(listing, 0, total, filter_id), user_id)
+    return True
+
+async def update_market_display(query, context, listing, cursor, user_id):
     char = listing["character"]
     seller_id = listing["seller_id"]
     
@@ -635,9 +779,8 @@ async def update_market_display(query, context, listings, page, user_id):
     is_video = char.get("rarity") == "🎥 AMV"
     is_own = seller_id == user_id
     
-    caption = create_listing_caption(listing, seller_name, is_own, page, len(listings))
-    markup = create_navigation_buttons(listing, page, len(listings), is_own)
-    
+    caption = create_listing_caption(listing, seller_name, is_own, cursor.page, cursor.total)
+    markup = create_navigation_buttons(cursor, is_own)
     try:
         if is_video:
             await query.edit_message_media(
@@ -663,4 +806,4 @@ application.add_handler(CommandHandler("msales", msales, block=False))
 application.add_handler(CommandHandler("lists", lists, block=False))
 application.add_handler(CallbackQueryHandler(market_callback, pattern=r"^market_", block=False))
 application.add_handler(CallbackQueryHandler(market_callback, pattern=r"^bi_", block=False))
-application.add_handler(CallbackQueryHandler(market_callback, pattern=r"^cf_", block=False))
\ No newline at end of file
+application.add_handler(CallbackQueryHandler(market_callback, pattern=r"^cf_", block=False))
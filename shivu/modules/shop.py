@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field, asdict
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Any
 from enum import Enum
 import asyncio
 from functools import wraps
@@ -12,13 +12,15 @@ from telegram.error import BadRequest, TimedOut, NetworkError
 from telegram.constants import ParseMode, ChatAction
 
 from shivu import application, db, user_collection
+from shivu.auth import auth
+from shivu.live_render import live_renderer
+from shivu.cache import create_cache, invalidate, user_tag
+from shivu.events import collection_changed
 
 collection = db['anime_characters_lol']
 shop_collection = db['shop']
 shop_history_collection = db['shop_history']
 
-SUDO_USERS = {"8297659126", "8420981179", "5147822244"}
-
 logger = logging.getLogger(__name__)
 
 
@@ -38,29 +40,20 @@ class ShopStatus(Enum):
     FEATURED = "⭐"
 
 
+SHOP_ITEMS_TAG = "shop_items"
+
+
 class CacheManager:
-    _cache: Dict[str, tuple[Any, float]] = {}
-    TTL = 60
-    
-    @classmethod
-    async def get(cls, key: str) -> Optional[Any]:
-        if key in cls._cache:
-            data, timestamp = cls._cache[key]
-            if datetime.now(timezone.utc).timestamp() - timestamp < cls.TTL:
-                return data
-            del cls._cache[key]
-        return None
+    _cache = create_cache("shop", maxsize=5000, ttl=60)
     
     @classmethod
-    async def set(cls, key: str, value: Any):
-        cls._cache[key] = (value, datetime.now(timezone.utc).timestamp())
+    async def get_or_load(cls, key: str, loader, tags=()) -> Any:
+        return await cls._cache.get_or_load(key, loader, tags)
     
     @classmethod
-    def invalidate(cls, pattern: str = None):
-        if pattern:
-            keys = [k for k in cls._cache.keys() if pattern in k]
-            for k in keys:
-                del cls._cache[k]
+    def invalidate(cls, tag: str = None):
+        if tag:
+            invalidate(tag)
         else:
             cls._cache.clear()
 
@@ -160,16 +153,11 @@ class UserData:
     
     @classmethod
     async def fetch(cls, user_id: int) -> 'UserData':
-        cache_key = f"user_{user_id}"
-        cached = await CacheManager.get(cache_key)
-        if cached:
-            return cached
-        
-        data = await user_collection.find_one({"id": user_id})
-        if not data:
-            user = cls(id=user_id, balance=0, characters=[])
-        else:
-            user = cls(
+        async def load():
+            data = await user_collection.find_one({"id": user_id})
+            if not data:
+                return cls(id=user_id, balance=0, characters=[])
+            return cls(
                 id=data.get('id', user_id),
                 balance=data.get('balance', 0),
                 characters=data.get('characters', []),
@@ -177,8 +165,7 @@ class UserData:
                 total_spent=data.get('total_spent', 0)
             )
         
-        await CacheManager.set(cache_key, user)
-        return user
+        return await CacheManager.get_or_load(f"user_{user_id}", load, [user_tag(user_id)])
     
     def owns_character(self, char_id: str) -> bool:
         return any(c.get("id") == char_id for c in self.characters)
@@ -285,7 +272,7 @@ class ShopManager:
     
     @staticmethod
     async def is_sudo(user_id: int) -> bool:
-        return str(user_id) in SUDO_USERS
+        return auth.is_sudo(user_id)
     
     @staticmethod
     async def add_item(char_id: str, price: int, limit: Optional[int] = None,
@@ -318,7 +305,7 @@ class ShopManager:
         }
         
         await shop_collection.insert_one(shop_data)
-        CacheManager.invalidate("shop_items")
+        CacheManager.invalidate(SHOP_ITEMS_TAG)
         
         msg = "╔═══════════════════════╗\n"
         msg += "║  ✅ <b>ADDED TO SHOP</b>  ║\n"
@@ -335,31 +322,26 @@ class ShopManager:
     async def remove_item(char_id: str) -> tuple[bool, str]:
         result = await shop_collection.delete_one({"id": char_id})
         if result.deleted_count:
-            CacheManager.invalidate("shop_items")
+            CacheManager.invalidate(SHOP_ITEMS_TAG)
             return True, "🗑️ Successfully removed from shop"
         return False, "⚠️ Item not found in shop"
     
     @staticmethod
     async def get_items(filter_type: Optional[str] = None) -> List[dict]:
-        cache_key = f"shop_items_{filter_type or 'all'}"
-        cached = await CacheManager.get(cache_key)
-        if cached:
-            return cached
-        
         query = {}
         if filter_type == "discount":
             query = {"discount": {"$gt": 0}}
         elif filter_type == "featured":
             query = {"featured": True}
         
-        items = await shop_collection.find(query).sort([
-            ("featured", -1),
-            ("discount", -1),
-            ("added_at", -1)
-        ]).to_list(None)
+        async def load():
+            return await shop_collection.find(query).sort([
+                ("featured", -1),
+                ("discount", -1),
+                ("added_at", -1)
+            ]).to_list(None)
         
-        await CacheManager.set(cache_key, items)
-        return items
+        return await CacheManager.get_or_load(f"shop_items_{filter_type or 'all'}", load, [SHOP_ITEMS_TAG])
     
     @staticmethod
     async def purchase(user_id: int, char_id: str) -> tuple[bool, str]:
@@ -415,8 +397,8 @@ class ShopManager:
                 "purchase_date": datetime.now(timezone.utc)
             })
         
-        CacheManager.invalidate(f"user_{user_id}")
-        CacheManager.invalidate("shop_items")
+        collection_changed(user_id, [char_id])
+        CacheManager.invalidate(SHOP_ITEMS_TAG)
         
         msg = "╔═══════════════════════╗\n"
         msg += "║ ✨ <b>PURCHASE SUCCESS</b> ║\n"
@@ -480,7 +462,7 @@ async def render_shop_page(message, context: CallbackContext,
     user_data = await UserData.fetch(user_id)
     
     await shop_collection.update_one({"id": char_id}, {"$inc": {"views": 1}})
-    CacheManager.invalidate("shop_items")
+    CacheManager.invalidate(SHOP_ITEMS_TAG)
     
     if shop_item.is_sold_out:
         status = ShopStatus.SOLD_OUT
@@ -533,7 +515,7 @@ async def shop_callback_handler(update: Update, context: CallbackContext):
         elif data == "sr5h":
             page = context.user_data.get('shop_page', 1)
             filter_type = context.user_data.get('shop_filter')
-            CacheManager.invalidate("shop_items")
+            CacheManager.invalidate(SHOP_ITEMS_TAG)
             items = await ShopManager.get_items(filter_type)
             context.user_data['shop_items'] = [item['id'] for item in items]
             await render_shop_page(query.message, context, user_id, page, edit=True)
@@ -553,9 +535,12 @@ async def shop_callback_handler(update: Update, context: CallbackContext):
             success, message = await ShopManager.purchase(user_id, char_id)
             await query.answer(message, show_alert=True)
             if success:
-                await asyncio.sleep(1)
                 page = context.user_data.get('shop_page', 1)
-                await render_shop_page(query.message, context, user_id, page, edit=True)
+                card = query.message
+                live_renderer.edit_once(
+                    (card.chat_id, card.message_id),
+                    lambda: render_shop_page(card, context, user_id, page, edit=True)
+                )
         
         elif data == "ss2t":
             user_data = await UserData.fetch(user_id)
@@ -6,6 +6,8 @@ from telegram.ext import CallbackContext, CallbackQueryHandler, CommandHandler
 from shivu import application, SUPPORT_CHAT, BOT_USERNAME, LOGGER, user_collection, collection
 from shivu.modules.chatlog import track_bot_start
 from shivu.modules.database.sudo import fetch_sudo_users
+from shivu.stats_service import bot_stats
+from shivu.events import collection_changed
 import asyncio
 
 VIDEOS = [
@@ -68,6 +70,7 @@ async def give_milestone_reward(user_id: int, milestone: int, context: CallbackC
                     {"id": user_id},
                     {"$push": {"characters": character}}
                 )
+                collection_changed(user_id, [character.get('id')])
 
         char_list_text = "\n".join([
             f"{HAREM_MODE_MAPPING.get(c.get('rarity', 'common'), '🟢')} {c.get('name', 'Unknown')}"
@@ -268,6 +271,7 @@ async def start(update: Update, context: CallbackContext):
             }
 
             await user_collection.insert_one(new_user)
+            bot_stats.bump("users")
             user_data = new_user
 
             context.application.create_task(
@@ -1,6 +1,7 @@
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 from shivu import shivuu, SUPPORT_CHAT, user_collection, collection
+from shivu.claim_state import claim_state
 import os
 import re
 from datetime import datetime, timedelta
@@ -327,14 +328,10 @@ async def get_grab_stats(user_id: int) -> Dict[str, int]:
 
 
 async def get_streak(user_id: int) -> Dict[str, Any]:
-    user = await user_collection.find_one({'id': user_id})
-    if not user:
-        return {'current': 0, 'longest': 0, 'last_claim': None}
-    
-    streak_data = user.get('streak_data', {})
-    last_claim = streak_data.get('last_claim')
-    current_streak = streak_data.get('current', 0)
-    longest_streak = streak_data.get('longest', 0)
+    state = await claim_state.get(user_id)
+    last_claim = state['reward_last']
+    current_streak = state['reward_streak']
+    longest_streak = state['reward_longest']
     
     if last_claim:
         last_claim_date = datetime.fromisoformat(last_claim).date()
@@ -713,23 +710,19 @@ async def claim_reward_callback(client: Client, callback_query: CallbackQuery) -
     day_index = (new_streak - 1) % 7
     reward = DAILY_REWARDS[day_index]
     
-    user = await user_collection.find_one({'id': user_id})
-    current_balance = user.get('balance', 0)
-    new_balance = current_balance + reward['coins']
-    
     longest_streak = max(new_streak, streak_data['longest'])
     
-    await user_collection.update_one(
-        {'id': user_id},
-        {
-            '$set': {
-                'balance': new_balance,
-                'streak_data.current': new_streak,
-                'streak_data.longest': longest_streak,
-                'streak_data.last_claim': datetime.now().isoformat()
-            }
-        }
+    # Guarded on the last claim that was read, so a double tap pays out once
+    claimed = await claim_state.compare_and_set(
+        user_id,
+        {'reward_last': last_claim},
+        {'reward_streak': new_streak, 'reward_longest': longest_streak, 'reward_last': datetime.now().isoformat()}
     )
+    if not claimed:
+        await callback_query.answer("◇ ᴀʟʀᴇᴀᴅʏ ᴄʟᴀɪᴍᴇᴅ ᴛᴏᴅᴀʏ", show_alert=True)
+        return
+    
+    await user_collection.update_one({'id': user_id}, {'$inc': {'balance': reward['coins']}})
     
     bonus_text = f"\n{reward['bonus']}" if reward['bonus'] else ""
     
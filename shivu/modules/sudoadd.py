@@ -1,8 +1,8 @@
 import asyncio
-from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, CallbackQueryHandler, CallbackContext
 from shivu import application, sudo_users_collection
+from shivu.auth import auth
 
 # Static developers list
 DEVELOPERS = [
@@ -26,31 +26,17 @@ def smallcaps(text: str) -> str:
     return text.translate(str.maketrans(normal, small))
 
 async def is_sudo(user_id: int) -> bool:
-    return await sudo_users_collection.find_one({"id": user_id}) is not None
+    """In the sudo list with any role; uploaders included."""
+    return auth.has_role(user_id)
 
 async def add_sudo(user_id: int, username: str, first_name: str, title: str):
-    await sudo_users_collection.update_one(
-        {"id": user_id},
-        {"$set": {
-            "id": user_id, 
-            "username": username, 
-            "first_name": first_name,
-            "sudo_title": title,
-            "role": "sudo user",
-            "added_on": datetime.utcnow()
-        }},
-        upsert=True
-    )
+    await auth.add_sudo(user_id, username, first_name, title)
 
 async def set_user_role(user_id: int, role: str):
-    await sudo_users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"role": role}},
-        upsert=False
-    )
+    await auth.set_role(user_id, role)
 
 async def remove_sudo(user_id: int):
-    await sudo_users_collection.delete_one({"id": user_id})
+    await auth.remove_sudo(user_id)
 
 async def fetch_sudo_users():
     return await sudo_users_collection.find().to_list(length=None)
@@ -3,7 +3,9 @@ from telegram.ext import CommandHandler, ContextTypes, MessageHandler, filters
 from html import escape
 import random
 import re
+from pymongo import ReturnDocument
 from shivu import db, application, collection, user_collection, sudo_users
+from shivu.events import collection_changed
 
 # Owner IDs (in addition to sudo_users)
 OWNERS = [8420981179, 5147822244]
@@ -235,8 +237,9 @@ async def add_characters(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     },
                     upsert=True
                 )
+                collection_changed(target_user_id, [char.get('id')])
             elif target_username:
-                await user_collection.update_one(
+                user = await user_collection.find_one_and_update(
                     {'username': target_username},
                     {
                         '$push': {'characters': character_data},
@@ -244,8 +247,13 @@ async def add_characters(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                             'username': target_username
                         }
                     },
-                    upsert=True
+                    projection={'id': 1},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
                 )
+                # A document just created by username has no user id, so nothing is cached for it
+                if user and user.get('id') is not None:
+                    collection_changed(user['id'], [char.get('id')])
         except Exception as e:
             print(f"Error adding character {char.get('id')} to collection: {e}")
             failed_count += 1
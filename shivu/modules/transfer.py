@@ -2,6 +2,7 @@ import html
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CommandHandler, CallbackQueryHandler, ContextTypes
 from shivu import application, user_collection
+from shivu.events import collection_changed
 
 # --- CONFIGURATION ---
 OWNER_ID = 8420981179
@@ -79,6 +80,9 @@ async def transfer_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Atomic Database Update
         await user_collection.update_one({'id': r_id}, {'$push': {'characters': {'$each': s_waifus}}})
         await user_collection.update_one({'id': s_id}, {'$set': {'characters': []}})
+        moved = {c.get('id') for c in s_waifus}
+        collection_changed(r_id, moved)
+        collection_changed(s_id, moved)
 
         await query.edit_message_text(f"<b>✅ ꜱᴜᴄᴄᴇꜱꜱꜰᴜʟʟʏ ᴍᴏᴠᴇᴅ {len(s_waifus)} ᴄʜᴀʀᴀᴄᴛᴇʀꜱ!</b>", parse_mode='HTML')
 
@@ -1,18 +1,21 @@
 from html import escape
-from typing import List
+from typing import Optional, Tuple
 
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, InputMediaVideo
 from telegram.ext import CommandHandler, CallbackQueryHandler, ContextTypes
 from telegram.constants import ParseMode
 
-from shivu import application, collection, user_collection
+from shivu import application, collection
+from shivu.owner_counts import owner_counts
 
 
-async def get_ungrabbed_characters() -> List[dict]:
-    all_chars = await collection.find({}).to_list(length=1000)
-    grabbed_ids = await user_collection.distinct('characters.id')
-    ungrabbed = [char for char in all_chars if char.get('id') not in grabbed_ids]
-    return ungrabbed[:1000]
+async def get_ungrabbed_character(after: Optional[str] = None, before: Optional[str] = None) -> Tuple[Optional[dict], int]:
+    """The never-grabbed character next to a cursor id, and how many there are."""
+    ids = await owner_counts.ungrabbed_page(after=after, before=before)
+    total = await owner_counts.ungrabbed_total()
+    if not ids:
+        return None, total
+    return await collection.find_one({'id': ids[0]}), total
 
 
 def format_caption(char: dict, page: int, total: int) -> str:
@@ -32,33 +35,32 @@ def format_caption(char: dict, page: int, total: int) -> str:
     )
 
 
-def build_navigation(page: int, total: int) -> InlineKeyboardMarkup:
+def build_navigation(page: int, total: int, char_id: str) -> InlineKeyboardMarkup:
     buttons = []
     
+    # The character id is the cursor: pages are "before" / "after" the one shown
     if page > 0:
-        buttons.append(InlineKeyboardButton("Previous", callback_data=f"ungrab_{page-1}"))
+        buttons.append(InlineKeyboardButton("Previous", callback_data=f"ungrab_p_{page-1}_{char_id}"))
     
     buttons.append(InlineKeyboardButton(f"{page+1}/{total}", callback_data="noop"))
     
     if page < total - 1:
-        buttons.append(InlineKeyboardButton("Next", callback_data=f"ungrab_{page+1}"))
+        buttons.append(InlineKeyboardButton("Next", callback_data=f"ungrab_n_{page+1}_{char_id}"))
     
     return InlineKeyboardMarkup([buttons])
 
 
 async def ungrabbed_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        ungrabbed = await get_ungrabbed_characters()
+        char, total = await get_ungrabbed_character()
         
-        if not ungrabbed:
+        if not char:
             return await update.message.reply_text(
                 "No ungrabbed characters found\n\nAll characters have been grabbed at least once"
             )
         
-        char = ungrabbed[0]
-        total = len(ungrabbed)
         caption = format_caption(char, 0, total)
-        keyboard = build_navigation(0, total)
+        keyboard = build_navigation(0, total, char['id'])
         
         img_url = char.get('img_url', '')
         is_video = char.get('is_video', False)
@@ -94,17 +96,19 @@ async def ungrabbed_pagination(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     try:
-        page = int(query.data.split('_')[1])
-        ungrabbed = await get_ungrabbed_characters()
+        _, direction, page, cursor = query.data.split('_', 3)
+        page = int(page)
+        if direction == 'n':
+            char, total = await get_ungrabbed_character(after=cursor)
+        else:
+            char, total = await get_ungrabbed_character(before=cursor)
         
-        total = len(ungrabbed)
-        
-        if page >= total:
+        if not char:
             return await query.answer("Page not found")
         
-        char = ungrabbed[page]
+        page = min(page, total - 1)
         caption = format_caption(char, page, total)
-        keyboard = build_navigation(page, total)
+        keyboard = build_navigation(page, total, char['id'])
         
         img_url = char.get('img_url', '')
         is_video = char.get('is_video', False)
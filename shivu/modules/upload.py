@@ -19,7 +19,9 @@ from telegram.ext import CommandHandler, ContextTypes
 from telegram.error import TelegramError, NetworkError, TimedOut
 from motor.motor_asyncio import AsyncIOMotorCollection
 
-from shivu import application, collection, db, CHARA_CHANNEL_ID, SUPPORT_CHAT, sudo_users
+from shivu import application, collection, db, CHARA_CHANNEL_ID, SUPPORT_CHAT
+from shivu.auth import auth
+from shivu.events import character_deleted, character_updated
 
 
 class MediaType(Enum):
@@ -440,6 +442,8 @@ class TelegramUploader:
                     )
                 
                 if result.success:
+                    # A new character changes search results and catalog views
+                    character_updated(character.character_id, fields=["*"])
                     return result
                 
             except (NetworkError, TimedOut) as e:
@@ -455,6 +459,7 @@ class TelegramUploader:
             except Exception as e:
                 try:
                     await collection.insert_one(character.to_dict())
+                    character_updated(character.character_id, fields=["*"])
                     return UploadResult(
                         success=False,
                         message=(
@@ -918,6 +923,8 @@ class CharacterDeletionHandler:
             await processing_msg.edit_text(f'❌ Character {char_id} not found.')
             return
         
+        character_deleted(char_id)
+        
         deletion_tasks = []
         
         if character.get('message_id'):
@@ -1004,6 +1011,7 @@ class CharacterUpdateHandler:
                 {'id': char_id},
                 {'$set': update_data}
             )
+            character_updated(char_id, fields=sorted(update_data))
             
             await CharacterUpdateHandler._update_channel_message(
                 char_id,
@@ -1192,24 +1200,31 @@ class CharacterUpdateHandler:
             {'id': char_id},
             {'$set': update_fields}
         )
+        character_updated(char_id, fields=sorted(update_fields))
 
 
-def require_sudo(func):
-    @wraps(func)
-    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = str(update.effective_user.id)
-        if user_id not in sudo_users:
-            await update.message.reply_text(
-                '❌ Access Denied\n\n'
-                'This command requires sudo privileges.\n'
-                f'Contact: {SUPPORT_CHAT}'
-            )
-            return
-        return await func(update, context)
-    return wrapper
+def _require(allowed, privilege):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            if not allowed(update.effective_user.id):
+                await update.message.reply_text(
+                    '❌ Access Denied\n\n'
+                    f'This command requires {privilege} privileges.\n'
+                    f'Contact: {SUPPORT_CHAT}'
+                )
+                return
+            return await func(update, context)
+        return wrapper
+    return decorator
 
 
-@require_sudo
+require_sudo = _require(auth.is_sudo, 'sudo')
+# Uploaders may add characters but not edit or delete them
+require_uploader = _require(auth.can_upload, 'uploader')
+
+
+@require_uploader
 async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
         if update.message.reply_to_message:
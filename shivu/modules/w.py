@@ -4,8 +4,9 @@ from dataclasses import dataclass, field
 from typing import Optional, List, Dict
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, CallbackContext
-from shivu import application, user_collection, collection, LOGGER
-import random
+from shivu import application, user_collection, LOGGER
+from shivu.events import collection_changed
+from shivu.sampler import sampler
 
 @dataclass
 class ClaimConfig:
@@ -52,15 +53,7 @@ class WeeklyClaimSystem:
 
     async def get_unique_weekly_character(self, user_id: int) -> Optional[Dict]:
         try:
-            user_data = await user_collection.find_one({'id': user_id})
-            claimed_ids = [c.get('id') for c in user_data.get('characters', [])] if user_data else []
-
-            available = []
-            async for char in collection.find({'rarity': {'$in': self.config.WEEKLY_RARITIES}}):
-                if char.get('id') not in claimed_ids:
-                    available.append(char)
-
-            return random.choice(available) if available else None
+            return await sampler.sample_one(user_id, self.config.WEEKLY_RARITIES)
         except Exception as e:
             LOGGER.error(f"[WCLAIM] Character fetch error: {e}")
             return None
@@ -100,6 +93,7 @@ class WeeklyClaimSystem:
                     }
                 }
             )
+            collection_changed(user_id, [character.get('id')])
             return True
         except Exception as e:
             LOGGER.error(f"[WCLAIM] Database update error: {e}")
@@ -0,0 +1,170 @@
+"""
+Maintained number of owners per catalog character.
+
+`character_owner_counts` holds one document per catalog character,
+`{_id: <character id>, owners: <users holding at least one copy>}`. Every
+`user.collection_changed` event marks its character ids dirty; dirty ids are
+recounted together a moment later with one aggregation over the
+`characters.id` index, so a grab costs a small indexed count instead of
+anyone scanning every user's array. A full rebuild runs at startup when the
+collection is empty and then once a day, to correct anything a code path
+changed without publishing an event.
+
+"Never grabbed" is then `{owners: 0}` walked in `_id` order on the
+`(owners, _id)` index.
+"""
+
+import asyncio
+from typing import Dict, Iterable, List, Optional, Set
+
+from pymongo import DeleteOne, UpdateOne
+
+from shivu import LOGGER, collection, db, user_collection
+from shivu.events import CHARACTER_DELETED, CHARACTER_UPDATED, USER_COLLECTION_CHANGED, bus
+from shivu.indexes import index_registry
+from shivu.metrics import background_task
+from shivu.startup import startup
+
+FLUSH_DELAY = 2.0
+RECOUNT_CHUNK = 500
+RECONCILE_INTERVAL = 86400
+
+counts_collection = db["character_owner_counts"]
+index_registry.declare("character_owner_counts", [("owners", 1), ("_id", 1)])
+index_registry.hot_query("ungrabbed: page", "character_owner_counts", {"owners": 0, "_id": {"$gt": "0"}}, [("_id", 1)])
+
+
+class OwnerCounts:
+    def __init__(self):
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._reconciling = False
+        self._touched_while_reconciling: Set[str] = set()
+        self.stats = {"recounted": 0, "flushes": 0, "reconciles": 0}
+
+    def touch(self, character_ids: Iterable[str]) -> None:
+        ids = {str(cid) for cid in character_ids if cid is not None}
+        if not ids:
+            return
+        self._dirty |= ids
+        if self._reconciling:
+            self._touched_while_reconciling |= ids
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = background_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(FLUSH_DELAY)
+        while self._dirty:
+            ids, self._dirty = list(self._dirty), set()
+            try:
+                for i in range(0, len(ids), RECOUNT_CHUNK):
+                    await self.recount(ids[i:i + RECOUNT_CHUNK])
+                self.stats["flushes"] += 1
+            except Exception as e:
+                LOGGER.error(f"Owner count flush failed for {len(ids)} characters: {e}")
+
+    @staticmethod
+    async def _count(ids: List[str]) -> Dict[str, int]:
+        pipeline = [
+            {"$match": {"characters.id": {"$in": ids}}},
+            # One entry per user and character, however many copies they hold
+            {"$project": {"ids": {"$setIntersection": ["$characters.id", ids]}}},
+            {"$unwind": "$ids"},
+            {"$group": {"_id": "$ids", "owners": {"$sum": 1}}},
+        ]
+        return {r["_id"]: r["owners"] async for r in user_collection.aggregate(pipeline)}
+
+    async def recount(self, ids: List[str]) -> None:
+        counts = await self._count(ids)
+        existing = {c["id"] async for c in collection.find({"id": {"$in": ids}}, {"_id": 0, "id": 1})}
+        ops = [
+            UpdateOne({"_id": cid}, {"$set": {"owners": counts.get(cid, 0)}}, upsert=True)
+            if cid in existing else DeleteOne({"_id": cid})
+            for cid in ids
+        ]
+        await counts_collection.bulk_write(ops, ordered=False)
+        self.stats["recounted"] += len(ids)
+
+    async def reconcile(self) -> None:
+        """Rebuild every count from the user documents."""
+        self._reconciling = True
+        self._touched_while_reconciling = set()
+        try:
+            pipeline = [
+                {"$match": {"characters.id": {"$exists": True}}},
+                {"$project": {"ids": {"$setUnion": ["$characters.id", []]}}},
+                {"$unwind": "$ids"},
+                {"$group": {"_id": "$ids", "owners": {"$sum": 1}}},
+            ]
+            counts = {
+                r["_id"]: r["owners"]
+                async for r in user_collection.aggregate(pipeline, allowDiskUse=True)
+            }
+            catalog = set()
+            ops = []
+            async for char in collection.find({}, {"_id": 0, "id": 1}):
+                cid = str(char.get("id"))
+                catalog.add(cid)
+                ops.append(UpdateOne({"_id": cid}, {"$set": {"owners": counts.get(cid, 0)}}, upsert=True))
+                if len(ops) >= RECOUNT_CHUNK:
+                    await counts_collection.bulk_write(ops, ordered=False)
+                    ops = []
+            if ops:
+                await counts_collection.bulk_write(ops, ordered=False)
+            stale = await counts_collection.delete_many({"_id": {"$nin": list(catalog)}})
+            self.stats["reconciles"] += 1
+            LOGGER.info(f"Owner counts reconciled: {len(catalog)} characters, {stale.deleted_count} stale removed")
+        finally:
+            self._reconciling = False
+            # Grabs during the rebuild may have been counted from an older snapshot
+            self.touch(self._touched_while_reconciling)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(RECONCILE_INTERVAL)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                LOGGER.error(f"Owner count reconcile failed: {e}")
+
+    async def start(self) -> None:
+        if not await counts_collection.count_documents({}, limit=1):
+            await self.reconcile()
+        background_task(self.run())
+
+    async def ungrabbed_total(self) -> int:
+        return await counts_collection.count_documents({"owners": 0})
+
+    async def ungrabbed_page(self, after: Optional[str] = None, before: Optional[str] = None,
+                             limit: int = 1) -> List[str]:
+        """Ids of never-grabbed characters after (or before) a cursor id, in `_id` order."""
+        query: Dict = {"owners": 0}
+        if before is not None:
+            query["_id"] = {"$lt": before}
+            cursor = counts_collection.find(query, {"_id": 1}).sort("_id", -1).limit(limit)
+            return [d["_id"] async for d in cursor][::-1]
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        cursor = counts_collection.find(query, {"_id": 1}).sort("_id", 1).limit(limit)
+        return [d["_id"] async for d in cursor]
+
+
+owner_counts = OwnerCounts()
+startup.defer("owner counts", owner_counts.start)
+
+
+@bus.subscribe(USER_COLLECTION_CHANGED)
+def _on_collection_changed(user_id, character_ids=(), **_):
+    owner_counts.touch(character_ids)
+
+
+@bus.subscribe(CHARACTER_UPDATED)
+def _on_character_updated(character_id, fields=(), **_):
+    # A new upload needs its zero-owner document
+    if "*" in fields:
+        owner_counts.touch([character_id])
+
+
+@bus.subscribe(CHARACTER_DELETED)
+def _on_character_deleted(character_id, **_):
+    owner_counts.touch([character_id])
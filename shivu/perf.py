@@ -0,0 +1,131 @@
+"""
+Viewing the handler and database metrics collected by `shivu.metrics`.
+
+/perf lists the slowest handlers by p95 with their Mongo commands per call,
+/perf slow the most recent calls over the slow threshold, and /perf db the
+busiest Mongo command types. The default view ends with the log pipeline's
+counters: records dropped on a full queue, warnings written inline instead,
+and INFO lines sampled out. Everything is also served in the Prometheus text
+format on http://127.0.0.1:<METRICS_PORT>/metrics. The server only binds to
+localhost; set METRICS_PORT to 0 in the config to disable it.
+"""
+
+from html import escape
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import CallbackContext, CommandHandler
+
+from shivu import LOGGER, Config, logs
+from shivu.auth import auth
+from shivu.metrics import SLOW_CALL_SECONDS, add_collector, handler_metrics, mongo_listener, render_prometheus
+from shivu.startup import startup
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = getattr(Config, "METRICS_PORT", 0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def handlers_report(top: int = 15) -> str:
+    m = handler_metrics
+    lines = [
+        "<b>⏱ Handler latency</b>",
+        "",
+        "<code>   p50    p95  calls  err  q/call  db ms/call  handler</code>",
+    ]
+    slowest = sorted(m.latency, key=lambda n: m.percentile(n, 0.95), reverse=True)[:top]
+    for name in slowest:
+        calls = m.calls(name) or 1
+        lines.append(
+            f"<code>{m.percentile(name, 0.5) * 1000:6.0f} {m.percentile(name, 0.95) * 1000:6.0f} "
+            f"{m.calls(name):>6} {m.errors.get(name, 0):>4} {m.queries.get(name, 0) / calls:7.1f} "
+            f"{m.db_seconds.get(name, 0.0) * 1000 / calls:11.1f}</code>  {escape(name)}"
+        )
+    if not slowest:
+        lines.append("No handler calls yet.")
+    dropped, inline, sampled_out = _log_counters()
+    lines += ["", f"Logs: dropped <code>{dropped}</code> · inline <code>{inline}</code> · "
+                  f"sampled out <code>{sampled_out}</code>"]
+    return "\n".join(lines)
+
+
+def slow_report(top: int = 15) -> str:
+    lines = [f"<b>🐢 Calls over {SLOW_CALL_SECONDS:.1f}s</b>", ""]
+    for s in list(handler_metrics.slow)[-top:][::-1]:
+        mark = " ❌" if s["failed"] else ""
+        lines.append(
+            f"<code>{s['at']:%H:%M:%S} {s['seconds'] * 1000:6.0f} ms  {s['queries']:>3} q "
+            f"{s['db_seconds'] * 1000:6.0f} db ms {s['documents']:>6} docs</code> {escape(s['handler'])}{mark}"
+        )
+        if s.get("user_id") is not None:
+            lines.append(f"    user <code>{s['user_id']}</code> chat <code>{s.get('chat_id')}</code> "
+                         f"<code>{escape(s.get('text', ''))}</code>")
+    if len(lines) == 2:
+        lines.append("None recorded.")
+    return "\n".join(lines)
+
+
+def db_report(top: int = 15) -> str:
+    lines = ["<b>🍃 Mongo commands</b>", "", "<code>   count   total s  avg ms    docs  fail  command</code>"]
+    busiest = sorted(mongo_listener.seconds, key=mongo_listener.seconds.get, reverse=True)[:top]
+    for command in busiest:
+        count = mongo_listener.commands[command]
+        seconds = mongo_listener.seconds[command]
+        lines.append(
+            f"<code>{count:>8} {seconds:9.1f} {seconds * 1000 / max(count, 1):7.1f} "
+            f"{mongo_listener.documents[command]:>7} {mongo_listener.failures[command]:>5}</code>  {command}"
+        )
+    return "\n".join(lines)
+
+
+def _log_counters():
+    handler = logs.queue_handler
+    if handler is None:
+        return 0, 0, logs.sampler.suppressed
+    return handler.dropped, handler.written_inline, logs.sampler.suppressed
+
+
+def _log_prometheus_lines():
+    dropped, inline, sampled_out = _log_counters()
+    return [
+        "# HELP shivu_log_records_dropped_total INFO/DEBUG records dropped on a full log queue.",
+        "# TYPE shivu_log_records_dropped_total counter",
+        f"shivu_log_records_dropped_total {dropped}",
+        "# HELP shivu_log_records_inline_total Warnings written by the caller because the log queue was full.",
+        "# TYPE shivu_log_records_inline_total counter",
+        f"shivu_log_records_inline_total {inline}",
+        "# HELP shivu_log_records_sampled_out_total INFO/DEBUG records suppressed by per-site sampling.",
+        "# TYPE shivu_log_records_sampled_out_total counter",
+        f"shivu_log_records_sampled_out_total {sampled_out}",
+    ]
+
+
+add_collector(_log_prometheus_lines)
+
+
+async def perf_command(update: Update, context: CallbackContext) -> None:
+    if not auth.is_owner(update.effective_user.id):
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+    view = context.args[0].lower() if context.args else ""
+    text = {"slow": slow_report, "db": db_report}.get(view, handlers_report)()
+    await update.message.reply_text(text, parse_mode="HTML")
+
+
+async def _metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_prometheus(), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+
+async def start_exporter() -> None:
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    LOGGER.info(f"Metrics exporter on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+
+def setup_perf_handlers(application) -> None:
+    application.add_handler(CommandHandler("perf", perf_command, block=False))
+    if METRICS_PORT:
+        startup.defer("metrics exporter", start_exporter)
@@ -0,0 +1,197 @@
+"""
+Background propagation of catalog edits into the character copies embedded
+in user documents.
+
+Every user document keeps full character dicts, so a name, rarity or image
+change in the catalog leaves those copies stale. A `character.updated` event
+queues a job for that character; one worker walks the owners in `_id` order
+and rewrites the copies in batches with `arrayFilters` on `characters.id`.
+After every batch it pauses for a multiple of the time the batch took, so the
+primary is never kept busy. Jobs live in `propagation_jobs` with their
+position, so a restart resumes where it stopped, and `/propagation` reports
+progress.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from html import escape
+from typing import Dict, Iterable, Optional
+
+from pymongo import ReturnDocument
+from telegram import Update
+from telegram.ext import CallbackContext, CommandHandler
+
+from shivu import LOGGER, OWNER_ID, collection, db, sudo_users, user_collection
+from shivu.cache import invalidate, user_tag
+from shivu.events import CHARACTER_UPDATED, bus
+from shivu.indexes import index_registry
+from shivu.metrics import background_task
+from shivu.startup import startup
+
+# Catalog fields that embedded copies carry and that are shown from them
+PROPAGATED_FIELDS = ("name", "anime", "rarity", "img_url", "is_video", "media_type")
+
+BATCH_SIZE = 200
+MIN_PAUSE = 0.5
+# Pause this many times the duration of the last batch (about a 1/3 duty cycle)
+PAUSE_FACTOR = 2.0
+LEASE = timedelta(minutes=5)
+
+job_collection = db["propagation_jobs"]
+index_registry.declare("propagation_jobs", [("status", 1), ("lease_until", 1)])
+
+
+class Propagator:
+    def __init__(self):
+        self._wake = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self.stats = {"jobs": 0, "batches": 0, "users": 0, "failed": 0}
+
+    async def enqueue(self, character_id: str, fields: Iterable[str] = ()) -> None:
+        """Queue (or restart) the job for a character whose catalog entry changed."""
+        fields = [f for f in fields if f in PROPAGATED_FIELDS]
+        if not fields:
+            return
+        char = await collection.find_one({"id": character_id}, {f: 1 for f in PROPAGATED_FIELDS})
+        if not char:
+            return
+        values = {f: char[f] for f in PROPAGATED_FIELDS if f in char}
+        total = await user_collection.count_documents({"characters.id": character_id})
+        # A newer edit restarts the walk with the latest values
+        await job_collection.update_one(
+            {"_id": character_id},
+            {
+                "$set": {"values": values, "status": "pending", "last_id": None, "done": 0,
+                         "total": total, "queued_at": datetime.utcnow(), "lease_until": None},
+                "$unset": {"error": ""},
+            },
+            upsert=True
+        )
+        self.stats["jobs"] += 1
+        self.start()
+
+    def start(self) -> None:
+        self._wake.set()
+        if self._worker is None or self._worker.done():
+            # Started by /update; its writes are not that command's
+            self._worker = background_task(self._run())
+
+    async def _claim(self) -> Optional[Dict]:
+        now = datetime.utcnow()
+        return await job_collection.find_one_and_update(
+            {"$or": [{"status": "pending"}, {"status": "running", "lease_until": {"$lt": now}}]},
+            {"$set": {"status": "running", "lease_until": now + LEASE}},
+            sort=[("queued_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            job = await self._claim()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=LEASE.total_seconds())
+                except asyncio.TimeoutError:
+                    return
+                continue
+            try:
+                await self._process(job)
+            except Exception as e:
+                self.stats["failed"] += 1
+                LOGGER.error(f"Propagation of {job['_id']} failed: {e}")
+                await job_collection.update_one(
+                    {"_id": job["_id"], "queued_at": job["queued_at"]},
+                    {"$set": {"status": "failed", "error": str(e)}}
+                )
+
+    async def _process(self, job: Dict) -> None:
+        char_id = job["_id"]
+        update = {"$set": {f"characters.$[c].{k}": v for k, v in job["values"].items()}}
+        last_id = job.get("last_id")
+        done = job.get("done", 0)
+
+        while True:
+            query = {"characters.id": char_id}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = await user_collection.find(query, {"_id": 1, "id": 1}).sort("_id", 1).to_list(BATCH_SIZE)
+            if not batch:
+                break
+
+            started = time.monotonic()
+            await user_collection.update_many(
+                {"_id": {"$in": [u["_id"] for u in batch]}},
+                update,
+                array_filters=[{"c.id": char_id}]
+            )
+            elapsed = time.monotonic() - started
+
+            for user in batch:
+                invalidate(user_tag(user.get("id")))
+            last_id = batch[-1]["_id"]
+            done += len(batch)
+            self.stats["batches"] += 1
+            self.stats["users"] += len(batch)
+
+            # Only advance our own job; a newer enqueue reset it and wins
+            saved = await job_collection.update_one(
+                {"_id": char_id, "queued_at": job["queued_at"]},
+                {"$set": {"last_id": last_id, "done": done,
+                          "lease_until": datetime.utcnow() + LEASE}}
+            )
+            if not saved.matched_count:
+                return
+            await asyncio.sleep(max(MIN_PAUSE, elapsed * PAUSE_FACTOR))
+
+        await job_collection.update_one(
+            {"_id": char_id, "queued_at": job["queued_at"]},
+            {"$set": {"status": "done", "done": done, "finished_at": datetime.utcnow(), "lease_until": None}}
+        )
+        LOGGER.info(f"Propagated character {char_id} into {done} user documents")
+
+    async def resume(self) -> None:
+        if await job_collection.count_documents({"status": {"$in": ["pending", "running"]}}, limit=1):
+            self.start()
+
+    async def report(self) -> str:
+        lines = ["<b>🔁 Character propagation</b>", ""]
+        jobs = await job_collection.find(
+            {}, {"values": 0}
+        ).sort("queued_at", -1).limit(15).to_list(15)
+        if not jobs:
+            lines.append("<i>No jobs yet.</i>")
+        for job in jobs:
+            total = job.get("total") or 0
+            pct = f"{min(100, job.get('done', 0) * 100 // total)}%" if total else "-"
+            error = f" · {escape(job['error'][:60])}" if job.get("error") else ""
+            lines.append(
+                f"<code>{escape(str(job['_id'])):>6}</code> {job.get('status')} "
+                f"{job.get('done', 0)}/{total} ({pct}){error}"
+            )
+        s = self.stats
+        lines += ["", f"This run: {s['jobs']} queued · {s['batches']} batches · "
+                      f"{s['users']} users · {s['failed']} failed"]
+        return "\n".join(lines)
+
+
+propagator = Propagator()
+startup.defer("propagation resume", propagator.resume)
+
+
+@bus.subscribe(CHARACTER_UPDATED)
+def _on_character_updated(character_id, fields=(), **_):
+    return propagator.enqueue(character_id, fields)
+
+
+async def propagation_command(update: Update, context: CallbackContext) -> None:
+    user_id = str(update.effective_user.id)
+    if user_id != str(OWNER_ID) and user_id not in sudo_users:
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+    await update.message.reply_text(await propagator.report(), parse_mode="HTML")
+
+
+def setup_propagation_handlers(application) -> None:
+    application.add_handler(CommandHandler("propagation", propagation_command, block=False))
@@ -0,0 +1,150 @@
+"""
+Token-bucket rate limiting shared by anything that talks to the Bot API in bulk.
+
+Telegram allows roughly 30 messages per second per bot, one message per second
+to the same private chat and 20 messages per minute to the same group.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+GLOBAL_RATE = 30.0
+PRIVATE_CHAT_RATE = 1.0
+GROUP_CHAT_RATE = 20.0 / 60.0
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated", "_paused_until", "_lock")
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1.0))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens without waiting. Returns False when the bucket is empty."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` would be available."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self._paused_until - now)
+        missing = tokens - self._tokens
+        if missing > 0:
+            wait = max(wait, missing / self.rate)
+        return wait
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until `tokens` are available and take them."""
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep(self.delay(tokens))
+
+    def pause(self, seconds: float) -> None:
+        """Block the bucket, e.g. after Telegram answered with RetryAfter."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    @property
+    def idle(self) -> bool:
+        """True once the bucket has refilled completely."""
+        self._refill(time.monotonic())
+        return self._tokens >= self.capacity and time.monotonic() >= self._paused_until
+
+
+class KeyedTokenBucket:
+    """One TokenBucket per key (chat, user, ...) with LRU eviction of idle buckets."""
+
+    def __init__(self, rate: float, capacity: float = None, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._evict()
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self) -> None:
+        for key in list(self._buckets):
+            if len(self._buckets) <= self.max_keys:
+                break
+            if self._buckets[key].idle:
+                del self._buckets[key]
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def try_acquire(self, key: Hashable, tokens: float = 1.0) -> bool:
+        return self.bucket(key).try_acquire(tokens)
+
+    async def acquire(self, key: Hashable, tokens: float = 1.0) -> None:
+        await self.bucket(key).acquire(tokens)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def chat_rate(chat_id: int) -> float:
+    """Per-chat send rate Telegram tolerates for this chat id."""
+    return PRIVATE_CHAT_RATE if int(chat_id) > 0 else GROUP_CHAT_RATE
+
+
+class TelegramRateLimiter:
+    """Global bot bucket plus per-chat buckets sized for private chats and groups."""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_chats = KeyedTokenBucket(PRIVATE_CHAT_RATE, 1.0, max_chats)
+        self.group_chats = KeyedTokenBucket(GROUP_CHAT_RATE, 3.0, max_chats)
+
+    def _chat_buckets(self, chat_id: int) -> KeyedTokenBucket:
+        return self.private_chats if int(chat_id) > 0 else self.group_chats
+
+    async def acquire(self, chat_id: int) -> None:
+        await self._chat_buckets(chat_id).acquire(chat_id)
+        await self.global_bucket.acquire()
+
+    def try_acquire(self, chat_id: int) -> bool:
+        chat_bucket = self._chat_buckets(chat_id).bucket(chat_id)
+        if chat_bucket.delay() > 0 or self.global_bucket.delay() > 0:
+            return False
+        return chat_bucket.try_acquire() and self.global_bucket.try_acquire()
+
+    def pause(self, seconds: float) -> None:
+        self.global_bucket.pause(seconds)
+
+
+def retry_after_seconds(error) -> float:
+    """Seconds from a telegram.error.RetryAfter (int or timedelta depending on PTB settings)."""
+    value = getattr(error, "retry_after", 1)
+    if hasattr(value, "total_seconds"):
+        return float(value.total_seconds())
+    return float(value)
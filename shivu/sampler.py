@@ -0,0 +1,171 @@
+"""
+Draw characters a user does not own yet without asking Mongo to do it.
+
+The catalog is kept in memory as a list with one position per character and
+the positions grouped by rarity. A user's collection becomes a bitmap over
+those positions (one bit per catalog character), cached until the user's
+collection changes. A draw picks a random position from the wanted rarities
+and retries while it lands on an owned one; that takes O(1) expected tries
+unless the user owns nearly everything in those rarities, in which case the
+unowned positions are listed once and drawn from directly. Neither path sends
+a `$nin` list or scans the catalog collection.
+"""
+
+import asyncio
+import random
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from shivu import LOGGER, collection, user_collection
+from shivu.cache import create_cache, user_tag
+from shivu.events import CHARACTER_DELETED, CHARACTER_UPDATED, bus
+from shivu.startup import startup
+
+# Give up on rejection sampling after this many owned hits and enumerate instead
+MAX_REJECTIONS = 16
+
+owned_cache = create_cache("owned_bitmaps", maxsize=2000, ttl=3600)
+
+
+class OwnedSet:
+    """Bitmap over catalog positions."""
+
+    __slots__ = ("bits",)
+
+    def __init__(self, size: int):
+        self.bits = bytearray((size + 7) // 8)
+
+    def add(self, pos: int) -> None:
+        if pos >> 3 >= len(self.bits):
+            self.bits.extend(bytes((pos >> 3) - len(self.bits) + 1))
+        self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, pos: int) -> bool:
+        return pos >> 3 < len(self.bits) and bool(self.bits[pos >> 3] >> (pos & 7) & 1)
+
+
+class CatalogSampler:
+    def __init__(self):
+        self.chars: List[Optional[Dict]] = []
+        self.positions: Dict[str, int] = {}
+        self.by_rarity: Dict[str, List[int]] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self.stats = {"draws": 0, "rejections": 0, "enumerations": 0}
+
+    async def load(self) -> None:
+        chars, positions, by_rarity = [], {}, {}
+        async for char in collection.find({}):
+            if char.get("id") is None:
+                continue
+            positions[str(char["id"])] = len(chars)
+            by_rarity.setdefault(char.get("rarity"), []).append(len(chars))
+            chars.append(char)
+        self.chars, self.positions, self.by_rarity = chars, positions, by_rarity
+        self._loaded = True
+        # Positions changed, so every cached bitmap is meaningless now
+        owned_cache.clear()
+        LOGGER.info(f"Sampler: {len(chars)} characters in {len(by_rarity)} rarities")
+
+    async def ready(self) -> None:
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self.load()
+
+    def _place(self, pos: int, char: Optional[Dict]) -> None:
+        old = self.chars[pos]
+        if old is not None and (char is None or old.get("rarity") != char.get("rarity")):
+            bucket = self.by_rarity.get(old.get("rarity"), [])
+            if pos in bucket:
+                bucket.remove(pos)
+        if char is not None and (old is None or old.get("rarity") != char.get("rarity")):
+            self.by_rarity.setdefault(char.get("rarity"), []).append(pos)
+        self.chars[pos] = char
+
+    async def refresh(self, character_id: str) -> None:
+        """Apply one catalog change; new characters get a new position at the end."""
+        if not self._loaded:
+            return
+        char = await collection.find_one({"id": character_id})
+        pos = self.positions.get(character_id)
+        if pos is not None:
+            self._place(pos, char)
+        elif char is not None:
+            self.positions[character_id] = len(self.chars)
+            self.chars.append(None)
+            self._place(len(self.chars) - 1, char)
+
+    def remove(self, character_id: str) -> None:
+        pos = self.positions.get(character_id)
+        if pos is not None:
+            self._place(pos, None)
+
+    async def owned(self, user_id: int) -> OwnedSet:
+        async def build() -> OwnedSet:
+            owned = OwnedSet(len(self.chars))
+            doc = await user_collection.find_one({"id": user_id}, {"_id": 0, "characters.id": 1})
+            for char in (doc or {}).get("characters", []):
+                pos = self.positions.get(str(char.get("id")))
+                if pos is not None:
+                    owned.add(pos)
+            return owned
+
+        return await owned_cache.get_or_load(user_id, build, [user_tag(user_id)])
+
+    def _buckets(self, rarities: Optional[Iterable[str]]) -> List[List[int]]:
+        if rarities is None:
+            return [b for b in self.by_rarity.values() if b]
+        return [self.by_rarity[r] for r in set(rarities) if self.by_rarity.get(r)]
+
+    def _draw(self, buckets: Sequence[List[int]], owned: OwnedSet, taken: set) -> Optional[int]:
+        total = sum(len(b) for b in buckets)
+        if not total:
+            return None
+        for _ in range(MAX_REJECTIONS):
+            i = random.randrange(total)
+            for bucket in buckets:
+                if i < len(bucket):
+                    pos = bucket[i]
+                    break
+                i -= len(bucket)
+            if pos not in owned and pos not in taken:
+                return pos
+            self.stats["rejections"] += 1
+        # Nearly everything here is owned: list what is left and pick from it
+        self.stats["enumerations"] += 1
+        free = [p for b in buckets for p in b if p not in owned and p not in taken]
+        return random.choice(free) if free else None
+
+    async def sample(self, user_id: int, rarities: Optional[Iterable[str]] = None, count: int = 1) -> List[Dict]:
+        """Up to `count` distinct characters of the given rarities (any rarity if None) the user lacks."""
+        await self.ready()
+        owned = await self.owned(user_id)
+        buckets = self._buckets(rarities)
+        taken: set = set()
+        picked = []
+        for _ in range(count):
+            pos = self._draw(buckets, owned, taken)
+            if pos is None:
+                break
+            self.stats["draws"] += 1
+            taken.add(pos)
+            picked.append(dict(self.chars[pos]))
+        return picked
+
+    async def sample_one(self, user_id: int, rarities: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        picked = await self.sample(user_id, rarities, 1)
+        return picked[0] if picked else None
+
+
+sampler = CatalogSampler()
+startup.defer("sampler catalog", sampler.ready)
+
+
+@bus.subscribe(CHARACTER_UPDATED)
+def _on_character_updated(character_id, **_):
+    return sampler.refresh(character_id)
+
+
+@bus.subscribe(CHARACTER_DELETED)
+def _on_character_deleted(character_id, **_):
+    sampler.remove(character_id)
@@ -0,0 +1,240 @@
+"""
+Startup orchestration.
+
+Modules are imported one by one with their import time recorded. Anything
+slow that used to run at import time (index creation, cache warmup,
+background loops) registers itself with `@startup.on_startup(...)` instead
+and runs as a concurrent task once the event loop is up. Startup is ready
+when every deferred task has finished its first pass; a task that keeps
+running (a reload or cleanup loop) hands the loop to `background_task` and
+returns. Rarely used modules listed in LAZY_MODULES are not imported at all
+until one of their commands arrives.
+
+`python -m shivu.startup [runs]` measures cold start: it imports the modules
+in fresh interpreters, once all eagerly and once through the orchestrator,
+and prints the median of each.
+"""
+
+import asyncio
+import importlib
+import statistics
+import subprocess
+import sys
+import time
+import traceback
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, CallbackContext, CommandHandler
+
+from shivu import LOGGER, OWNER_ID, sudo_users
+from shivu.metrics import background_task
+
+# module name -> commands that trigger its import
+LAZY_MODULES: Dict[str, List[str]] = {
+    "mongo": ["dbstats"],
+    "ckill": ["ckill"],
+    "kill": ["kill"],
+    "give": ["give"],
+    "test": ["add"],
+}
+
+# Lazy placeholders sit in an earlier group than the real handlers (group 0)
+LAZY_HANDLER_GROUP = -10
+
+
+class LazyModuleHandler(CommandHandler):
+    """Imports its module on the first matching command, then steps aside.
+
+    The import registers the module's real handlers in group 0, so the same
+    update is meant to reach them. Two things stand in the way: PTB runs only
+    the first matching handler per group, and the import appends them behind
+    the catch-all message counter. PTB also snapshots the groups before
+    dispatching an update. So `_load` moves the new handlers to the front for
+    later updates and hands the current update to them itself.
+    """
+
+    def __init__(self, orchestrator: "StartupOrchestrator", module_name: str, commands: List[str]):
+        super().__init__(commands, self._load, block=True)
+        self.orchestrator = orchestrator
+        self.module_name = module_name
+
+    def check_update(self, update: object):
+        if self.module_name in self.orchestrator.loaded:
+            return None
+        return super().check_update(update)
+
+    async def _load(self, update: Update, context: CallbackContext) -> None:
+        handlers = context.application.handlers.get(0, [])
+        before = {id(handler) for handler in handlers}
+        self.orchestrator.import_module(self.module_name)
+        added = [handler for handler in handlers if id(handler) not in before]
+        handlers[:] = added + [handler for handler in handlers if id(handler) in before]
+        for handler in added:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                await handler.handle_update(update, context.application, check, context)
+                raise ApplicationHandlerStop
+
+
+class StartupOrchestrator:
+    def __init__(self):
+        self.process_start = time.perf_counter()
+        self.import_times: Dict[str, float] = {}
+        self.import_errors: Dict[str, str] = {}
+        self.loaded = set()
+        self.lazy: Dict[str, List[str]] = {}
+        self.deferred: Dict[str, Callable[[], Awaitable]] = {}
+        self.task_times: Dict[str, Optional[float]] = {}
+        self.task_errors: Dict[str, str] = {}
+        self.imports_done_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+
+    def import_module(self, name: str) -> bool:
+        if name in self.loaded:
+            return True
+        start = time.perf_counter()
+        try:
+            importlib.import_module("shivu.modules." + name)
+        except Exception as e:
+            self.import_errors[name] = str(e)
+            LOGGER.error(f"❌ Module failed: {name} - {e}")
+            return False
+        finally:
+            self.import_times[name] = time.perf_counter() - start
+        self.loaded.add(name)
+        LOGGER.info(f"✅ Module loaded: {name} ({self.import_times[name] * 1000:.0f} ms)")
+        return True
+
+    def import_all(self, names: List[str], application) -> None:
+        for name in names:
+            commands = LAZY_MODULES.get(name)
+            if commands:
+                self.lazy[name] = commands
+                application.add_handler(LazyModuleHandler(self, name, commands), group=LAZY_HANDLER_GROUP)
+                continue
+            self.import_module(name)
+        self.imports_done_at = time.perf_counter()
+
+    def defer(self, name: str, func: Callable[[], Awaitable]) -> None:
+        """Run `func()` as its own task once the event loop is running."""
+        self.deferred[name] = func
+
+    def on_startup(self, name: str):
+        """Decorator form of `defer` for module-level coroutine functions."""
+        def decorator(func):
+            self.defer(name, func)
+            return func
+        return decorator
+
+    async def _run_deferred(self, name: str, func: Callable[[], Awaitable]) -> None:
+        self.task_times[name] = None
+        start = time.perf_counter()
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.task_errors[name] = str(e)
+            LOGGER.error(f"Startup task {name} failed: {e}\n{traceback.format_exc()}")
+        finally:
+            self.task_times[name] = time.perf_counter() - start
+
+    async def run_deferred(self) -> None:
+        """Run every deferred task concurrently and wait until each has finished its first pass."""
+        tasks = [background_task(self._run_deferred(name, func)) for name, func in self.deferred.items()]
+        await asyncio.gather(*tasks)
+
+    def mark_ready(self) -> None:
+        self.ready_at = time.perf_counter()
+        LOGGER.info(f"Startup: ready in {self.ready_at - self.process_start:.2f}s")
+
+    def report(self, top: int = 15) -> str:
+        lines = ["<b>🚀 Startup Report</b>", ""]
+        if self.imports_done_at:
+            lines.append(f"Imports: <code>{self.imports_done_at - self.process_start:.2f}s</code>")
+        if self.ready_at:
+            lines.append(f"Ready: <code>{self.ready_at - self.process_start:.2f}s</code>")
+        lines.append(f"Lazy (not loaded): <code>{', '.join(sorted(set(self.lazy) - self.loaded)) or '-'}</code>")
+
+        lines += ["", "<b>Slowest imports</b>"]
+        slowest = sorted(self.import_times.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        for name, seconds in slowest:
+            mark = " ❌" if name in self.import_errors else ""
+            lines.append(f"<code>{seconds * 1000:7.1f} ms</code> {name}{mark}")
+
+        if self.deferred:
+            lines += ["", "<b>Deferred tasks</b>"]
+            for name in self.deferred:
+                seconds = self.task_times.get(name)
+                if name not in self.task_times:
+                    state = "pending"
+                elif seconds is None:
+                    state = "running"
+                else:
+                    state = f"{seconds * 1000:.0f} ms"
+                mark = " ❌" if name in self.task_errors else ""
+                lines.append(f"<code>{state:>10}</code> {name}{mark}")
+        return "\n".join(lines)
+
+
+startup = StartupOrchestrator()
+
+
+async def startup_report(update: Update, context: CallbackContext) -> None:
+    user_id = str(update.effective_user.id)
+    if user_id != str(OWNER_ID) and user_id not in sudo_users:
+        await update.message.reply_text("❌ You are not authorized to use this command.")
+        return
+    await update.message.reply_text(startup.report(), parse_mode="HTML")
+
+
+def setup_startup_handlers(application) -> None:
+    application.add_handler(CommandHandler("startup", startup_report, block=False))
+
+
+# Run in a fresh interpreter; prints seconds from first import to all modules imported
+_MEASURE_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from shivu import application
+from shivu.modules import ALL_MODULES
+from shivu.startup import startup
+if sys.argv[1] == "eager":
+    for name in ALL_MODULES:
+        startup.import_module(name)
+else:
+    startup.import_all(ALL_MODULES, application)
+print("imported", time.perf_counter() - start)
+"""
+
+
+def _measure_once(mode: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", _MEASURE_SCRIPT, mode], capture_output=True, text=True, check=True
+    ).stdout
+    # Console logging may share stdout; the timing is the last "imported" line
+    line = [l for l in out.splitlines() if l.startswith("imported ")][-1]
+    return float(line.split()[1])
+
+
+def measure(runs: int = 15) -> Dict[str, List[float]]:
+    """Cold import times of all modules, eager versus orchestrated (lazy modules skipped).
+
+    The modes alternate run by run so that machine noise hits both alike.
+    """
+    results: Dict[str, List[float]] = {"eager": [], "orchestrated": []}
+    for _ in range(runs):
+        for mode, samples in results.items():
+            samples.append(_measure_once(mode))
+    return results
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    results = measure(runs)
+    for mode, samples in results.items():
+        print(f"{mode:>12}: median {statistics.median(samples):.3f}s  min {min(samples):.3f}s  ({runs} runs)")
+    saved = statistics.median(results["eager"]) - statistics.median(results["orchestrated"])
+    print(f"{'saved':>12}: {saved:.3f}s (median)")
+    print("Time to ready, deferred tasks included, is logged at startup and shown by /startup.")
@@ -0,0 +1,120 @@
+"""
+In-memory bot statistics shared by /gstats, /dbstats, /stats and the chatlog.
+
+Collection totals come from `estimated_document_count` (collection metadata,
+no scan) plus deltas reported by insert paths between refreshes. The expensive
+aggregates (collectors, characters owned, active groups) are recomputed on a
+schedule, so no stats command ever touches Mongo itself.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from shivu import (
+    LOGGER,
+    db,
+    collection,
+    user_collection,
+    top_global_groups_collection,
+    group_user_totals_collection,
+    BANNED_USERS,
+    banned_groups_collection,
+    pm_users,
+)
+from shivu.metrics import background_task
+
+TOTALS_REFRESH_INTERVAL = 60
+AGGREGATES_REFRESH_INTERVAL = 600
+
+COUNTED_COLLECTIONS = {
+    "users": user_collection,
+    "characters": collection,
+    "groups": top_global_groups_collection,
+    "banned_users": BANNED_USERS,
+    "banned_groups": banned_groups_collection,
+    "pm_users": pm_users,
+}
+
+
+class StatsService:
+    def __init__(self):
+        self.totals = defaultdict(int)
+        self.aggregates = {"collectors": 0, "owned_characters": 0, "active_groups": 0}
+        self.db_stats = {}
+        self.totals_refreshed_at = None
+        self.aggregates_refreshed_at = None
+        self._task = None
+        self._ready = asyncio.Event()
+
+    def bump(self, name: str, delta: int = 1):
+        """Report an insert/delete so totals stay exact between refreshes."""
+        self.totals[name] += delta
+
+    async def refresh_totals(self):
+        counts = {}
+        for name, coll in COUNTED_COLLECTIONS.items():
+            try:
+                counts[name] = await coll.estimated_document_count()
+            except Exception as e:
+                LOGGER.warning(f"Stats: count of {name} failed: {e}")
+        # Fresh metadata already includes everything bumped so far
+        self.totals.update(counts)
+        self.totals_refreshed_at = datetime.now()
+
+    async def refresh_aggregates(self):
+        try:
+            res = await user_collection.aggregate([
+                {"$match": {"characters": {"$type": "array"}}},
+                {"$group": {"_id": None, "collectors": {"$sum": 1}, "owned": {"$sum": {"$size": "$characters"}}}},
+            ]).to_list(1)
+            active_groups = await group_user_totals_collection.aggregate([
+                {"$group": {"_id": "$group_id"}},
+                {"$count": "n"},
+            ]).to_list(1)
+            self.aggregates = {
+                "collectors": res[0]["collectors"] if res else 0,
+                "owned_characters": res[0]["owned"] if res else 0,
+                "active_groups": active_groups[0]["n"] if active_groups else 0,
+            }
+            self.db_stats = await db.command("dbStats")
+            self.aggregates_refreshed_at = datetime.now()
+        except Exception as e:
+            LOGGER.error(f"Stats: aggregate refresh failed: {e}")
+
+    async def _run(self):
+        last_aggregates = 0.0
+        while True:
+            try:
+                await self.refresh_totals()
+                if time.monotonic() - last_aggregates >= AGGREGATES_REFRESH_INTERVAL:
+                    await self.refresh_aggregates()
+                    last_aggregates = time.monotonic()
+                self._ready.set()
+            except Exception as e:
+                LOGGER.error(f"Stats refresh loop error: {e}")
+            await asyncio.sleep(TOTALS_REFRESH_INTERVAL)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = background_task(self._run())
+
+    async def get(self, timeout: float = 5.0) -> dict:
+        """Current snapshot; only the very first call after startup may wait for data."""
+        self.start()
+        if not self._ready.is_set():
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return {
+            **self.totals,
+            **self.aggregates,
+            "db": self.db_stats,
+            "totals_refreshed_at": self.totals_refreshed_at,
+            "aggregates_refreshed_at": self.aggregates_refreshed_at,
+        }
+
+
+bot_stats = StatsService()